@@ -3,8 +3,13 @@ import os
 import sys
 import warnings
 
-from .rconn import connect
+from .rconn import connect, connectMany
 from .taggedContainers import TaggedList, TaggedArray, AttrArray
+from .rnative import readRds, writeRds
+from .sharedResults import toShared
+from .rserializer import registerSerializer
+from .rparser import registerConverter
+from .microBatcher import MicroBatcher
 
 # Show all deprecated warning only once:
 warnings.filterwarnings('once', category=DeprecationWarning)
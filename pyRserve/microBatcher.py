@@ -0,0 +1,180 @@
+"""
+Coalesce small, independent evaluations issued concurrently by many threads
+into single round trips to Rserve.
+
+Example:
+    batcher = MicroBatcher(pyRserve.connect(), window=0.001, maxItems=100)
+    # in any thread:
+    future = batcher.submit('sum(1:10)')
+    future.result()                  # -> 55
+    ...
+    batcher.close()
+
+Requests arriving within 'window' seconds after the first pending one (or
+until 'maxItems' requests are pending) are evaluated by one R expression.
+Every request is evaluated separately in R's global environment, errors
+only fail the future of the request which caused them.
+"""
+import time
+import threading
+import collections
+
+from .rexceptions import REvalError, PyRserveClosed
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    # Python 2 without the 'futures' backport
+    Future = None
+
+
+class BatchStats(collections.namedtuple(
+        'BatchStats', 'batches requests largestBatch')):
+    """Number of batches evaluated, of requests in them, and the size of the
+    largest batch"""
+    __slots__ = ()
+
+    @property
+    def meanBatchSize(self):
+        return self.requests / float(self.batches or 1)
+
+
+def _rString(aString):
+    """Return 'aString' as R string literal"""
+    return '"%s"' % aString.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class MicroBatcher(object):
+    """
+    Front end to a connection which evaluates string expressions submitted
+    by any number of threads in batches. The connection is exclusively used
+    by a worker thread of the batcher from then on.
+    """
+    # Each request is parsed separately, so syntax errors only affect their
+    # own request. Results are wrapped into a list, errors are returned as
+    # their message:
+    R_REQUEST = 'tryCatch(list(eval(parse(text=%s), envir=globalenv())), ' \
+        'error=function(e) conditionMessage(e))'
+
+    def __init__(self, conn, window=0.001, maxItems=100):
+        if Future is None:
+            raise ImportError('MicroBatcher requires concurrent.futures')
+        self.conn = conn
+        self.window = window
+        self.maxItems = maxItems
+        # requests as (arrival time, expression, future):
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        # exception which stopped the worker thread, if any:
+        self._error = None
+        self._batches = 0
+        self._requests = 0
+        self._largestBatch = 0
+        self._worker = threading.Thread(target=self._run,
+                                        name='pyRserve-MicroBatcher')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, aString):
+        """
+        Queue string expression 'aString' for evaluation, return a
+        concurrent.futures.Future for its result
+        """
+        future = Future()
+        with self._cond:
+            if self._error is not None:
+                raise PyRserveClosed('MicroBatcher has stopped after an '
+                                     'error: %s' % self._error)
+            if self._closed:
+                raise PyRserveClosed('MicroBatcher has been closed')
+            self._pending.append((time.time(), aString, future))
+            self._cond.notify()
+        return future
+
+    def eval(self, aString):
+        """Evaluate 'aString' as part of a batch, wait for its result"""
+        return self.submit(aString).result()
+
+    def close(self):
+        """Evaluate the requests still pending and stop the worker thread.
+        The connection is not closed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def stats(self):
+        with self._cond:
+            return BatchStats(self._batches, self._requests,
+                              self._largestBatch)
+
+    def _nextBatch(self):
+        """Wait for the next batch of requests, None means closed"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][0] + self.window
+            while len(self._pending) < self.maxItems and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.maxItems]
+            del self._pending[:self.maxItems]
+            return batch
+
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = self._nextBatch()
+                if batch is None:
+                    return
+                self._evalBatch([(aString, future)
+                                 for _, aString, future in batch
+                                 if future.set_running_or_notify_cancel()])
+        except Exception as exc:
+            # nobody would answer the requests anymore, so fail them:
+            with self._cond:
+                self._error = exc
+                pending, self._pending = self._pending, []
+            for _, _, future in batch + pending:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(exc)
+
+    def _evalBatch(self, batch):
+        if not batch:
+            return
+        expr = 'list(%s)' % ', '.join(self.R_REQUEST % _rString(aString)
+                                      for aString, _ in batch)
+        try:
+            results = self.conn.eval(expr)
+            # requests may have (re)defined arbitrary names:
+            self.conn.clearSymbolCache()
+            if not isinstance(results, list) or len(results) != len(batch):
+                raise ValueError('Unexpected result of a batch of %d '
+                                 'requests: %r' % (len(batch), results))
+            for (_, future), res in zip(batch, results):
+                if isinstance(res, list):
+                    future.set_result(res[0])
+                else:
+                    future.set_exception(REvalError(res))
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        with self._cond:
+            self._batches += 1
+            self._requests += len(batch)
+            self._largestBatch = max(self._largestBatch, len(batch))
@@ -2,24 +2,114 @@
 """
 Module providing functionality to connect to a running Rserve instance
 """
+import os
+import bz2
+import zlib
 import socket
+import tempfile
 import time
 import pydoc
+import threading
+import warnings
+import functools
+import contextlib
+import collections
+try:
+    import lzma
+except ImportError:
+    # Python 2
+    lzma = None
+
+import numpy
 
 from . import rtypes
-from .rexceptions import RConnectionRefused, REvalError, PyRserveClosed
-from .rserializer import rEval, rAssign, rSerializeResponse, rShutdown
-from .rparser import rparse, OOBMessage
+from .rexceptions import RConnectionRefused, REvalError, PyRserveClosed, \
+    RResponseError, RWarning, RTimeoutError, RProtocolError
+from .rserializer import rEval, rAssign, rSerializeResponse, rShutdown, \
+    rSetBufferSize, rSerEval, rSerAssign, BufferArena, RSerializer
+from .rparser import rparse, rparseIter, rparseRaw, OOBMessage
+from . import rnative
 from .misc import hexString
+from .taggedContainers import TaggedList
 
 RSERVEPORT = 6311
 DEBUG = False
+# default number of items transferred per message by RConnector.fetchChunked()
+CHUNK_ELEMENTS = 2**20
+# default size in bytes of messages sent by RConnector.uploadChunked()
+CHUNK_BYTES = 2**24
+# host names under which Rserve is considered to run on the same machine:
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+# directory for exchanging arrays with a local Rserve, prefer a tmpfs:
+SIDE_CHANNEL_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+# compression methods of R's memCompress() and their python counterparts:
+COMPRESSORS = {'gzip': zlib.compress, 'bzip2': bz2.compress}
+DECOMPRESSORS = {'gzip': zlib.decompress, 'bzip2': bz2.decompress}
+if lzma:
+    COMPRESSORS['xz'] = lzma.compress
+    DECOMPRESSORS['xz'] = lzma.decompress
+# With compress='auto' arrays of at least COMPRESS_MIN_BYTES are compressed
+# if the link to Rserve is slower than COMPRESS_THROUGHPUT (bytes/s, roughly
+# the speed of zlib):
+COMPRESS_MIN_BYTES = 2**20
+COMPRESS_THROUGHPUT = 50 * 2**20
+# seconds to wait for Rserve to accept a connection and send its ID string:
+CONNECT_TIMEOUT = 10
+# length of the ID string sent by Rserve right after accepting a connection:
+ID_STRING_LENGTH = 32
 
 
 def _defaultOOBCallback(data, code=0):  # noqa
     return None
 
 
+class CompressionInfo(collections.namedtuple(
+        'CompressionInfo',
+        'direction method rawBytes compressedBytes seconds')):
+    """
+    Statistics of a compressed transfer: 'direction' is 'upload' or
+    'download', 'seconds' is the time spent on (de)compression in python.
+    """
+    __slots__ = ()
+
+    @property
+    def ratio(self):
+        return self.rawBytes / float(self.compressedBytes or 1)
+
+
+class ServerInfo(collections.namedtuple(
+        'ServerInfo', 'version protocol attributes')):
+    """
+    Contents of the ID string sent by Rserve when a connection is opened:
+    the version of the protocol (e.g. 103), its name ('QAP1') and further
+    4-byte attributes, e.g. 'ARpt' or 'ARuc' if authentication by plain or
+    crypted password is required, or 'TLS' if TLS is supported.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def fromIdString(cls, idString):
+        if len(idString) != ID_STRING_LENGTH or \
+                not idString.startswith(b'Rsrv'):
+            raise ValueError('invalid ID string %r' % idString)
+        fields = [idString[i:i + 4].decode('latin-1').strip()
+                  for i in range(4, ID_STRING_LENGTH, 4)]
+        version, protocol = fields[:2]
+        # unused fields are filled with '----' or line breaks:
+        attributes = tuple(f for f in fields[2:] if f.strip('-'))
+        return cls(int(version), protocol, attributes)
+
+    @property
+    def authMethods(self):
+        """Password methods accepted by Rserve, empty if no authentication
+        is required ('pt': plain text, 'uc': unix crypt)"""
+        return tuple(a[2:] for a in self.attributes if a.startswith('AR'))
+
+    @property
+    def tls(self):
+        return 'TLS' in self.attributes
+
+
 class OOBCallback(object):
     """Sets up conn with a new callback when entering the `with` block and
     restores the old one when exiting
@@ -38,7 +128,7 @@ class OOBCallback(object):
 
 
 def connect(host='', port=RSERVEPORT, unix_socket=None, atomicArray=False, defaultVoid=False,
-            oobCallback=_defaultOOBCallback):
+            oobCallback=_defaultOOBCallback, bufferSize=None, timeout=None):
     """Open a connection to an Rserve instance
     Params:
     - host: provide hostname where Rserve runs, or leave as empty string to
@@ -61,6 +151,17 @@ def connect(host='', port=RSERVEPORT, unix_socket=None, atomicArray=False, defau
             parameters. If self.oobMessage was used, the result value of the
             callback is sent back to R.
             Default: lambda data, code=0: None (oobMessage will return NULL)
+    - bufferSize:
+            Size of Rserve's send buffer (in bytes) to be requested right
+            after connecting. Larger buffers allow for transferring bigger
+            result objects. If a result is too big for the current buffer it
+            is enlarged automatically and the evaluation is repeated once.
+            Default: None (keep the server's default)
+    - timeout:
+            Seconds to wait for Rserve when connecting, sending or receiving
+            data. When exceeded RTimeoutError is raised and the connection is
+            closed. Can be overridden per call of eval().
+            Default: None (wait forever, connecting waits CONNECT_TIMEOUT)
     """
     if host in (None, ''):
         # On Win32 it seems that passing an empty string as 'localhost' does
@@ -68,7 +169,36 @@ def connect(host='', port=RSERVEPORT, unix_socket=None, atomicArray=False, defau
         # or '' were passed.
         host = 'localhost'
     assert port is not None, 'port number must be given'
-    return RConnector(host, port, unix_socket, atomicArray, defaultVoid, oobCallback)
+    return RConnector(host, port, unix_socket, atomicArray, defaultVoid, oobCallback,
+                      bufferSize, timeout)
+
+
+def connectMany(n, *args, **kw):
+    """
+    Open 'n' connections to Rserve in parallel (e.g. to warm up a pool of
+    connections), all arguments are passed to connect(). If any connection
+    fails all others are closed again and the error is raised.
+    """
+    conns = [None] * n
+    errors = []
+
+    def openOne(i):
+        try:
+            conns[i] = connect(*args, **kw)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=openOne, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        for conn in conns:
+            if conn is not None:
+                conn.close()
+        raise errors[0]
+    return conns
 
 
 def checkIfClosed(func):
@@ -76,7 +206,35 @@ def checkIfClosed(func):
         if self.isClosed:
             raise PyRserveClosed('Connection to Rserve already closed')
         try:
+            if self._pendingItems is not None:
+                # Data of a response streamed by evalIter() may still be
+                # waiting in the socket, consume it before continuing:
+                pendingItems, self._pendingItems = self._pendingItems, None
+                if pendingItems.timedOut:
+                    # the rest of the response may still arrive, so the
+                    # connection cannot be used anymore (see below):
+                    self.close()
+                    raise PyRserveClosed('Connection to Rserve closed after '
+                                         'a timeout in evalIter()')
+                pendingItems.close()
             return func(self, *args, **kw)
+        except RTimeoutError:
+            # the rest of the response may still arrive, so the connection
+            # cannot be used anymore:
+            if not self.isClosed:
+                self.close()
+            raise
+        except RProtocolError:
+            # the connection is out of sync with Rserve:
+            if not self.isClosed:
+                self.close()
+            raise
+        except socket.timeout:
+            # raised while sending
+            if not self.isClosed:
+                self.close()
+            raise RTimeoutError('Rserve did not accept data within %s '
+                                'seconds' % self.timeout)
         except socket.error as msg:
             if msg.strerror in ['Connection reset by peer', 'Broken pipe']:
                 # seems like the connection to Rserve has died, so mark
@@ -91,8 +249,13 @@ def checkIfClosed(func):
 class RConnector(object):
     """Provide a network connector to an Rserve process"""
     def __init__(self, host, port, unix_socket, atomicArray, defaultVoid,
-                 oobCallback=_defaultOOBCallback):
+                 oobCallback=_defaultOOBCallback, bufferSize=None,
+                 timeout=None):
         self.sock = None
+        # Seconds to wait for Rserve, see the timeout property:
+        self._timeout = timeout
+        # item iterator of the last call to evalIter():
+        self._pendingItems = None
         self.__closed = True
         self.host = host
         self.port = port
@@ -100,6 +263,48 @@ class RConnector(object):
         self.atomicArray = atomicArray
         self.defaultVoid = defaultVoid
         self.oobCallback = oobCallback
+        self.requestedBufferSize = bufferSize
+        # ServerInfo obtained when connecting:
+        self.serverInfo = None
+        # Effective size of Rserve's send buffer, None means server default:
+        self.bufferSize = None
+        # Number of items from which on getRexp() transfers vectors, matrices
+        # and data.frames in chunks, None disables chunked transfers:
+        self.chunkThreshold = None
+        # Responses larger than this number of bytes are spilled into a
+        # temporary file (in directory spillDir, e.g. '/dev/shm'), numeric
+        # arrays are then memory-mapped from there. None disables spilling:
+        self.spillThreshold = None
+        self.spillDir = None
+        # Numeric arrays larger than this number of bytes are exchanged via
+        # files in sideChannelDir if Rserve runs on the same host (see
+        # isLocal). None disables this side channel:
+        self.sideChannelThreshold = None
+        self.sideChannelDir = SIDE_CHANNEL_DIR
+        # Default compression for getRexp() and setRexp(), one of None,
+        # 'gzip', 'bzip2', 'xz' or 'auto':
+        self.compress = None
+        # Measured throughput (bytes/s) of the link to Rserve, used by
+        # compress='auto', and statistics of the last compressed transfer:
+        self.linkThroughput = None
+        self.compressionInfo = None
+        # Send lists of bools, numbers or strings (with None for NA) to R as
+        # typed vectors instead of generic lists (see RSerializer):
+        self.vectorizeLists = False
+        # buffers for assembling messages, one per thread using this
+        # connection (see _arena):
+        self._arenas = threading.local()
+        # Whether names looked up via conn.r and conn.ref refer to functions
+        # (True) or variables (False), see isFunction(). Set cacheSymbols to
+        # True to look up each name only once:
+        self.cacheSymbols = False
+        self._symbols = {}
+        # Let R catch errors of evaluated expressions and send their details
+        # along with the response (instead of asking for geterrmessage() in
+        # a second round trip). With captureWarnings R's warnings are issued
+        # as Python warnings (RWarning) as well:
+        self.captureErrors = False
+        self.captureWarnings = False
         self.r = RNameSpace(self)
         self.ref = RNameSpaceReference(self)
         self.connect()
@@ -117,31 +322,105 @@ class RConnector(object):
     def isClosed(self):
         return self.__closed
 
+    @property
+    def timeout(self):
+        """Seconds to wait for Rserve when sending or receiving data, None
+        means no limit"""
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+        if not self.isClosed:
+            self.sock.settimeout(timeout)
+
+    @contextlib.contextmanager
+    def _callTimeout(self, timeout):
+        """Apply 'timeout' (if not None) to the socket for one call"""
+        if timeout is None:
+            yield
+            return
+        self.sock.settimeout(timeout)
+        try:
+            yield
+        finally:
+            if not self.isClosed:
+                self.sock.settimeout(self._timeout)
+
+    @property
+    def isLocal(self):
+        """True if Rserve is reached via a unix socket or the loopback
+        interface, i.e. it presumably shares the file system with us"""
+        return bool(self.unix_socket) or \
+            self.host in LOCAL_HOSTS
+
+    @property
+    def _arena(self):
+        """The BufferArena of the calling thread"""
+        try:
+            return self._arenas.arena
+        except AttributeError:
+            arena = self._arenas.arena = BufferArena()
+            return arena
+
+    @property
+    def stats(self):
+        """
+        Statistics of this connection: the buffer arena of the calling
+        thread (ArenaStats), and the measured throughput and last compressed
+        transfer (see compress)
+        """
+        return {'bufferArena': self._arena.stats(),
+                'linkThroughput': self.linkThroughput,
+                'compressionInfo': self.compressionInfo}
+
     def connect(self):
         if self.unix_socket:
             self.sock = socket.socket(socket.AF_UNIX)
-            try:
-                self.sock.connect(self.unix_socket)
-            except socket.error:
-                raise RConnectionRefused('Connection denied, server not reachable '
-                                         'or not accepting connections')            
+            address = self.unix_socket
         else:
             self.sock = socket.socket()
-            try:
-                self.sock.connect((self.host, self.port))
-            except socket.error:
-                raise RConnectionRefused('Connection denied, server not reachable '
-                                         'or not accepting connections')
-        time.sleep(0.2)
-        hdr = self.sock.recv(1024)
-        self.__closed = False
+            address = (self.host, self.port)
+        self.sock.settimeout(self._timeout or CONNECT_TIMEOUT)
+        try:
+            self.sock.connect(address)
+            hdr = self._recvExactly(ID_STRING_LENGTH)
+        except socket.error:
+            self.sock.close()
+            raise RConnectionRefused('Connection denied, server not reachable '
+                                     'or not accepting connections')
+        self.sock.settimeout(self._timeout)
         if DEBUG:
             print('received hdr %s from rserve' % hdr)
         # make sure we are really connected with rserv
-        assert hdr.startswith(b'Rsrv01'), \
-            'Protocol error with Rserv, obtained invalid header string'
-        # TODO: possibly also do version checking here to make sure we
-        #       understand the protocol...
+        try:
+            self.serverInfo = ServerInfo.fromIdString(hdr)
+        except ValueError:
+            self.sock.close()
+            raise RConnectionRefused('Protocol error with Rserv, obtained '
+                                     'invalid ID string %r' % hdr)
+        if self.serverInfo.protocol != 'QAP1':
+            self.sock.close()
+            raise RConnectionRefused('Unsupported Rserve protocol %s' %
+                                     self.serverInfo.protocol)
+        self.__closed = False
+        # A fresh Rserve session starts with its default buffer again:
+        self.bufferSize = None
+        self._symbols.clear()
+        if self.requestedBufferSize:
+            self.setBufferSize(self.requestedBufferSize)
+
+    def _recvExactly(self, nbytes):
+        """Receive exactly 'nbytes' bytes from the socket"""
+        buf = bytearray(nbytes)
+        view = memoryview(buf)
+        pos = 0
+        while pos < nbytes:
+            n = self.sock.recv_into(view[pos:])
+            if not n:
+                raise socket.error('connection closed by Rserve')
+            pos += n
+        return bytes(buf)
 
     @checkIfClosed
     def close(self):
@@ -154,21 +433,204 @@ class RConnector(object):
         rShutdown(fp=self.sock)
         self.close()
 
+    @checkIfClosed
+    def setBufferSize(self, size):
+        """
+        Request a send buffer of 'size' bytes from Rserve. Rserve cannot
+        send result objects larger than its send buffer.
+        Returns the effective buffer size.
+        """
+        if not 0 < size <= rtypes.MAX_INT32:
+            raise ValueError('Buffer size must be within 1 and %d bytes' %
+                             rtypes.MAX_INT32)
+        rSetBufferSize(size, fp=self.sock, arena=self._arena)
+        rparse(self.sock, atomicArray=self.atomicArray)
+        # Rserve silently increases buffer sizes below its minimum:
+        self.bufferSize = max(size, rtypes.MIN_SEND_BUFFER_SIZE)
+        return self.bufferSize
+
+    def _enlargeBufferSize(self, objectSize=None):
+        """
+        Grow Rserve's send buffer after a result was rejected with
+        ERR_object_too_big. 'objectSize' is the size reported by Rserve
+        for the rejected object (if any). Returns False if the buffer
+        cannot grow any further.
+        """
+        currentSize = self.bufferSize or rtypes.DEFAULT_SEND_BUFFER_SIZE
+        newSize = 2 * currentSize
+        if objectSize:
+            # leave room for message and data headers:
+            newSize = max(newSize, objectSize + rtypes.RHEADER_SIZE +
+                          rtypes.LARGE_DATA_HEADER_SIZE)
+        if currentSize >= rtypes.MAX_INT32:
+            return False
+        self.setBufferSize(min(newSize, rtypes.MAX_INT32))
+        return True
+
     def _reval(self, aString, void):
-        rEval(aString, fp=self.sock, void=void)
+        rEval(aString, fp=self.sock, void=void, arena=self._arena)
 
     def _rrespond(self, aObj):
-        rSerializeResponse(aObj, fp=self.sock)
+        rSerializeResponse(aObj, fp=self.sock, arena=self._arena)
 
     @checkIfClosed
-    def eval(self, aString, atomicArray=None, void=False):
+    def eval(self, aString, atomicArray=None, void=False, compress=None,
+             timeout=None):
         """
         Evaluate a string expression through Rserve and return the result
-        transformed into python objects
+        transformed into python objects.
+        If 'compress' is given ('gzip', 'bzip2', 'xz' or 'auto') numeric
+        vectors and arrays are compressed by R before being sent.
+        'timeout' overrides self.timeout for this call.
         """
+        with self._callTimeout(timeout):
+            return self._eval(aString, atomicArray, void, compress)
+
+    def _eval(self, aString, atomicArray, void, compress):
         if not type(aString in rtypes.STRING_TYPES):
             raise TypeError('Only string evaluation is allowed')
+        method, minBytes = self._compressionMethod(compress)
+        if method and not void:
+            return self._evalCompressed(aString, atomicArray, method,
+                                        minBytes)
+        capture = self.captureErrors or self.captureWarnings
+        if capture:
+            aString = self._captureConditions(aString, void)
+            # conditions have to be sent back even if the result is not:
+            void = False
         self._reval(aString, void)
+        try:
+            res = self._receiveResult(atomicArray)
+        except RResponseError as exc:
+            if exc.errCode != rtypes.ERR_object_too_big or \
+                    not self._enlargeBufferSize(exc.param):
+                raise
+            # The evaluation itself was successful, but the result did not
+            # fit into Rserve's send buffer. It has been enlarged now, so
+            # evaluate the expression once more:
+            self._reval(aString, void)
+            res = self._receiveResult(atomicArray)
+        return self._raiseConditions(res) if capture else res
+
+    # R expressions for capturing conditions. Errors are returned as list of
+    # a marker, the condition's classes, message and call. Warnings, if
+    # any, are returned as list of a marker, the result and their messages:
+    CONDITION_MARK = 'pyRserve.condition'
+    WARNINGS_MARK = 'pyRserve.warnings'
+    R_CATCH_ERROR = 'tryCatch(%s, error=function(e) list("%s", class(e), ' \
+        'conditionMessage(e), paste(deparse(conditionCall(e)), ' \
+        'collapse="\\n")))'
+    R_CATCH_WARNINGS = 'local({w <- character(0); ' \
+        'v <- withCallingHandlers(%s, warning=function(c) {' \
+        'w <<- c(w, conditionMessage(c)); invokeRestart("muffleWarning")}); ' \
+        'if (length(w)) list("%s", v, w) else v})'
+
+    def _captureConditions(self, aString, void):
+        """Wrap 'aString' into R code returning conditions it raises"""
+        expr = '{%s\n}' % aString
+        if void:
+            expr = '{%s; NULL}' % expr
+        if self.captureWarnings:
+            # the handlers are defined in a local environment, but the
+            # expression itself has to be evaluated in the global one:
+            expr = 'evalq(%s, globalenv())' % expr
+        expr = self.R_CATCH_ERROR % (expr, self.CONDITION_MARK)
+        if self.captureWarnings:
+            expr = self.R_CATCH_WARNINGS % (expr, self.WARNINGS_MARK)
+        return expr
+
+    @staticmethod
+    def _isMarked(res, mark, length):
+        return isinstance(res, list) and len(res) == length and \
+            numpy.ravel(res[0])[:1].tolist() == [mark]
+
+    def _raiseConditions(self, res):
+        """Issue warnings and raise errors captured by _captureConditions()"""
+        if self._isMarked(res, self.WARNINGS_MARK, 3):
+            for msg in numpy.ravel(res[2]):
+                warnings.warn(msg, RWarning, stacklevel=4)
+            res = res[1]
+        if self._isMarked(res, self.CONDITION_MARK, 4):
+            raise REvalError(numpy.ravel(res[2])[0],
+                             conditionClass=list(numpy.ravel(res[1])),
+                             call=numpy.ravel(res[3])[0])
+        return res
+
+    @checkIfClosed
+    def evalIter(self, aString, atomicArray=None):
+        """
+        Evaluate a string expression through Rserve. If the result is a list
+        or vector an iterator is returned, yielding its items as (tag, value)
+        tuples as soon as each one has been decoded from the socket, so the
+        result never needs to be held in memory entirely. Items without tag
+        have None as tag.
+        The iterator should be consumed before the connection is used again,
+        otherwise all remaining items are read and discarded at that point.
+        """
+        self._reval(aString, False)
+        self._pendingItems = self._receiveResult(atomicArray,
+                                                 incremental=True)
+        return self._pendingItems
+
+    @checkIfClosed
+    def evalInto(self, aString, out):
+        """
+        Evaluate a string expression through Rserve and decode the resulting
+        numeric array directly into the memory of the numpy array 'out',
+        avoiding a new allocation for every call. 'out' can also be a dict
+        of numpy arrays for decoding the equally named items of a list
+        result. Dtype and size of the arrays must match the result,
+        multi-dimensional arrays must be in Fortran order.
+        Returns the result, its arrays share their memory with 'out'.
+        """
+        self._reval(aString, False)
+        return self._receiveResult(True, out=out)
+
+    @checkIfClosed
+    def serEval(self, aString):
+        """
+        Evaluate a string expression through Rserve, the result is
+        transferred in R's own serialization format. In contrast to eval()
+        all attributes, environments, functions etc. are retained, see
+        module rnative for how they are represented in python.
+        """
+        call = rnative.RObject('language', [
+            rnative.RSymbol('eval'),
+            rnative.RObject('language', [rnative.RSymbol('parse'), aString],
+                            tags=[None, 'text'])])
+        rSerEval(rnative.serialize(call), fp=self.sock, arena=self._arena)
+        return rnative.unserialize(self._receiveResult(False, raw=True))
+
+    @checkIfClosed
+    def serAssign(self, name, o):
+        """
+        Bind python object 'o' to variable 'name' in R, transferring it in
+        R's serialization format (see rnative.serialize() for supported
+        objects)
+        """
+        self._symbols.pop(name, None)
+        rSerAssign(rnative.serialize([name, o]), fp=self.sock,
+                   arena=self._arena)
+        self._receiveResult(False, raw=True)
+
+    def _receiveResult(self, atomicArray, incremental=False, out=None,
+                       raw=False, errorMessage=True):
+        """
+        Receive and parse the response to a previously sent command,
+        processing any OOB messages sent by R in the meantime.
+        If 'incremental' is True an iterator over the items of the result
+        is returned (see RParser.iterParse()), if 'raw' is True the
+        undecoded message body. 'out' is passed on to the parser (see
+        RParser.__init__()). If 'errorMessage' is False evaluation errors
+        are raised without querying R for their message, e.g. because
+        further responses are still pending.
+        """
+        if raw:
+            parse = rparseRaw
+        elif incremental:
+            parse = rparseIter
+        else:
+            parse = functools.partial(rparse, out=out)
         if DEBUG:
             # Read entire data into memory en bloque, it's easier to debug
             src = self._receive()
@@ -181,7 +643,8 @@ class RConnector(object):
             atomicArray = self.atomicArray
 
         try:
-            message = rparse(src, atomicArray=atomicArray)
+            message = parse(src, atomicArray, self.spillThreshold,
+                            self.spillDir)
             # Before the result is returned, 0-∞ OOB messages may be sent
             while isinstance(message, OOBMessage):
                 if DEBUG:
@@ -194,23 +657,33 @@ class RConnector(object):
                     # This is no stream, so we have to cut off data
                     src = src[len(message):]
 
-                message = rparse(src, atomicArray=atomicArray)
+                message = parse(src, atomicArray, self.spillThreshold,
+                                self.spillDir)
             return message
         except REvalError:
-            # R has reported an evaluation error, so let's obtain a descriptive
-            # explanation about why the error has occurred. R allows to
-            # retrieve the error message of the last exception via a built-in
-            # function called 'geterrmessage()'.
-            errorMsg = self.eval('geterrmessage()').strip()
-            raise REvalError(errorMsg)
+            if not errorMessage:
+                raise
+            raise self._lastEvalError()
+
+    def _lastEvalError(self):
+        """
+        R has reported an evaluation error, so let's obtain a descriptive
+        explanation about why the error has occurred. R allows to retrieve
+        the error message of the last exception via a built-in function
+        called 'geterrmessage()'.
+        """
+        errorMsg = self.eval('geterrmessage()').strip()
+        return REvalError(errorMsg)
 
     @checkIfClosed
-    def voidEval(self, aString):
+    def voidEval(self, aString, timeout=None):
         """
         Evaluate a string expression through Rserve without returning
-        any result data
+        any result data. As the expression may (re)define any symbol the
+        symbol cache is cleared (see isFunction()).
         """
-        self.eval(aString, void=True)
+        self._symbols.clear()
+        self.eval(aString, void=True, timeout=timeout)
 
     @checkIfClosed
     def _receive(self):
@@ -228,20 +701,435 @@ class RConnector(object):
 #        return self.receive()
 
     @checkIfClosed
-    def setRexp(self, name, o):
+    def setRexp(self, name, o, compress=None):
         """
         Convert a python object into an RExp and bind it to a variable
-        called "name" in the R namespace
+        called "name" in the R namespace.
+        Numeric arrays are compressed according to 'compress' (see eval()),
+        which defaults to self.compress.
         """
-        rAssign(name, o, self.sock)
+        self._symbols.pop(name, None)
+        isPlainArray = type(o) in (numpy.ndarray, numpy.memmap) and \
+            o.dtype.type in rtypes.readBinMap
+        if isPlainArray and self._useSideChannel(o.nbytes) and \
+                self._setRexpViaFile(name, o):
+            return
+        method, minBytes = self._compressionMethod(
+            self.compress if compress is None else compress)
+        if isPlainArray and method and o.nbytes >= minBytes:
+            self._setRexpCompressed(name, o, method)
+            return
+        start = time.time()
+        rAssign(name, o, self.sock, vectorize=self.vectorizeLists,
+                arena=self._arena)
         # Rserv sends an emtpy confirmation message, or error message in case
         # of an error. rparse() will raise an Exception in the latter case.
         rparse(self.sock, atomicArray=self.atomicArray)
+        if isinstance(o, numpy.ndarray):
+            self._measureThroughput(o.nbytes, time.time() - start)
+
+    # R expressions for compressed transfers. Results which are not plain
+    # numeric vectors or arrays (or smaller than minBytes) are sent as usual,
+    # others as list of a marker, their type, dimensions and compressed data:
+    COMPRESSED_MARK = 'pyRserve.compressed'
+    R_COMPRESSED_EVAL = '(function(x) if (typeof(x) %%in%% ' \
+        'c("double", "integer", "complex") && ' \
+        'all(names(attributes(x)) == "dim") && length(x) * ' \
+        'c(double=8, integer=4, complex=16)[[typeof(x)]] >= %d) ' \
+        'list("%s", typeof(x), as.numeric(dim(x)), memCompress(' \
+        'writeBin(as.vector(x), raw(), endian="little"), "%s")) ' \
+        'else x)({%s\n})'
+    COMPRESSED_VAR = 'compressed_upload_'
+    R_DECOMPRESS = '%s <- local({x <- readBin(memDecompress(%s, "%s"), ' \
+        '"%s", %d, size=%d, endian="little"); dim(x) <- %s; x}); rm(%s)'
+
+    def _compressionMethod(self, compress):
+        """
+        Resolve the 'compress' parameter of eval(), getRexp() and setRexp()
+        into a compression method (or None) and the minimal number of bytes
+        of compressed data.
+        """
+        if compress == 'auto':
+            if self.linkThroughput is None:
+                # nothing measured yet, assume remote links to be slow
+                slowLink = not self.isLocal
+            else:
+                slowLink = self.linkThroughput < COMPRESS_THROUGHPUT
+            return ('gzip' if slowLink else None), COMPRESS_MIN_BYTES
+        if compress and compress not in COMPRESSORS:
+            raise ValueError('Unknown compression method %r, use one of %s '
+                             'or "auto"' % (compress,
+                                            ', '.join(sorted(COMPRESSORS))))
+        return compress or None, 0
+
+    def _measureThroughput(self, nbytes, seconds):
+        # small messages only tell about latency, not throughput
+        if nbytes < COMPRESS_MIN_BYTES or seconds <= 0:
+            return
+        throughput = nbytes / seconds
+        if self.linkThroughput is None:
+            self.linkThroughput = throughput
+        else:
+            # smooth out fluctuations:
+            self.linkThroughput = (self.linkThroughput + throughput) / 2
+
+    def _evalCompressed(self, aString, atomicArray, method, minBytes):
+        start = time.time()
+        res = self.eval(self.R_COMPRESSED_EVAL %
+                        (minBytes, self.COMPRESSED_MARK, method, aString),
+                        atomicArray=atomicArray)
+        if not (isinstance(res, list) and len(res) == 4 and
+                isinstance(res[3], bytes) and
+                numpy.ravel(res[0])[0] == self.COMPRESSED_MARK):
+            return res
+        transferTime = time.time() - start
+        # a single dimension is returned as atom:
+        rType, dims, packed = numpy.ravel(res[1])[0], \
+            numpy.atleast_1d(res[2]), res[3]
+        start = time.time()
+        dtype = numpy.dtype(rtypes.typeofMap[rType]).newbyteorder('<')
+        data = numpy.frombuffer(DECOMPRESSORS[method](packed), dtype=dtype)
+        data = data.astype(dtype.newbyteorder('='), copy=False)
+        self.compressionInfo = CompressionInfo(
+            'download', method, data.nbytes, len(packed), time.time() - start)
+        self._measureThroughput(len(packed), transferTime)
+        if len(dims) > 1:
+            data = data.reshape(tuple(int(d) for d in dims), order='F')
+        return data
+
+    def _setRexpCompressed(self, name, o, method):
+        """Upload plain numeric array 'o' compressed with 'method'"""
+        data = numpy.ravel(o, order='F')
+        data = data.astype(data.dtype.newbyteorder('<'), copy=False)
+        start = time.time()
+        packed = COMPRESSORS[method](data)
+        self.compressionInfo = CompressionInfo(
+            'upload', method, o.nbytes, len(packed), time.time() - start)
+        start = time.time()
+        self.setRexp(self.COMPRESSED_VAR, packed, compress=False)
+        self._measureThroughput(len(packed), time.time() - start)
+        dims = 'c(%s)' % ', '.join(str(d) for d in o.shape) \
+            if o.ndim > 1 else 'NULL'
+        self.voidEval(self.R_DECOMPRESS %
+                      (name, self.COMPRESSED_VAR, method,
+                       rtypes.readBinMap[o.dtype.type], o.size, o.itemsize,
+                       dims, self.COMPRESSED_VAR))
+
+    # name of the temporary R variable receiving chunks in uploadChunked():
+    UPLOAD_CHUNK_VAR = 'upload_chunk_'
 
     @checkIfClosed
-    def getRexp(self, name):
-        """Retrieve a Rexp stored in a variable called 'name'"""
-        return self.eval(name)
+    def uploadChunked(self, name, data, chunkBytes=CHUNK_BYTES, progress=None,
+                      offset=0, length=None):
+        """
+        Upload a (large) numpy array, numpy.memmap or an iterator of 1-d
+        chunks into a variable called 'name' in R, in messages of roughly
+        'chunkBytes' bytes. The vector is preallocated in R and filled slice
+        by slice, so neither Rserve's input buffer limit is hit nor a
+        serialized copy of the entire array is created on the client side.
+        - progress: optional callback, called after every chunk with the
+                number of items transferred so far and the total number
+                of items
+        - offset: number of items already transferred by a previous,
+                interrupted call. The upload is resumed from there, the R
+                variable is not preallocated again. When uploading an
+                iterator it must start yielding data at that offset.
+        - length: total number of items, required for iterators. A
+                ValueError is raised if an iterator yields more or fewer
+                items.
+        Numeric types R doesn't have (e.g. float32 or uint16) are converted
+        into doubles or integers, unsigned integers of 32 bits or more into
+        doubles. TypeError is raised for unsupported dtypes before anything
+        is uploaded.
+        Returns the total number of items uploaded.
+        """
+        self._symbols.pop(name, None)
+        if isinstance(data, numpy.ndarray):
+            if data.ndim == 0:
+                data = data.reshape(1)
+            shape, length = data.shape, data.size
+            chunks = self._arrayChunks(data, chunkBytes, offset)
+            mode = self._rVectorMode(data.dtype)
+        else:
+            if length is None:
+                raise ValueError('Total length must be given for uploading '
+                                 'an iterator of chunks')
+            shape = (length, )
+            chunks = (numpy.asarray(chunk) for chunk in data)
+            mode = None
+
+        done = offset
+        for chunk in chunks:
+            if not chunk.size:
+                continue
+            if done + chunk.size > length:
+                raise ValueError('Iterator yields more than %d items' %
+                                 length)
+            chunkMode = self._rVectorMode(chunk.dtype)
+            if done == 0:
+                self.voidEval('%s <- vector("%s", %d)' % (
+                    name, mode or chunkMode, length))
+            if chunk.dtype.type not in rtypes.numpyMap:
+                chunk = chunk.astype(rtypes.mode2DtypeMap[chunkMode])
+            self.setRexp(self.UPLOAD_CHUNK_VAR, chunk)
+            self.voidEval('%s[%d:%d] <- %s' % (name, done + 1,
+                                               done + chunk.size,
+                                               self.UPLOAD_CHUNK_VAR))
+            done += chunk.size
+            if progress:
+                progress(done, length)
+        if done == 0:
+            # nothing has been transferred, still create the (empty) vector
+            self.voidEval('%s <- vector("%s", %d)' % (
+                name, mode or 'double', length))
+        else:
+            self.voidEval('rm(%s)' % self.UPLOAD_CHUNK_VAR)
+        if done != length:
+            raise ValueError('Iterator yielded %d items instead of %d' %
+                             (done, length))
+        if len(shape) > 1:
+            self.voidEval('dim(%s) <- c(%s)' %
+                          (name, ', '.join(str(d) for d in shape)))
+        return done
+
+    @staticmethod
+    def _rVectorMode(dtype):
+        if dtype.kind == 'u' and dtype.itemsize >= 4:
+            # exceeds the range of R's integers
+            return 'double'
+        try:
+            return rtypes.kind2ModeMap[dtype.kind]
+        except KeyError:
+            raise TypeError('Chunked upload of dtype "%s" not supported' %
+                            dtype)
+
+    @staticmethod
+    def _arrayChunks(arr, chunkBytes, offset):
+        """
+        Yield consecutive 1-d chunks of the Fortran-ordered (i.e. R-ordered)
+        items of an array, starting at given offset. Slicing is done along
+        the last axis, which is the slowest varying one in Fortran order, so
+        only one chunk at a time is copied into memory.
+        """
+        unitSize = int(numpy.prod(arr.shape[:-1]))
+        if offset % max(unitSize, 1):
+            raise ValueError('Offset must be a multiple of %d for an array '
+                             'of shape %s' % (unitSize, arr.shape))
+        step = max(1, chunkBytes // max(1, unitSize * arr.itemsize))
+        for start in range(offset // max(unitSize, 1), arr.shape[-1], step):
+            yield arr[..., start:start + step].ravel(order='F')
+
+    @checkIfClosed
+    def getRexp(self, name, compress=None):
+        """
+        Retrieve a Rexp stored in a variable called 'name'.
+        Numeric arrays are compressed according to 'compress' (see eval()),
+        which defaults to self.compress.
+        If self.chunkThreshold is set, objects with more items than this
+        threshold are retrieved via fetchChunked().
+        If self.sideChannelThreshold is set, large numeric vectors and
+        arrays of a local Rserve are passed through a file instead.
+        """
+        if compress is None:
+            compress = self.compress
+        if self.sideChannelThreshold is not None and self.isLocal:
+            # objects unsuitable for the side channel are returned right
+            # away, unless other transfer methods may apply:
+            found, data = self._getRexpViaFile(
+                name, returnValue=not (self.chunkThreshold or compress))
+            if found:
+                return data
+        if self.chunkThreshold:
+            info = self._chunkInfo(name)
+            rType, length, dims, isDataFrame = info
+            numItems = numpy.prod(dims) if isDataFrame else length
+            if numItems > self.chunkThreshold and \
+                    (isDataFrame or rType in rtypes.typeofMap):
+                return self._fetchChunked(name, info, CHUNK_ELEMENTS, None)
+        return self.eval(name, compress=compress)
+
+    # R expressions for exchanging arrays through files with a local Rserve.
+    # R_SIDE_CHANNEL_GET writes numeric objects without attributes besides
+    # dim() into a file if they are larger than the threshold, and returns a
+    # list of a marker, their type, length and dimensions. Other objects are
+    # returned as they are (or NULL instead):
+    R_READ_BIN = '%s <- local({con <- file("%s", "rb"); ' \
+                 'on.exit(close(con)); x <- readBin(con, "%s", %d, size=%d); ' \
+                 'dim(x) <- %s; x})'
+    SIDE_CHANNEL_MARK = 'pyRserve.sideChannel'
+    R_SIDE_CHANNEL_GET = 'local({x <- %s; ' \
+        'size <- c(double=8, integer=4, complex=16)[typeof(x)]; ' \
+        'if (!is.na(size) && all(names(attributes(x)) == "dim") && ' \
+        'length(x) * size > %d && !inherits(try(writeBin(as.vector(x), ' \
+        '"%s"), silent=TRUE), "try-error")) list("%s", typeof(x), ' \
+        'as.numeric(length(x)), as.numeric(dim(x))) else %s})'
+
+    def _useSideChannel(self, nbytes):
+        return self.sideChannelThreshold is not None and \
+            nbytes > self.sideChannelThreshold and self.isLocal
+
+    def _sideChannelFile(self):
+        """Create an empty file only readable by us, return its path"""
+        fd, path = tempfile.mkstemp(prefix='pyRserve_',
+                                    dir=self.sideChannelDir)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def _rPath(path):
+        # R understands forward slashes on all platforms
+        return path.replace(os.sep, '/')
+
+    def _setRexpViaFile(self, name, o):
+        """
+        Let R read array 'o' from a file into variable 'name'.
+        Returns False if R could not read the file (e.g. because it does
+        not share our file system after all).
+        """
+        path = self._sideChannelFile()
+        try:
+            with open(path, 'wb') as fp:
+                # C order of the transposed array is Fortran order of 'o'
+                o.T.tofile(fp)
+            dims = 'c(%s)' % ', '.join(str(d) for d in o.shape) \
+                if o.ndim > 1 else 'NULL'
+            try:
+                self.voidEval(self.R_READ_BIN %
+                              (name, self._rPath(path),
+                               rtypes.readBinMap[o.dtype.type], o.size,
+                               o.itemsize, dims))
+            except REvalError:
+                return False
+            return True
+        finally:
+            os.remove(path)
+
+    def _getRexpViaFile(self, name, returnValue):
+        """
+        Let R write the numeric vector or array 'name' into a file and map
+        it into memory, with a single evaluation. Returns a tuple of a flag
+        telling whether the object has been retrieved, and the object.
+        Objects which are not suitable for the side channel are retrieved
+        as usual if 'returnValue' is True.
+        """
+        path = self._sideChannelFile()
+        try:
+            res = self.eval(self.R_SIDE_CHANNEL_GET %
+                            (name, self.sideChannelThreshold,
+                             self._rPath(path), self.SIDE_CHANNEL_MARK,
+                             'x' if returnValue else 'NULL'))
+            if not self._isMarked(res, self.SIDE_CHANNEL_MARK, 4):
+                return returnValue, res
+            dtype = numpy.dtype(rtypes.typeofMap[numpy.ravel(res[1])[0]])
+            length = int(numpy.ravel(res[2])[0])
+            # a single dimension is returned as atom:
+            dims = numpy.atleast_1d(res[3])
+            if os.path.getsize(path) != length * dtype.itemsize:
+                # R wrote into a different file system
+                return False, None
+            if os.name == 'nt':
+                # Windows does not allow removing files which are mapped
+                data = numpy.fromfile(path, dtype=dtype, count=length)
+            else:
+                # The mapping remains valid after the file has been removed:
+                data = numpy.memmap(path, dtype=dtype, mode='c',
+                                    shape=(length,))
+        finally:
+            os.remove(path)
+        if len(dims) > 1:
+            data = data.reshape(tuple(int(d) for d in dims), order='F')
+        return True, data
+
+    # R expression providing type, length, dimensions and data.frame-ness of
+    # an R object, needed for preallocating arrays for chunked transfers:
+    R_CHUNK_INFO = 'local({x <- %s; list(typeof(x), as.numeric(length(x)), ' \
+                   'as.numeric(dim(x)), is.data.frame(x))})'
+
+    def _chunkInfo(self, name):
+        rType, length, dims, isDataFrame = self.eval(self.R_CHUNK_INFO % name,
+                                                     atomicArray=False)
+        # a single dimension is returned as atom:
+        return rType, length, numpy.atleast_1d(dims), isDataFrame
+
+    @checkIfClosed
+    def fetchChunked(self, name, chunkElements=CHUNK_ELEMENTS, progress=None):
+        """
+        Retrieve a (large) vector, matrix or data.frame in chunks of at most
+        'chunkElements' items. Each chunk is a separate message, so Rserve's
+        transfer limits (ERR_object_too_big) are not hit, and only one chunk
+        at a time is held in memory besides the preallocated result array.
+        - name: name of the variable in R (or a cheap R expression, it is
+                evaluated again for every chunk)
+        - progress: optional callback, called after every chunk with the
+                number of items transferred so far and the total number of
+                items
+        Matrices are transferred in blocks of columns. Data.frames are
+        transferred column by column and returned as TaggedList of arrays.
+        Apart from dimensions and column names no attributes are transferred.
+        """
+        return self._fetchChunked(name, self._chunkInfo(name), chunkElements,
+                                  progress)
+
+    def _fetchChunked(self, name, info, chunkElements, progress):
+        rType, length, dims, isDataFrame = info
+        length = int(length)
+        dims = tuple(int(d) for d in dims)
+        if isDataFrame:
+            nrow = dims[0]
+            colNames = self.eval('names(%s)' % name, atomicArray=True)
+            columns = []
+            for idx, colName in enumerate(colNames):
+                colExpr = '%s[[%d]]' % (name, idx + 1)
+                colType = self._chunkInfo(colExpr)[0]
+                column = self._fetchChunks(colExpr, colType, (nrow,),
+                                           chunkElements, progress,
+                                           idx * nrow, nrow * len(colNames))
+                columns.append((colName, column))
+            return TaggedList(columns)
+        elif len(dims) == 2:
+            # matrices are transferred in blocks of columns
+            return self._fetchChunks(name, rType, dims, chunkElements,
+                                     progress, 0, length)
+        else:
+            # vectors and n-dim arrays are transferred as flat vectors
+            data = self._fetchChunks(name, rType, (length,), chunkElements,
+                                     progress, 0, length)
+            return data.reshape(dims, order='F') if dims else data
+
+    def _fetchChunks(self, expr, rType, shape, chunkElements, progress,
+                     done, total):
+        """
+        Transfer an R vector or matrix in consecutive slices into a
+        preallocated array of given shape. 'done' and 'total' are the
+        number of items for reporting progress.
+        """
+        try:
+            dtype = rtypes.typeofMap[rType]
+        except KeyError:
+            raise TypeError('Chunked transfer of R type "%s" not supported' %
+                            rType)
+        out = numpy.empty(shape, dtype=dtype)
+        if len(shape) == 2:
+            # slice blocks of columns:
+            nrow, count = shape
+            step = max(1, chunkElements // max(nrow, 1))
+            sliceExpr = '(%s)[, %%d:%%d, drop=FALSE]' % expr
+        else:
+            nrow, count = 1, shape[0]
+            step = max(1, chunkElements)
+            sliceExpr = '(%s)[%%d:%%d]' % expr
+        for start in range(0, count, step):
+            stop = min(start + step, count)
+            # R indices are 1-based and include the upper bound:
+            chunk = self.eval(sliceExpr % (start + 1, stop), atomicArray=True)
+            if chunk.dtype == object and out.dtype != object:
+                # logical vectors containing NA can only be represented as
+                # object arrays:
+                out = out.astype(object)
+            out[..., start:stop] = chunk
+            if progress:
+                progress(done + stop * nrow, total)
+        return out
 
     @checkIfClosed
     def callFunc(self, name, *args, **kw):
@@ -262,6 +1150,8 @@ class RConnector(object):
             # values!
             assert [x for x in args if not isinstance(x, RBaseProxy)] == (),\
                 'Only references to variables or functions allowed for "rm()"'
+            for arg in args:
+                self._symbols.pop(arg.__name__, None)
 
         argNames = []
         for idx, arg in enumerate(args):
@@ -289,10 +1179,184 @@ class RConnector(object):
         for k, v in aDict.items():
             self.setRexp(k, v)
 
+    @staticmethod
+    def _rName(name):
+        """Quote 'name' with backticks, for use as R variable name"""
+        return '`%s`' % name.replace('\\', '\\\\').replace('`', '\\`')
+
+    @checkIfClosed
+    def getMany(self, names, atomicArray=None):
+        """
+        Retrieve the values of several R variables with one evaluation,
+        return them in a dict by their names.
+        """
+        names = list(names)
+        if not names:
+            return {}
+        quoted = [self._rName(name) for name in names]
+        expr = 'list(%s)' % ', '.join('%s=%s' % (q, q) for q in quoted)
+        res = self.eval(expr, atomicArray=atomicArray)
+        return dict(zip(names, res.values))
+
+    # temporary R variable receiving the values of assignMany():
+    ASSIGN_MANY_VAR = 'assign_many_'
+    R_ASSIGN_MANY = 'invisible(list2env(%s, envir=globalenv())); rm(%s)'
+
+    @checkIfClosed
+    def assignMany(self, aDict):
+        """
+        Assign all items of the dictionary to variables in R in one round
+        trip: they are sent as one named list, together with the request to
+        unpack it via list2env(). In contrast to assign() the values are not
+        compressed or passed through a side channel (see setRexp()).
+        """
+        if not aDict:
+            return
+        for name in aDict:
+            self._symbols.pop(name, None)
+        self._assignAndEval(self.ASSIGN_MANY_VAR, dict(aDict),
+                            self.R_ASSIGN_MANY % (self.ASSIGN_MANY_VAR,
+                                                  self.ASSIGN_MANY_VAR),
+                            void=True)
+
+    def _assignAndEval(self, name, o, aString, void=False, atomicArray=None):
+        """
+        Bind 'o' to variable 'name' in R and evaluate 'aString' in one round
+        trip: both messages are sent before reading the responses.
+        """
+        rAssign(name, o, self.sock, vectorize=self.vectorizeLists,
+                arena=self._arena)
+        rEval(aString, fp=self.sock, void=void, arena=self._arena)
+        try:
+            self._receiveResult(self.atomicArray, errorMessage=False)
+        except (REvalError, RResponseError) as exc:
+            # consume the response to the second message, which then fails
+            # as well, before asking R for the message of the original error:
+            try:
+                self._receiveResult(self.atomicArray, errorMessage=False)
+            except (REvalError, RResponseError):
+                pass
+            if isinstance(exc, REvalError):
+                raise self._lastEvalError()
+            raise exc
+        try:
+            return self._receiveResult(atomicArray)
+        except RResponseError as exc:
+            if exc.errCode != rtypes.ERR_object_too_big or \
+                    not self._enlargeBufferSize(exc.param):
+                raise
+        # the result did not fit into Rserve's send buffer, which has been
+        # enlarged now (see eval()). The expression may have removed the
+        # variable already, so it is assigned once more:
+        return self._assignAndEval(name, o, aString, void, atomicArray)
+
+    # temporary R variable receiving the argument sets of callBatch():
+    BATCH_VAR = 'batch_args_'
+    # Results of successful calls are wrapped into a list, errors are
+    # returned as their message. The argument sets are removed afterwards:
+    R_BATCH = 'local({f <- %s; a <- %s; rm(%s, envir=globalenv()); ' \
+        'lapply(a, function(a) tryCatch(list(do.call(f, as.list(a))), ' \
+        'error=function(e) conditionMessage(e)))})'
+
+    @checkIfClosed
+    def callBatch(self, name, argsList, kwargsList=None, chunkBytes=None):
+        """
+        Call function 'name' in R once for every set of positional arguments
+        in 'argsList' (and keyword arguments in 'kwargsList') and return the
+        list of results. All argument sets are sent in one message and the
+        calls are made by lapply() in R, so the whole batch costs a single
+        round trip. Calls which fail don't abort the batch, an REvalError
+        with R's error message is returned for them instead of a result.
+        If 'chunkBytes' is given, the argument sets are split up into
+        several messages of at most this size (unless a single argument set
+        is larger).
+        """
+        argsList = [tuple(args) for args in argsList]
+        if kwargsList is None:
+            kwargsList = [{}] * len(argsList)
+        elif not argsList:
+            argsList = [()] * len(kwargsList)
+        if len(argsList) != len(kwargsList):
+            raise ValueError('argsList and kwargsList differ in length')
+        argSets = [TaggedList.new(list(args) + list(kw.values()),
+                                  [''] * len(args) + list(kw))
+                   if kw else list(args)
+                   for args, kw in zip(argsList, kwargsList)]
+        results = []
+        for chunk in self._chunkBySize(argSets, chunkBytes):
+            res = self._assignAndEval(
+                self.BATCH_VAR, chunk,
+                self.R_BATCH % (name, self.BATCH_VAR, self.BATCH_VAR),
+                atomicArray=False)
+            results.extend(item[0] if isinstance(item, list) else
+                           REvalError(item) for item in res)
+        # the called function may have (re)defined arbitrary names:
+        self._symbols.clear()
+        return results
+
+    def _chunkBySize(self, items, chunkBytes):
+        """Split 'items' into lists with a serialized size <= 'chunkBytes'"""
+        if chunkBytes is None:
+            return [items] if items else []
+        chunks, chunk, size = [], [], 0
+        for item in items:
+            itemSize = RSerializer.serializedSize(item, self.vectorizeLists)
+            if chunk and size + itemSize > chunkBytes:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(item)
+            size += itemSize
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
     @checkIfClosed
     def isFunction(self, name):
-        """Check whether given name references an existing function in R"""
-        return self.eval('is.function(%s)' % name)
+        """
+        Check whether given name references an existing function in R.
+        Answers are cached (if cacheSymbols is set), the cache is updated by
+        setRexp(), voidEval(), callBatch() and MicroBatcher evaluations. After
+        (re)defining symbols via eval() call clearSymbolCache().
+        """
+        if self.cacheSymbols and name in self._symbols:
+            return self._symbols[name]
+        isFunction = self.eval('is.function(%s)' % name)
+        if self.cacheSymbols:
+            self._symbols[name] = isFunction
+        return isFunction
+
+    def clearSymbolCache(self, name=None):
+        """Forget whether 'name' - or all names - refer to functions"""
+        if name is None:
+            self._symbols.clear()
+        else:
+            self._symbols.pop(name, None)
+
+    # names of all objects in an environment, and whether they are functions.
+    # Objects which cannot be evaluated (e.g. failing promises) are NA:
+    R_SYMBOLS = 'local({e <- as.environment("%s"); ' \
+        'n <- ls(e, all.names=TRUE);' \
+        ' list(n, vapply(n, function(x) tryCatch(is.function(get(x, ' \
+        'envir=e)), error=function(err) NA), NA, USE.NAMES=FALSE))})'
+
+    @checkIfClosed
+    def preloadSymbols(self, envir='.GlobalEnv'):
+        """
+        Fill the symbol cache (see isFunction()) with all objects of an R
+        environment in one evaluation. 'envir' is the name of an environment
+        on R's search path, e.g. 'package:stats'. The cache is only used if
+        cacheSymbols is set.
+        Returns the number of symbols cached.
+        """
+        names, isFunction = self.eval(
+            self.R_SYMBOLS % envir, atomicArray=True)
+        count = 0
+        for name, flag in zip(names, isFunction):
+            # NA (not evaluable) is transferred as None
+            if flag in (True, False):
+                self._symbols[name] = bool(flag)
+                count += 1
+        return count
 
 
 class RNameSpace(object):
@@ -366,13 +1430,131 @@ class RBaseProxy(object):
 
 
 class RVarProxy(RBaseProxy):
-    """Proxy for a reference to a variable in R"""
+    """
+    Proxy for a reference to a variable in R.
+    Vectors and arrays referenced by the proxy can be sliced like numpy
+    arrays, only the selected items are transferred from R, e.g.:
+        x = conn.ref.x
+        len(x), x.shape, x.dtype
+        x[5], x[10:20], x[::2], x[x_mask], x[[1, 5, 7]]
+        for block in x.iterChunks(10000): ...
+    """
+    # R expression providing the shape of an R object in numpy terms:
+    R_SHAPE = 'as.numeric(if (is.null(dim(%s))) length(%s) else dim(%s))'
+
     def __repr__(self):
         return '<RVarProxy to variable "%s">' % self.__name__
 
+    def __bool__(self):
+        # A reference is always true, don't query its length in R for that
+        return True
+    __nonzero__ = __bool__
+
     def value(self):
         return self._rconn.getRexp(self.__name__)
 
+    @property
+    def shape(self):
+        name = self.__name__
+        shape = self._rconn.eval(self.R_SHAPE % (name, name, name),
+                                 atomicArray=True)
+        return tuple(int(d) for d in shape)
+
+    @property
+    def dtype(self):
+        rType = self._rconn.eval('typeof(%s)' % self.__name__)
+        return numpy.dtype(rtypes.typeofMap.get(rType, object))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        """
+        Translate a numpy-style index into R subsetting and transfer only
+        the selected items. Valid indices (per dimension) are integers,
+        slices, boolean masks and integer arrays. Index arrays given for
+        several dimensions select the outer product (like numpy.ix_).
+        """
+        return self._getitem(idx, self.shape)
+
+    def iterChunks(self, n):
+        """Yield consecutive blocks of n items (or rows) as numpy arrays"""
+        shape = self.shape
+        for start in range(0, shape[0], n):
+            yield self._getitem(slice(start, start + n), shape)
+
+    def _getitem(self, idx, shape):
+        idxs = idx if isinstance(idx, tuple) else (idx, )
+        if len(idxs) > len(shape):
+            raise IndexError('too many indices for R object of shape %s' %
+                             (shape, ))
+        indexVars = []
+        rIdxs = [self._rIndex(i, size, indexVars)
+                 for i, size in zip(idxs, shape)]
+        # Indices for dimensions not given select everything:
+        rIdxs += [''] * (len(shape) - len(idxs))
+        isScalar = [isinstance(i, (int, numpy.integer)) for i in idxs]
+        name = self.__name__
+        if len(shape) == 1 and isScalar[0]:
+            expr = '%s[[%s]]' % (name, rIdxs[0])
+        elif len(shape) == 1:
+            expr = '%s[%s]' % (name, rIdxs[0])
+        else:
+            expr = '%s[%s, drop=FALSE]' % (name, ', '.join(rIdxs))
+        if indexVars:
+            # remove the index variables again after subsetting:
+            expr = 'local({res <- %s; rm(%s, envir=globalenv()); res})' % \
+                   (expr, ', '.join(indexVars))
+        res = self._rconn.eval(expr, atomicArray=len(shape) > 1 or
+                               not isScalar[0])
+        if len(shape) > 1 and any(isScalar) and \
+                isinstance(res, numpy.ndarray):
+            # like numpy remove dimensions indexed by a single integer:
+            res = res.squeeze(axis=tuple(ax for ax, scalar
+                                         in enumerate(isScalar) if scalar))
+            if res.ndim == 0:
+                res = res[()]
+        return res
+
+    def _rIndex(self, idx, size, indexVars):
+        """
+        Convert a numpy-style index for a dimension of given size into an
+        R index expression. Index arrays are transferred into temporary R
+        variables, whose names are appended to 'indexVars'.
+        """
+        if isinstance(idx, slice):
+            r = range(*idx.indices(size))
+            if not r:
+                return 'integer(0)'
+            elif r.step == 1:
+                return '%d:%d' % (r.start + 1, r[-1] + 1)
+            return 'seq(%d, %d, by=%d)' % (r.start + 1, r[-1] + 1, r.step)
+        elif isinstance(idx, (int, numpy.integer)):
+            if not -size <= idx < size:
+                raise IndexError('index %d is out of bounds for size %d' %
+                                 (idx, size))
+            return '%d' % (idx % size + 1)
+
+        idx = numpy.asarray(idx)
+        if idx.dtype == numpy.bool_:
+            if idx.shape != (size, ):
+                raise IndexError('boolean index of shape %s does not match '
+                                 'size %d' % (idx.shape, size))
+            idx = numpy.flatnonzero(idx)
+        elif idx.dtype.kind in 'iu' and idx.ndim == 1:
+            if idx.size and not (-size <= idx.min() and idx.max() < size):
+                raise IndexError('index out of bounds for size %d' % size)
+            idx = idx % size
+        else:
+            raise IndexError('only integers, slices, boolean masks and '
+                             'integer arrays are valid indices')
+        # R indices are 1-based, use doubles for vectors beyond int32 range
+        dtype = numpy.int32 if size <= rtypes.MAX_INT32 else numpy.double
+        varName = 'index_%d_' % len(indexVars)
+        self._rconn.setRexp(varName, (idx + 1).astype(dtype))
+        indexVars.append(varName)
+        return varName
+
 
 class RFuncProxy(RBaseProxy):
     """Proxy for function calls to Rserve"""
@@ -382,6 +1564,14 @@ class RFuncProxy(RBaseProxy):
     def __call__(self, *args, **kw):
         return self._rconn.callFunc(self.__name__, *args, **kw)
 
+    def batch(self, argsList, kwargsList=None, chunkBytes=None):
+        """
+        Call the function for many argument sets in one round trip, e.g.
+        conn.r.score.batch([(x1, ), (x2, )]), see RConnector.callBatch()
+        """
+        return self._rconn.callBatch(self.__name__, argsList, kwargsList,
+                                     chunkBytes)
+
     # command to send to R in order to get the help for a function in text
     # format:
     R_HELP = "capture.output(tools:::Rd2txt(utils:::.getHelpFile(help(%s))))"
@@ -8,7 +8,21 @@ class PyRserveError(Exception):
 
 
 class REvalError(PyRserveError):
-    """Indicates an error raised by R itself (not by Rserve)"""
+    """Indicates an error raised by R itself (not by Rserve)
+
+    If the error has been captured in R (see RConnector.captureErrors):
+    - conditionClass: classes of the R condition, e.g.
+             ['simpleError', 'error', 'condition']
+    - call: the deparsed call which raised the error, or 'NULL'
+    """
+    def __init__(self, msg, conditionClass=None, call=None):
+        super(REvalError, self).__init__(msg)
+        self.conditionClass = conditionClass
+        self.call = call
+
+
+class RWarning(UserWarning):
+    """A warning issued by R (see RConnector.captureWarnings)"""
     pass
 
 
@@ -17,6 +31,21 @@ class RConnectionRefused(PyRserveError):
 
 
 class RResponseError(PyRserveError):
+    """Indicates an error reported by Rserve itself (i.e. an ERR_* code)
+
+    - errCode: the Rserve error code (see rtypes.ERRORS)
+    - param: optional integer parameter sent along with the error, e.g. the
+             size of the object for ERR_object_too_big
+    """
+    def __init__(self, msg, errCode=None, param=None):
+        super(RResponseError, self).__init__(msg)
+        self.errCode = errCode
+        self.param = param
+
+
+class RProtocolError(PyRserveError, ValueError):
+    """Indicates a message from Rserve which violates the protocol. The
+    connection has been closed as it cannot be resynchronized."""
     pass
 
 
@@ -28,6 +57,17 @@ class PyRserveClosed(PyRserveError):
     pass
 
 
+class RTimeoutError(PyRserveError):
+    """Indicates that Rserve did not respond within the timeout. The
+    connection has been closed as the rest of the response may still arrive.
+
+    - bytesReceived: number of bytes of the response received so far
+    """
+    def __init__(self, msg, bytesReceived=0):
+        super(RTimeoutError, self).__init__(msg)
+        self.bytesReceived = bytesReceived
+
+
 class EndOfDataError(PyRserveError):
     pass
 
@@ -0,0 +1,869 @@
+"""
+Reader and writer for R's native serialization format (versions 2 and 3), as
+produced by serialize() and saveRDS() in R, and used by Rserve's commands
+CMD_serEval and CMD_serAssign.
+
+In contrast to QAP1 this format transfers R objects entirely, including all
+their attributes, environments, functions and language objects.
+
+R vectors are converted into numpy arrays (also if they only have a single
+element), lists into python lists or TaggedLists. Arrays carrying attributes
+besides dim() and names() are returned as AttrArray. Objects without a
+natural python counterpart are represented by RObject, REnvironment and
+RSymbol instances, which are converted back into their original R objects
+by serialize().
+"""
+import io
+import bz2
+import gzip
+import codecs
+import struct
+
+import numpy
+
+from . import rtypes
+from .misc import PY3, FunctionMapper
+from .rparser import S4
+from .taggedContainers import TaggedList, TaggedArray, AttrArray, \
+    asAttrArray, asTaggedArray
+
+try:
+    import lzma
+except ImportError:
+    # Python 2
+    lzma = None
+
+if PY3:
+    long = int
+
+# SEXP types of R objects:
+NILSXP = 0
+SYMSXP = 1
+LISTSXP = 2
+CLOSXP = 3
+ENVSXP = 4
+PROMSXP = 5
+LANGSXP = 6
+SPECIALSXP = 7
+BUILTINSXP = 8
+CHARSXP = 9
+LGLSXP = 10
+INTSXP = 13
+REALSXP = 14
+CPLXSXP = 15
+STRSXP = 16
+DOTSXP = 17
+VECSXP = 19
+EXPRSXP = 20
+BCODESXP = 21
+EXTPTRSXP = 22
+WEAKREFSXP = 23
+RAWSXP = 24
+S4SXP = 25
+
+# pseudo SEXP types only used in serialized data:
+REFSXP = 255
+NILVALUE_SXP = 254
+GLOBALENV_SXP = 253
+UNBOUNDVALUE_SXP = 252
+MISSINGARG_SXP = 251
+BASENAMESPACE_SXP = 250
+NAMESPACESXP = 249
+PACKAGESXP = 248
+PERSISTSXP = 247
+BCREPDEF = 244
+BCREPREF = 243
+EMPTYENV_SXP = 242
+BASEENV_SXP = 241
+ATTRLANGSXP = 240
+ATTRLISTSXP = 239
+ALTREP_SXP = 238
+
+# bits of the flags preceding every serialized item:
+IS_OBJECT_BIT_MASK = 1 << 8
+HAS_ATTR_BIT_MASK = 1 << 9
+HAS_TAG_BIT_MASK = 1 << 10
+
+# encoding bits in the 'levels' of CHARSXPs:
+BYTES_MASK = 1 << 1
+LATIN1_MASK = 1 << 2
+UTF8_MASK = 1 << 3
+ASCII_MASK = 1 << 6
+
+NA_INTEGER = -2**31
+# R version written into serialized data, and the oldest R versions being
+# able to read serialization versions 2 and 3:
+R_VERSION = 0x040200
+MIN_READER_VERSION = {2: 0x020300, 3: 0x030500}
+
+# names of R's pairlist-like types, and their type codes:
+PAIRLIST_TYPES = {LISTSXP: 'pairlist', LANGSXP: 'language', DOTSXP: '...'}
+PAIRLIST_CODES = dict((v, k) for k, v in PAIRLIST_TYPES.items())
+
+
+class RSymbol(str):
+    """R symbol (or name), e.g. the function name in a function call"""
+    def __repr__(self):
+        return 'RSymbol(%s)' % str.__repr__(self)
+
+
+# the empty symbol R uses for arguments without default value:
+MISSING_ARG = RSymbol('')
+
+
+class RObject(object):
+    """
+    Generic representation of R objects without a natural python
+    counterpart. 'rType' is R's typeof() of the object, 'value' depends on it:
+    - 'pairlist', 'language', '...', 'expression': list of items, for
+      pairlists the names of items are given in 'tags'
+    - 'list': list or TaggedList, used for lists with further attributes
+      than names(), like data.frames
+    - 'raw': bytes, used for raw vectors with attributes
+    - 'closure': tuple of (formals, body, environment)
+    - 'promise': tuple of (value, expression, environment)
+    - 'builtin', 'special': name of the function
+    - 'externalptr': tuple of (protected value, tag)
+    'attr' is a dict of the object's attributes.
+    """
+    def __init__(self, rType, value=None, attr=None, tags=None):
+        self.rType = rType
+        self.value = value
+        self.attr = attr or {}
+        self.tags = tags
+
+    def __repr__(self):
+        return '<RObject %s %r>' % (self.rType, self.value)
+
+
+class REnvironment(object):
+    """
+    R environment with its 'bindings' (a dict) and enclosing environment.
+    Special environments (like R_GlobalEnv) and namespaces are not
+    transferred, only referred to by 'name'.
+    """
+    def __init__(self, bindings=None, enclos=None, attr=None, locked=False,
+                 kind='env', name=None):
+        self.bindings = bindings if bindings is not None else {}
+        self.enclos = enclos
+        self.attr = attr or {}
+        self.locked = locked
+        # 'env', 'special', 'namespace', 'package'
+        self.kind = kind
+        self.name = name
+
+    def __repr__(self):
+        if self.kind == 'env':
+            return '<REnvironment %s>' % ', '.join(self.bindings)
+        return '<REnvironment %s %s>' % (self.kind, self.name)
+
+
+GLOBAL_ENV = REnvironment(kind='special', name='R_GlobalEnv')
+BASE_ENV = REnvironment(kind='special', name='R_BaseEnv')
+EMPTY_ENV = REnvironment(kind='special', name='R_EmptyEnv')
+BASE_NAMESPACE = REnvironment(kind='special', name='R_BaseNamespace')
+UNBOUND_VALUE = RObject('unbound')
+
+SPECIAL_VALUES = {
+    NILVALUE_SXP: None,
+    GLOBALENV_SXP: GLOBAL_ENV,
+    BASEENV_SXP: BASE_ENV,
+    EMPTYENV_SXP: EMPTY_ENV,
+    BASENAMESPACE_SXP: BASE_NAMESPACE,
+    UNBOUNDVALUE_SXP: UNBOUND_VALUE,
+    MISSINGARG_SXP: MISSING_ARG,
+}
+SPECIAL_ENV_CODES = {
+    'R_GlobalEnv': GLOBALENV_SXP,
+    'R_BaseEnv': BASEENV_SXP,
+    'R_EmptyEnv': EMPTYENV_SXP,
+    'R_BaseNamespace': BASENAMESPACE_SXP,
+}
+
+
+class _Cell(object):
+    """Cons cell of a language object embedded in byte code"""
+    def __init__(self, rType):
+        self.rType = rType
+        self.attr = None
+        self.tag = None
+        self.car = None
+        self.cdr = None
+
+
+class RUnserializer(object):
+    """Convert R objects in R's serialization format into python objects"""
+    readerMap = {}
+    fmap = FunctionMapper(readerMap)
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        # objects which can be referred to by later REFSXP items:
+        self.refs = []
+        dataFormat = self.read(2)
+        if dataFormat == b'X\n':
+            self.endian = '>'
+        elif dataFormat == b'B\n':
+            self.endian = '<'
+        elif dataFormat == b'A\n':
+            raise NotImplementedError('The ascii serialization format is '
+                                      'not supported')
+        else:
+            raise ValueError('Data is not in R serialization format')
+        self._int = struct.Struct(self.endian + 'i')
+        self.version = self.readInt()
+        self.writerVersion = self.readInt()
+        self.minReaderVersion = self.readInt()
+        self.nativeEncoding = 'utf-8'
+        if self.version == 3:
+            self.nativeEncoding = self.read(self.readInt()).decode('ascii')
+        elif self.version != 2:
+            raise ValueError('Unsupported serialization version %d' %
+                             self.version)
+
+    def read(self, length):
+        if self.pos + length > len(self.data):
+            raise ValueError('Serialized data is truncated')
+        data = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return data
+
+    def readInt(self):
+        return self._int.unpack(self.read(4))[0]
+
+    def readLength(self):
+        length = self.readInt()
+        if length == -1:
+            # long vector, the length is given in two 32 bit words
+            upper, lower = struct.unpack(self.endian + 'II', self.read(8))
+            length = (upper << 32) + lower
+        return length
+
+    def readArray(self, dtype, length):
+        """Read 'length' items into a (native byte order) numpy array"""
+        dtype = numpy.dtype(dtype).newbyteorder(self.endian)
+        raw = self.read(length * dtype.itemsize)
+        return numpy.frombuffer(raw, dtype=dtype).astype(
+            dtype.newbyteorder('='))
+
+    def unserialize(self):
+        return self.readItem()
+
+    def readItem(self):
+        flags = self.readInt()
+        rType = flags & 0xff
+        if rType in SPECIAL_VALUES:
+            return SPECIAL_VALUES[rType]
+        try:
+            reader = self.readerMap[rType]
+        except KeyError:
+            raise NotImplementedError('Unserialization of R objects of type '
+                                      '%d not implemented' % rType)
+        return reader(self, flags)
+
+    def readAttributes(self, flags):
+        """Read the attributes following a vector, returns a dict"""
+        if not flags & HAS_ATTR_BIT_MASK:
+            return {}
+        return self._attrDict(self.readItem())
+
+    @staticmethod
+    def _attrDict(pairlist):
+        if pairlist is None:
+            return {}
+        return dict(zip(pairlist.tags, pairlist.value))
+
+    def _decodeChars(self, levels, raw):
+        if levels & (UTF8_MASK | ASCII_MASK):
+            encoding = 'utf-8'
+        elif levels & (LATIN1_MASK | BYTES_MASK):
+            encoding = 'latin-1'
+        else:
+            encoding = self.nativeEncoding
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+        return raw.decode(encoding, 'replace')
+
+    @fmap(CHARSXP)
+    def r_charsxp(self, flags):
+        length = self.readInt()
+        if length == -1:
+            # NA_character_
+            return None
+        return self._decodeChars(flags >> 12, self.read(length))
+
+    @fmap(SYMSXP)
+    def r_symbol(self, flags):
+        symbol = RSymbol(self.readItem())
+        self.refs.append(symbol)
+        return symbol
+
+    @fmap(REFSXP)
+    def r_ref(self, flags):
+        index = flags >> 8
+        if index == 0:
+            # index is too large to be packed into the flags
+            index = self.readInt()
+        return self.refs[index - 1]
+
+    @fmap(LISTSXP, LANGSXP, DOTSXP)
+    def r_pairlist(self, flags):
+        rType = PAIRLIST_TYPES[flags & 0xff]
+        attr, items, tags = {}, [], []
+        while True:
+            if flags & HAS_ATTR_BIT_MASK:
+                nodeAttr = self._attrDict(self.readItem())
+                # only attributes of the first node belong to the object
+                attr = attr or nodeAttr
+            tags.append(str(self.readItem()) if flags & HAS_TAG_BIT_MASK
+                        else None)
+            items.append(self.readItem())
+            flags = self.readInt()
+            if flags & 0xff == NILVALUE_SXP:
+                break
+            if flags & 0xff != LISTSXP:
+                raise NotImplementedError('Dotted pairlists are not '
+                                          'supported')
+        return RObject(rType, items, attr, tags)
+
+    @fmap(CLOSXP, PROMSXP)
+    def r_closure(self, flags):
+        attr = self._attrDict(self.readItem()) \
+            if flags & HAS_ATTR_BIT_MASK else {}
+        # the environment is stored as tag (missing for evaluated promises):
+        env = self.readItem() if flags & HAS_TAG_BIT_MASK else None
+        car, cdr = self.readItem(), self.readItem()
+        if flags & 0xff == CLOSXP:
+            # formals, body, environment
+            return RObject('closure', (car, cdr, env), attr)
+        # value, expression, environment
+        return RObject('promise', (car, cdr, env), attr)
+
+    @fmap(ENVSXP)
+    def r_environment(self, flags):
+        env = REnvironment(locked=bool(self.readInt()))
+        self.refs.append(env)
+        env.enclos = self.readItem()
+        frame = self.readItem()
+        hashtab = self.readItem()
+        env.attr = self._attrDict(self.readItem())
+        chains = [frame] + (list(hashtab.value if isinstance(hashtab, RObject)
+                                 else hashtab) if hashtab else [])
+        for chain in chains:
+            if chain is not None:
+                env.bindings.update(zip(chain.tags, chain.value))
+        return env
+
+    @fmap(NAMESPACESXP, PACKAGESXP, PERSISTSXP)
+    def r_namespace(self, flags):
+        rType = flags & 0xff
+        if rType == PERSISTSXP:
+            raise NotImplementedError('Unserialization of persistent '
+                                      'references is not supported')
+        self.readInt()
+        name = tuple(self.readItem() for _ in range(self.readInt()))
+        env = REnvironment(kind='namespace' if rType == NAMESPACESXP
+                           else 'package', name=name)
+        self.refs.append(env)
+        return env
+
+    @fmap(SPECIALSXP, BUILTINSXP)
+    def r_builtin(self, flags):
+        name = self.read(self.readInt()).decode('ascii')
+        return RObject('special' if flags & 0xff == SPECIALSXP
+                       else 'builtin', name)
+
+    @fmap(EXTPTRSXP, WEAKREFSXP)
+    def r_reference(self, flags):
+        obj = RObject('externalptr' if flags & 0xff == EXTPTRSXP
+                      else 'weakref')
+        self.refs.append(obj)
+        if flags & 0xff == EXTPTRSXP:
+            obj.value = (self.readItem(), self.readItem())
+        obj.attr = self.readAttributes(flags)
+        return obj
+
+    @fmap(LGLSXP, INTSXP, REALSXP, CPLXSXP)
+    def r_numeric(self, flags):
+        rType = flags & 0xff
+        length = self.readLength()
+        if rType == LGLSXP:
+            data = self.readArray(numpy.int32, length)
+            if (data == NA_INTEGER).any():
+                isNA = data == NA_INTEGER
+                data = (data != 0).astype(object)
+                data[isNA] = None
+            else:
+                data = data != 0
+        else:
+            data = self.readArray(rtypes.typeofMap[SEXP_TYPEOF[rType]],
+                                  length)
+        return self._applyAttributes(data, self.readAttributes(flags))
+
+    @fmap(STRSXP)
+    def r_strings(self, flags):
+        strings = []
+        for _ in range(self.readLength()):
+            itemFlags = self.readInt()
+            length = self.readInt()
+            strings.append(None if length == -1 else
+                           self._decodeChars(itemFlags >> 12,
+                                             self.read(length)))
+        data = numpy.array(strings, dtype=object if None in strings
+                           else str)
+        return self._applyAttributes(data, self.readAttributes(flags))
+
+    @staticmethod
+    def _applyAttributes(data, attr):
+        """Turn attributes of a vector into shape, tags or attr dict"""
+        dim = attr.pop('dim', None)
+        if dim is not None:
+            # R stores arrays in Fortran order
+            data = data.reshape(tuple(dim), order='F')
+        if list(attr) == ['names'] and data.ndim == 1:
+            return asTaggedArray(data, attr['names'])
+        if attr:
+            return asAttrArray(data, attr)
+        return data
+
+    @fmap(RAWSXP)
+    def r_raw(self, flags):
+        data = self.read(self.readLength())
+        attr = self.readAttributes(flags)
+        return RObject('raw', data, attr) if attr else data
+
+    @fmap(VECSXP, EXPRSXP)
+    def r_list(self, flags):
+        data = [self.readItem() for _ in range(self.readLength())]
+        attr = self.readAttributes(flags)
+        names = attr.pop('names', None)
+        if names is not None:
+            data = TaggedList.new(data, names)
+        if flags & 0xff == EXPRSXP:
+            return RObject('expression', data, attr)
+        return RObject('list', data, attr) if attr else data
+
+    @fmap(S4SXP)
+    def r_s4(self, flags):
+        return S4(self.readAttributes(flags))
+
+    @fmap(ALTREP_SXP)
+    def r_altrep(self, flags):
+        """
+        Compact representations of vectors (e.g. of 1:n). Their state is
+        expanded into regular vectors.
+        """
+        info = self.readItem()
+        state = self.readItem()
+        attr = self._attrDict(self.readItem())
+        altClass = str(info.value[0])
+        if altClass in ('compact_intseq', 'compact_realseq'):
+            length, start, step = state
+            dtype = numpy.int32 if altClass == 'compact_intseq' \
+                else numpy.double
+            data = (start + step * numpy.arange(int(length))).astype(dtype)
+        elif altClass.startswith('wrap_'):
+            data = state[0]
+            data = numpy.asarray(data) if not isinstance(data, bytes) \
+                else data
+        elif altClass == 'deferred_string':
+            # the state holds the numbers still to be converted to strings
+            numbers = numpy.asarray(state.value[0])
+            data = numpy.array([('%.15g' % n) if n.dtype.kind == 'f'
+                                else str(n) for n in numbers])
+        else:
+            raise NotImplementedError('Unserialization of ALTREP class '
+                                      '"%s" not implemented' % altClass)
+        if isinstance(data, numpy.ndarray):
+            # drop attributes of the wrapped vector, 'attr' replaces them
+            data = self._applyAttributes(numpy.asarray(data), attr)
+        return data
+
+    @fmap(BCODESXP)
+    def r_bytecode(self, flags):
+        """
+        Byte code of compiled functions. Only the expression it has been
+        compiled from (its first constant) is returned.
+        """
+        reps = [None] * self.readInt()
+        expr = self._readBC1(reps)
+        self.readAttributes(flags)
+        return expr
+
+    def _readBC1(self, reps):
+        # the actual byte code (an integer vector):
+        self.readItem()
+        consts = []
+        for _ in range(self.readInt()):
+            constType = self.readInt()
+            if constType == BCODESXP:
+                consts.append(self._readBC1(reps))
+            elif constType in (LANGSXP, LISTSXP, BCREPDEF, BCREPREF,
+                               ATTRLANGSXP, ATTRLISTSXP):
+                consts.append(self._readBCLang(constType, reps))
+            else:
+                consts.append(self.readItem())
+        return self._convertCell(consts[0]) if consts else None
+
+    def _readBCLang(self, bcType, reps):
+        if bcType == BCREPREF:
+            return reps[self.readInt()]
+        if bcType not in (BCREPDEF, LANGSXP, LISTSXP, ATTRLANGSXP,
+                          ATTRLISTSXP):
+            return self.readItem()
+        pos = -1
+        if bcType == BCREPDEF:
+            pos = self.readInt()
+            bcType = self.readInt()
+        cell = _Cell(LANGSXP if bcType in (LANGSXP, ATTRLANGSXP)
+                     else LISTSXP)
+        if pos >= 0:
+            reps[pos] = cell
+        if bcType in (ATTRLANGSXP, ATTRLISTSXP):
+            cell.attr = self._attrDict(self.readItem())
+        cell.tag = self.readItem()
+        cell.car = self._readBCLang(self.readInt(), reps)
+        cell.cdr = self._readBCLang(self.readInt(), reps)
+        return cell
+
+    def _convertCell(self, cell):
+        """Convert cons cells read from byte code into a RObject"""
+        if not isinstance(cell, _Cell):
+            return cell
+        obj = RObject(PAIRLIST_TYPES[cell.rType], [], cell.attr, [])
+        while isinstance(cell, _Cell):
+            obj.tags.append(str(cell.tag) if cell.tag is not None else None)
+            obj.value.append(self._convertCell(cell.car))
+            cell = cell.cdr
+        return obj
+
+
+# map SEXP types of vectors to R's typeof():
+SEXP_TYPEOF = {
+    LGLSXP: 'logical',
+    INTSXP: 'integer',
+    REALSXP: 'double',
+    CPLXSXP: 'complex',
+    STRSXP: 'character',
+}
+
+
+class RNativeSerializer(object):
+    """Convert python objects into R's serialization format (XDR)"""
+    def __init__(self, version=3):
+        if version not in MIN_READER_VERSION:
+            raise ValueError('Unsupported serialization version %d' % version)
+        self.version = version
+        self._buffer = io.BytesIO()
+        # indices of symbols and environments which have been written, later
+        # occurrences are written as references:
+        self._refCount = 0
+        self._refs = {}
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+    def writeInt(self, value):
+        self._buffer.write(struct.pack('>i', value))
+
+    def writeLength(self, length):
+        if length > rtypes.MAX_INT32:
+            self.writeInt(-1)
+            self._buffer.write(struct.pack('>II', length >> 32,
+                                           length & 0xffffffff))
+        else:
+            self.writeInt(length)
+
+    def writeHeader(self):
+        self._buffer.write(b'X\n')
+        self.writeInt(self.version)
+        self.writeInt(R_VERSION)
+        self.writeInt(MIN_READER_VERSION[self.version])
+        if self.version == 3:
+            self.writeInt(5)
+            self._buffer.write(b'UTF-8')
+
+    def serialize(self, o):
+        self.writeHeader()
+        self.writeItem(o)
+        return self.getvalue()
+
+    def writeFlags(self, rType, attr=None, tag=False, levels=0):
+        flags = rType | (levels << 12)
+        if attr:
+            flags |= HAS_ATTR_BIT_MASK
+            if 'class' in attr:
+                flags |= IS_OBJECT_BIT_MASK
+        if tag:
+            flags |= HAS_TAG_BIT_MASK
+        self.writeInt(flags)
+
+    def _writeRef(self, key):
+        """Write a reference to an object written before, return False if
+        it has not been written yet (then it will be registered)"""
+        if key in self._refs:
+            index = self._refs[key]
+            if index > rtypes.MAX_INT32 >> 8:
+                self.writeInt(REFSXP)
+                self.writeInt(index)
+            else:
+                self.writeInt((index << 8) | REFSXP)
+            return True
+        self._refCount += 1
+        self._refs[key] = self._refCount
+        return False
+
+    def writeItem(self, o):
+        if o is None:
+            self.writeInt(NILVALUE_SXP)
+        elif isinstance(o, RSymbol):
+            self.writeSymbol(o)
+        elif isinstance(o, REnvironment):
+            self.writeEnvironment(o)
+        elif isinstance(o, RObject):
+            self.writeRObject(o)
+        elif isinstance(o, S4):
+            attr = dict(o)
+            attr['class'] = o.classes
+            self.writeFlags(S4SXP, attr)
+            self.writeAttributes(attr)
+        elif isinstance(o, (list, tuple, TaggedList)):
+            self.writeList(VECSXP, o)
+        elif isinstance(o, numpy.ndarray):
+            self.writeArray(o)
+        elif isinstance(o, tuple(rtypes.RAW_TYPES)):
+            self.writeRaw(o)
+        elif isinstance(o, tuple(rtypes.STRING_TYPES) +
+                        (bool, int, long, float, complex, numpy.number,
+                         numpy.bool_)):
+            self.writeArray(numpy.array([o]))
+        else:
+            raise NotImplementedError('Serialization of "%s" not implemented'
+                                      % type(o))
+
+    def writeChars(self, string):
+        if string is None:
+            self.writeInt(CHARSXP)
+            self.writeInt(-1)
+            return
+        if isinstance(string, bytes):
+            string = string.decode('utf-8')
+        raw = string.encode('utf-8')
+        isAscii = len(raw) == len(string)
+        self.writeFlags(CHARSXP, levels=ASCII_MASK if isAscii else UTF8_MASK)
+        self.writeInt(len(raw))
+        self._buffer.write(raw)
+
+    def writeSymbol(self, name):
+        if name == MISSING_ARG:
+            self.writeInt(MISSINGARG_SXP)
+        elif not self._writeRef(('symbol', name)):
+            self.writeInt(SYMSXP)
+            self.writeChars(name)
+
+    def writeAttributes(self, attr):
+        if attr:
+            self.writePairlist(LISTSXP, list(attr.values()), list(attr))
+
+    def writePairlist(self, rType, items, tags=None, attr=None):
+        if not items:
+            self.writeInt(NILVALUE_SXP)
+            return
+        tags = tags or [None] * len(items)
+        for idx, (tag, item) in enumerate(zip(tags, items)):
+            nodeAttr = attr if idx == 0 else None
+            self.writeFlags(rType if idx == 0 else LISTSXP, nodeAttr,
+                            tag=tag is not None)
+            self.writeAttributes(nodeAttr)
+            if tag is not None:
+                self.writeSymbol(RSymbol(tag))
+            self.writeItem(item)
+        self.writeInt(NILVALUE_SXP)
+
+    def writeList(self, rType, o, attr=None):
+        attr = dict(attr or {})
+        if isinstance(o, TaggedList):
+            names = numpy.array([key or '' for key in o.keys], dtype=object)
+            attr = dict([('names', names)] + list(attr.items()))
+            o = o.values
+        self.writeFlags(rType, attr)
+        self.writeLength(len(o))
+        for item in o:
+            self.writeItem(item)
+        self.writeAttributes(attr)
+
+    def writeRaw(self, o, attr=None):
+        o = memoryview(o).cast('B')
+        self.writeFlags(RAWSXP, attr)
+        self.writeLength(len(o))
+        self._buffer.write(o)
+        self.writeAttributes(attr)
+
+    def writeArray(self, o):
+        attr = {}
+        if o.ndim > 1:
+            attr['dim'] = numpy.array(o.shape, dtype=numpy.int32)
+        if isinstance(o, TaggedArray):
+            attr['names'] = numpy.array(o.attr, dtype=object)
+        elif isinstance(o, AttrArray) and o.attr:
+            attr.update((k, v) for k, v in o.attr.items() if k != 'dim')
+        data = numpy.asarray(o).ravel(order='F')
+        kind = data.dtype.kind
+        if kind == 'O':
+            values = data.tolist()
+            nonNA = [v for v in values if v is not None]
+            if nonNA and all(isinstance(v, (bool, numpy.bool_))
+                             for v in nonNA):
+                kind = 'b'
+                data = numpy.array([NA_INTEGER if v is None else int(v)
+                                    for v in values], dtype=numpy.int32)
+            elif all(isinstance(v, tuple(rtypes.STRING_TYPES) + (bytes,))
+                     for v in nonNA):
+                kind = 'U'
+            else:
+                raise NotImplementedError('Serialization of object arrays '
+                                          'with mixed items not implemented')
+        if kind in 'iu' and data.size and \
+                not (-rtypes.MAX_INT32 <= data.min() and
+                     data.max() <= rtypes.MAX_INT32):
+            # too large for R's integers
+            kind = 'f'
+        if kind in 'US':
+            self.writeFlags(STRSXP, attr)
+            self.writeLength(data.size)
+            for string in data.tolist():
+                self.writeChars(string)
+        elif kind in 'biufc':
+            rType, dtype = {'b': (LGLSXP, '>i4'), 'i': (INTSXP, '>i4'),
+                            'u': (INTSXP, '>i4'), 'f': (REALSXP, '>f8'),
+                            'c': (CPLXSXP, '>c16')}[kind]
+            self.writeFlags(rType, attr)
+            self.writeLength(data.size)
+            self._buffer.write(data.astype(dtype).tobytes())
+        else:
+            raise NotImplementedError('Serialization of arrays of type "%s" '
+                                      'not implemented' % data.dtype)
+        self.writeAttributes(attr)
+
+    def writeEnvironment(self, env):
+        if env.kind == 'special':
+            self.writeInt(SPECIAL_ENV_CODES[env.name])
+        elif self._writeRef(('env', id(env))):
+            return
+        elif env.kind in ('namespace', 'package'):
+            self.writeInt(NAMESPACESXP if env.kind == 'namespace'
+                          else PACKAGESXP)
+            self.writeInt(0)
+            self.writeInt(len(env.name))
+            for name in env.name:
+                self.writeChars(name)
+        else:
+            self.writeFlags(ENVSXP, env.attr)
+            self.writeInt(int(env.locked))
+            self.writeItem(env.enclos or GLOBAL_ENV)
+            self.writePairlist(LISTSXP, list(env.bindings.values()),
+                               list(env.bindings))
+            # no hash table:
+            self.writeInt(NILVALUE_SXP)
+            if env.attr:
+                self.writeAttributes(env.attr)
+            else:
+                self.writeInt(NILVALUE_SXP)
+
+    def writeRObject(self, o):
+        if o.rType in PAIRLIST_CODES:
+            self.writePairlist(PAIRLIST_CODES[o.rType], o.value, o.tags,
+                               o.attr)
+        elif o.rType == 'list':
+            self.writeList(VECSXP, o.value, o.attr)
+        elif o.rType == 'expression':
+            self.writeList(EXPRSXP, o.value, o.attr)
+        elif o.rType == 'raw':
+            self.writeRaw(o.value, o.attr)
+        elif o.rType in ('closure', 'promise'):
+            first, second, env = o.value
+            self.writeFlags(CLOSXP if o.rType == 'closure' else PROMSXP,
+                            o.attr, tag=env is not None)
+            self.writeAttributes(o.attr)
+            if env is not None:
+                self.writeItem(env)
+            self.writeItem(first)
+            self.writeItem(second)
+        elif o.rType in ('builtin', 'special'):
+            self.writeInt(BUILTINSXP if o.rType == 'builtin' else SPECIALSXP)
+            self.writeInt(len(o.value))
+            self._buffer.write(o.value.encode('ascii'))
+        elif o.rType == 'unbound':
+            self.writeInt(UNBOUNDVALUE_SXP)
+        elif o.rType in ('externalptr', 'weakref'):
+            if self._writeRef(('ref', id(o))):
+                return
+            isPtr = o.rType == 'externalptr'
+            self.writeFlags(EXTPTRSXP if isPtr else WEAKREFSXP, o.attr)
+            if isPtr:
+                prot, tag = o.value or (None, None)
+                self.writeItem(prot)
+                self.writeItem(tag)
+            self.writeAttributes(o.attr)
+        else:
+            raise NotImplementedError('Serialization of R objects of type '
+                                      '"%s" not implemented' % o.rType)
+
+
+##############################################################################
+
+
+def unserialize(data):
+    """Convert R objects serialized by R (e.g. via serialize()) into python
+    objects"""
+    return RUnserializer(data).unserialize()
+
+
+def serialize(o, version=3):
+    """Serialize python object 'o' in R's serialization format, as it
+    can be read in R via unserialize()"""
+    return RNativeSerializer(version).serialize(o)
+
+
+def _rdsOpen(path):
+    """Open a .rds file, which is usually compressed"""
+    with open(path, 'rb') as fp:
+        magic = fp.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return gzip.open(path, 'rb')
+    elif magic.startswith(b'BZh'):
+        return bz2.BZ2File(path, 'rb')
+    elif magic.startswith(b'\xfd7zXZ'):
+        if lzma is None:
+            raise NotImplementedError('xz-compressed files need Python 3')
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def readRds(path):
+    """Read an R object from a file written by R's saveRDS()"""
+    with _rdsOpen(path) as fp:
+        return unserialize(fp.read())
+
+
+def writeRds(o, path, compress=True, version=3):
+    """
+    Write python object 'o' into a file which can be read by R's readRDS().
+    'compress' is one of True (same as 'gzip'), False, 'bzip2' or 'xz'.
+    """
+    data = serialize(o, version)
+    if compress in (True, 'gzip'):
+        fp = gzip.open(path, 'wb')
+    elif compress == 'bzip2':
+        fp = bz2.BZ2File(path, 'wb')
+    elif compress == 'xz' and lzma is not None:
+        fp = lzma.open(path, 'wb')
+    elif not compress:
+        fp = open(path, 'wb')
+    else:
+        raise ValueError('Unsupported compression %r' % compress)
+    with fp:
+        fp.write(data)
@@ -3,26 +3,34 @@
 Parser module for pyRserve
 """
 import io
+import os
 import struct
 import socket
+import tempfile
 
 import numpy
 
 from .rtypes import (
-    CMD_OOB, CMD_RESP, DT_SEXP, DTs, ERRORS, RESP_ERR, RESP_OK,
-    SOCKET_BLOCK_SIZE, VALID_R_TYPES, XT_ARRAY_BOOL, XT_ARRAY_CPLX,
-    XT_ARRAY_DOUBLE, XT_ARRAY_INT, XT_ARRAY_STR, XT_BOOL, XT_CLOS, XT_DOUBLE,
-    XT_HAS_ATTR, XT_INT, XT_INT3, XT_INT7, XT_LANG_NOTAG, XT_LANG_TAG, XT_LARGE,
+    CMD_OOB, CMD_RESP, DT_INT, DT_LARGE, DT_SEXP, DTs, ERRORS, RESP_ERR,
+    RESP_OK, RHEADER_SIZE, SMALL_DATA_HEADER_SIZE, SOCKET_BLOCK_SIZE,
+    VALID_R_TYPES, XT_ARRAY_BOOL, XT_ARRAY_CPLX, XT_ARRAY_DOUBLE,
+    XT_ARRAY_INT, XT_ARRAY_STR, XT_BOOL, XT_CLOS, XT_DOUBLE, XT_HAS_ATTR,
+    XT_INT, XT_INT3, XT_INT7, XT_LANG_NOTAG, XT_LANG_TAG, XT_LARGE,
     XT_LIST_NOTAG, XT_LIST_TAG, XT_NULL, XT_RAW, XT_S4, XT_STR, XT_SYMNAME,
     XT_UNKNOWN, XT_VECTOR, XT_VECTOR_EXP, XTs, structMap, numpyMap
 )
 from .misc import FunctionMapper, byteEncode, stringEncode, PY3
 from .rexceptions import \
-    RResponseError, REvalError, EndOfDataError, RParserError
+    RResponseError, REvalError, EndOfDataError, RParserError, RTimeoutError, \
+    RProtocolError
 from .taggedContainers import TaggedList, asTaggedArray, asAttrArray
 
 DEBUG = 0
 
+# Data of messages being skipped is received into this buffer. It is shared
+# by all threads, which is fine as its content is never looked at:
+_scratch = memoryview(bytearray(SOCKET_BLOCK_SIZE * 16))
+
 
 class OOBMessage(object):
     """OOB Message
@@ -61,12 +69,14 @@ class Command(object):
 
 class Lexeme(list):
     """Basic Lexeme class for parsing binary data coming from Rserve"""
-    def __init__(self, rTypeCode, length, hasAttr, lexpos):
+    def __init__(self, rTypeCode, length, hasAttr, lexpos,
+                 headerSize=SMALL_DATA_HEADER_SIZE):
         list.__init__(self, [rTypeCode, length, hasAttr, lexpos])
         self.rTypeCode = rTypeCode
         self.length = length
         self.hasAttr = hasAttr
         self.lexpos = lexpos
+        self.headerSize = headerSize
         self.attrLexeme = None
         self.data = None
 
@@ -91,8 +101,8 @@ class Lexeme(list):
         if self.hasAttr:
             if not self.attrLexeme:
                 raise RuntimeError('Attribute lexeme not yet set')
-            # also subtract size of REXP header=4
-            return self.length - self.attrLength - 4
+            # also subtract size of the attribute's REXP header:
+            return self.length - self.attrLength - self.attrLexeme.headerSize
         else:
             return self.length
 
@@ -135,6 +145,13 @@ class Lexer(object):
         self.isOOB = False
         self.oobType = None
         self.oobUserCode = None
+        # Memory map of the message body, set thru 'spill()':
+        self.spillMap = None
+        self.spillOffset = None
+        # Array the next numeric array payload is read into (see readArray):
+        self.outArray = None
+        # Set when the socket has timed out, see _timeoutError():
+        self.timedOut = False
 
     def readHeader(self):
         """
@@ -179,9 +196,11 @@ class Lexer(object):
             elif self.responseCode == RESP_ERR:
                 self.responseOK = False
             else:
-                self.clearSocketData()
-                raise ValueError('Received illegal response code (%x)' %
-                                 self.responseCode)
+                # the message size of an invalid header can't be trusted, so
+                # the message cannot be skipped:
+                self.messageSize = None
+                raise RProtocolError('Received illegal response code (%x)' %
+                                     self.responseCode)
 
             if DEBUG:
                 print('response ok? %s (responseCode=%x), error-code: %x, '
@@ -194,24 +213,161 @@ class Lexer(object):
     def clearSocketData(self):
         """
         If for any reason the parsing process returns an error, make sure that
-        all data from a socket is removed to avoid data pollution with further
-        parsing attempts.
+        the remaining data of the current message is removed from a socket to
+        avoid data pollution with further parsing attempts. Exactly the
+        announced size of the message is discarded, so the next message can
+        be read from the socket afterwards.
         """
-        if not isinstance(self.fp, socket.socket):
-            # not a socket. Nothing to do here.
+        if not isinstance(self.fp, socket.socket) or self.timedOut or \
+                self.messageSize is None:
+            # not a socket, one which will be closed, or the header is
+            # incomplete. Nothing to do here.
             return
-        # Switch socket into non-blocking mode and read from it until it
-        # is empty (and hence socket.error is raised):
-        self.fp.setblocking(False)
         try:
-            while True:
-                self.fp.recv(SOCKET_BLOCK_SIZE)
-        except socket.error:
-            # socket has no more data, it can be considered as cleared
+            self.skipMessage()
+        except EndOfDataError:
+            # the connection has been closed, there is nothing to clear
             pass
-        finally:
-            # Now set it back to blocking mode (no matter what exception):
-            self.fp.setblocking(True)
+
+    def readErrorParameter(self):
+        """
+        Read the body of an error response. Rserve appends an optional
+        parameter to some errors (e.g. the size of the object for
+        ERR_object_too_big), either as a plain 32bit integer or wrapped into
+        a DT_INT data header. Return this integer or None if the body has
+        another format.
+        """
+        raw = self.read(self.messageSize)
+        if len(raw) == 4:
+            return struct.unpack('<I', raw)[0]
+        if len(raw) >= 8:
+            dtTypeCode = struct.unpack('<B', raw[:1])[0]
+            hdrSize = 8 if dtTypeCode & DT_LARGE else 4
+            if dtTypeCode & 0x3F == DT_INT and len(raw) >= hdrSize + 4:
+                return struct.unpack('<I', raw[hdrSize:hdrSize + 4])[0]
+        return None
+
+    def spill(self, directory=None):
+        """
+        Copy the body of the current message from the socket into an
+        anonymous temporary file and continue reading from that file.
+        The file is mapped into memory, numeric array payloads are then
+        returned as views into this map instead of being copied into memory
+        (see readArray()). The file is released once the last of these
+        views has been garbage-collected.
+        """
+        spillFile = tempfile.TemporaryFile(dir=directory)
+        buf = memoryview(bytearray(SOCKET_BLOCK_SIZE * 16))
+        remaining = self.messageSize
+        while remaining > 0:
+            try:
+                numBytes = self.fp.recv_into(buf[:min(remaining, len(buf))])
+            except socket.timeout:
+                raise self._timeoutError(self.messageSize - remaining)
+            if numBytes == 0:
+                raise EndOfDataError()
+            spillFile.write(buf[:numBytes])
+            remaining -= numBytes
+        spillFile.flush()
+        # copy-on-write mode: arrays are writable but changes are private
+        self.spillMap = numpy.memmap(spillFile, dtype=numpy.uint8, mode='c',
+                                     shape=(self.messageSize, ))
+        spillFile.seek(0)
+        self.spillOffset = self.lexpos
+        self.fp = spillFile
+        self._read = spillFile.read
+
+    def readArray(self, length, dtype):
+        """
+        Read 'length' bytes from the input source as a numpy array of given
+        dtype. If self.outArray is set the data is read directly into this
+        array. Otherwise, if the message has been spilled into a file, the
+        array is a numpy.memmap view into it.
+        """
+        if self.outArray is not None:
+            out, self.outArray = self.outArray, None
+            return self._readIntoArray(out, length, dtype)
+        if self.spillMap is None:
+            return numpy.frombuffer(self.read(length), dtype=dtype)
+        start = self.lexpos - self.spillOffset
+        self.fp.seek(length, os.SEEK_CUR)
+        self.lexpos += length
+        return self.spillMap[start:start + length].view(dtype)
+
+    def _readIntoArray(self, out, length, dtype):
+        """
+        Read 'length' bytes directly into the memory of the numpy array 'out'
+        and return a flat view of it. R sends arrays in Fortran order, so
+        multi-dimensional arrays must be Fortran-contiguous.
+        """
+        dtype = numpy.dtype(dtype)
+        if not isinstance(out, numpy.ndarray):
+            raise TypeError('Output for an array result must be a numpy '
+                            'array, not %s' % type(out).__name__)
+        if out.dtype != dtype or out.nbytes != length:
+            raise ValueError('Output array (dtype %s, %d items) does not '
+                             'match result (dtype %s, %d items)' %
+                             (out.dtype, out.size, dtype,
+                              length // dtype.itemsize))
+        order = 'F' if out.ndim > 1 else 'C'
+        if not (out.flags.writeable and out.flags[order + '_CONTIGUOUS']):
+            raise ValueError('Output array must be writeable and contiguous '
+                             '(in Fortran order if it has several dimensions)')
+        flat = out.reshape(-1, order=order)
+        self.readInto(memoryview(flat.view(numpy.uint8)))
+        return flat
+
+    def readInto(self, buf):
+        """
+        Read exactly len(buf) bytes from the input source into the writable
+        buffer 'buf' without creating intermediate copies.
+        """
+        if isinstance(self.fp, socket.socket):
+            readInto = self.fp.recv_into
+        else:
+            readInto = self.fp.readinto
+        pos = 0
+        while pos < len(buf):
+            try:
+                numBytes = readInto(buf[pos:])
+            except socket.timeout:
+                raise self._timeoutError(pos)
+            if not numBytes:
+                raise EndOfDataError()
+            pos += numBytes
+        self.lexpos += pos
+
+    def skipMessage(self):
+        """
+        Read and discard the remaining data of the current message from the
+        input source.
+        """
+        remaining = RHEADER_SIZE + self.messageSize - self.lexpos
+        if not isinstance(self.fp, socket.socket):
+            while remaining > 0:
+                blockSize = min(remaining, SOCKET_BLOCK_SIZE)
+                self.read(blockSize)
+                remaining -= blockSize
+            return
+        while remaining > 0:
+            try:
+                numBytes = self.fp.recv_into(
+                    _scratch, min(remaining, len(_scratch)))
+            except socket.timeout:
+                raise self._timeoutError(0)
+            if not numBytes:
+                raise EndOfDataError()
+            self.lexpos += numBytes
+            remaining -= numBytes
+
+    def _timeoutError(self, pending):
+        """
+        Return an RTimeoutError for a socket timeout, 'pending' bytes have
+        been received in addition to those already consumed (lexpos)
+        """
+        self.timedOut = True
+        return RTimeoutError('Rserve did not respond within %s seconds' %
+                             self.fp.gettimeout(), (self.lexpos or 0) + pending)
 
     def read(self, length):
         """
@@ -224,7 +380,10 @@ class Lexer(object):
         bytesToRead = length
         buf = io.BytesIO(b'')
         while bytesToRead > 0:
-            fragment = self._read(bytesToRead)
+            try:
+                fragment = self._read(bytesToRead)
+            except socket.timeout:
+                raise self._timeoutError(length - bytesToRead)
             lenFrag = len(fragment)
             if lenFrag == 0:
                 raise EndOfDataError()
@@ -284,7 +443,8 @@ class Lexer(object):
             raise RParserError(
                 "Unknown SEXP type %s found at lexpos %d, length %d" %
                 (hex(rTypeCode), startLexpos, length))
-        return Lexeme(rTypeCode, length, hasAttr, startLexpos)
+        return Lexeme(rTypeCode, length, hasAttr, startLexpos,
+                      self.lexpos - startLexpos)
 
     def nextExprData(self, lexeme):
         """
@@ -317,10 +477,8 @@ class Lexer(object):
 
     @fmap(XT_ARRAY_INT, XT_ARRAY_DOUBLE, XT_ARRAY_CPLX)
     def xt_array_numeric(self, lexeme):
-        raw = self.read(lexeme.dataLength)
         # TODO: swapping...
-        data = numpy.frombuffer(raw, dtype=numpyMap[lexeme.rTypeCode])
-        return data
+        return self.readArray(lexeme.dataLength, numpyMap[lexeme.rTypeCode])
 
     @fmap(XT_ARRAY_BOOL)
     def xt_array_bool(self, lexeme):
@@ -398,24 +556,42 @@ class Lexer(object):
 
     @fmap(XT_RAW)
     def xt_raw(self, lexeme):
-        self.__unpack(XT_INT)
-        return self.read(lexeme.dataLength - 4)
+        length = self.__unpack(XT_INT)
+        # cut off padding bytes beyond the actual length of the vector:
+        return self.read(lexeme.dataLength - 4)[:length]
 
 
 class RParser(object):
     #
     parserMap = {}
     fmap = FunctionMapper(parserMap)
+    # functions converting results by their Python type (see
+    # registerConverter()), and the ones found for subclasses of these types:
+    converterMap = {}
+    converterCache = {}
 
-    def __init__(self, src, atomicArray):
+    def __init__(self, src, atomicArray, spillThreshold=None, spillDir=None,
+                 out=None):
         """
         atomicArray: if False parsing arrays with only one element will just
                      return this element
         arrayOrder:  The order in which data in multi-dimensional arrays is
                      returned. 'C' for c-order, F for fortran.
+        spillThreshold: messages larger than this number of bytes received
+                     from a socket are spilled into a temporary file in
+                     'spillDir', numeric arrays are memory-mapped from there
+                     (see Lexer.spill())
+        out:         numpy array to decode a numeric array result into, or a
+                     dict of such arrays to decode the equally named items of
+                     a list result into
         """
         self.lexer = Lexer(src)
         self.atomicArray = atomicArray
+        self.spillThreshold = spillThreshold
+        self.spillDir = spillDir
+        self.out = out
+        # output of the expression currently parsed, see _parseExpr():
+        self._out = None
         self.indentLevel = None
 
     def __getitem__(self, key):
@@ -446,9 +622,89 @@ class RParser(object):
         Parse data stream and return result converted into
         python data structure
         """
+        self._readHeader()
+        return self._parseBody()
+
+    def iterParse(self):
+        """
+        Like parse(), but if the result is a vector or list an iterator is
+        returned which yields its items as (tag, value) tuples as soon as
+        each one has been decoded from the data stream. Items without a tag
+        have None as tag. Any other result is returned as iterator over a
+        single (None, value) tuple. OOB messages are returned as
+        OOBMessage instances, just like by parse().
+        If the iterator is closed before all items have been consumed, the
+        remaining data of the message is discarded.
+        """
+        self._readHeader()
+        if self.lexer.isOOB or self.lexer.messageSize == 0:
+            message = self._parseBody()
+            if self.lexer.isOOB:
+                return message
+            return ItemIterator(self._iterSingle(message), self.lexer)
+
+        try:
+            dataLexeme = self.lexer.nextExprHdr()
+            self._debugLog(dataLexeme, isRexpr=False)
+            if dataLexeme.rTypeCode != DT_SEXP:
+                raise NotImplementedError()
+            lexeme = self.lexer.nextExprHdr()
+            self._debugLog(lexeme)
+            if lexeme.rTypeCode not in (XT_VECTOR, XT_LIST_NOTAG):
+                message = self._postprocessData(self._parseExpr(lexeme).data)
+                return ItemIterator(self._iterSingle(message), self.lexer)
+            if lexeme.hasAttr:
+                lexeme.setAttr(self._parseExpr())
+        except Exception:
+            self.lexer.clearSocketData()
+            raise
+        return ItemIterator(self._iterVectorItems(lexeme), self.lexer)
+
+    @staticmethod
+    def _iterSingle(message):
+        yield None, message
+
+    def _iterVectorItems(self, lexeme):
+        tags = None
+        if lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG:
+            for tag, value in lexeme.attr:
+                if tag == 'names':
+                    tags = value
+        finalLexpos = self.lexer.lexpos + lexeme.dataLength
+        idx = 0
+        try:
+            while self.lexer.lexpos < finalLexpos:
+                value = self._postprocessData(self._parseExpr().data)
+                # as in TaggedList empty tags are converted into None:
+                tag = (tags[idx] or None) if tags is not None else None
+                yield tag, value
+                idx += 1
+        except Exception:
+            self.lexer.clearSocketData()
+            raise
+
+    def parseRaw(self):
+        """
+        Like parse(), but return the body of the response as raw bytes.
+        Used for responses to CMD_serEval, they carry data in R's
+        serialization format without data header.
+        """
+        self._readHeader()
+        if self.lexer.isOOB:
+            return self._parseBody()
+        return self.lexer.read(self.lexer.messageSize)
+
+    def _readHeader(self):
         self.indentLevel = 1
         self.lexer.readHeader()
-
+        if not (self.lexer.isOOB or self.lexer.responseOK):
+            self._raiseResponseError()
+        if self.spillThreshold is not None and \
+                self.lexer.messageSize > self.spillThreshold and \
+                isinstance(self.lexer.fp, socket.socket):
+            self.lexer.spill(self.spillDir)
+
+    def _parseBody(self):
         message = None
         if self.lexer.messageSize > 0:
             try:
@@ -460,15 +716,6 @@ class RParser(object):
                 # parse again from a socket will return polluted data:
                 self.lexer.clearSocketData()
                 raise
-        elif not self.lexer.responseOK:
-            try:
-                rserve_err_msg = ERRORS[self.lexer.errCode]
-            except KeyError:
-                raise REvalError("R evaluation error (code=%d)" %
-                                 self.lexer.errCode)
-            else:
-                raise RResponseError('Response error %s (error code=%d)' %
-                                     (rserve_err_msg, self.lexer.errCode))
 
         if self.lexer.isOOB:
             return OOBMessage(self.lexer.oobType, self.lexer.oobUserCode,
@@ -476,27 +723,61 @@ class RParser(object):
         else:
             return message
 
+    def _raiseResponseError(self):
+        """
+        Raise the appropriate exception for a response carrying RESP_ERR.
+        Some errors (e.g. ERR_object_too_big) come with a parameter in the
+        message body, it is consumed here and attached to the exception.
+        """
+        errCode = self.lexer.errCode
+        param = None
+        if self.lexer.messageSize > 0:
+            param = self.lexer.readErrorParameter()
+        try:
+            rserve_err_msg = ERRORS[errCode]
+        except KeyError:
+            raise REvalError("R evaluation error (code=%d)" % errCode)
+        else:
+            raise RResponseError('Response error %s (error code=%d)' %
+                                 (rserve_err_msg, errCode),
+                                 errCode=errCode, param=param)
+
     def _parse(self):
         dataLexeme = self.lexer.nextExprHdr()
         self._debugLog(dataLexeme, isRexpr=False)
         if dataLexeme.rTypeCode == DT_SEXP:
-            lexeme = self._parseExpr()
+            out = None if self.lexer.isOOB else self.out
+            lexeme = self._parseExpr(out=out)
             return self._postprocessData(lexeme.data)
         else:
             raise NotImplementedError()
 
-    def _parseExpr(self):
+    def _parseExpr(self, lexeme=None, out=None):
+        """
+        Parse the next R expression from the input source.
+        lexeme: header of the expression if it has been read already
+        out:    output array (or dict of arrays) to decode the expression
+                into. It is taken by xt_array() or xt_vector().
+        """
         self.indentLevel += 1
-        lexeme = self.lexer.nextExprHdr()
-        self._debugLog(lexeme)
+        if lexeme is None:
+            lexeme = self.lexer.nextExprHdr()
+            self._debugLog(lexeme)
         if lexeme.hasAttr:
             self.indentLevel += 1
             if DEBUG:
                 print('%s Attribute:' % self.__ind)
             lexeme.setAttr(self._parseExpr())
             self.indentLevel -= 1
-        lexeme.data = self.parserMap.get(lexeme.rTypeCode,
-                                         self[None])(self, lexeme)
+        outerOut, self._out = self._out, out
+        try:
+            lexeme.data = self.parserMap.get(lexeme.rTypeCode,
+                                             self[None])(self, lexeme)
+        finally:
+            unusedOut, self._out = self._out, outerOut
+        if unusedOut is not None:
+            raise TypeError('Result of type %s cannot be decoded into the '
+                            'given output' % XTs.get(lexeme.rTypeCode))
         self.indentLevel -= 1
         return lexeme
 
@@ -519,7 +800,7 @@ class RParser(object):
         Postprocess parsing results depending on configuration parameters
         Currently only arrays are effected.
         """
-        if data.__class__ == numpy.ndarray:
+        if data.__class__ in (numpy.ndarray, numpy.memmap):
             # this does not apply for arrays with attributes
             # (__class__ would be TaggedArray)!
             if len(data) == 1 and not self.atomicArray:
@@ -544,8 +825,30 @@ class RParser(object):
                 elif isinstance(data, (bool, numpy.bool_)):
                     # convert into native python string
                     data = bool(data)
+        if self.converterMap:
+            converter = self.lookupConverter(type(data))
+            if converter is not None:
+                data = converter(data)
         return data
 
+    @classmethod
+    def lookupConverter(cls, pyType):
+        """
+        Return the converter registered for results of 'pyType' or one of
+        its base classes, or None. Results are cached per type.
+        """
+        try:
+            return cls.converterCache[pyType]
+        except KeyError:
+            pass
+        converter = None
+        for baseType in pyType.__mro__:
+            if baseType in cls.converterMap:
+                converter = cls.converterMap[baseType]
+                break
+        cls.converterCache[pyType] = converter
+        return converter
+
     @fmap(None)
     def xt_(self, lexeme):
         # apply this for atomic data
@@ -553,8 +856,13 @@ class RParser(object):
 
     @fmap(XT_ARRAY_BOOL, XT_ARRAY_INT, XT_ARRAY_DOUBLE, XT_ARRAY_STR)
     def xt_array(self, lexeme):
+        self.lexer.outArray, self._out = self._out, None
         # converts data into a numpy array already:
         data = self._nextExprData(lexeme)
+        if self.lexer.outArray is not None:
+            self.lexer.outArray = None
+            raise TypeError('Only numeric arrays can be decoded into an '
+                            'output array, not %s' % XTs[lexeme.rTypeCode])
         if lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG:
             for tag, value in lexeme.attr:
                 if tag == 'dim':
@@ -562,9 +870,8 @@ class RParser(object):
                     # sends arrays in Fortran mode:
                     data = data.reshape(value, order='F')
                 elif tag == 'names':
-                    # convert numpy-vector 'value' into list to make
-                    # TaggedArray work properly:
-                    data = asTaggedArray(data, list(value))
+                    # the array has named items:
+                    data = asTaggedArray(data, value)
                 else:
                     # there are additional tags in the attribute, just collect
                     # them in a dictionary attached to the array.
@@ -590,6 +897,13 @@ class RParser(object):
         as XT_VECTOR. For now just a list with the expression content is
         returned in this case.
         """
+        out, self._out = self._out, None
+        if out is not None and not isinstance(out, dict):
+            raise TypeError('Output for a list result must be a dict of '
+                            'numpy arrays')
+        names = []
+        if lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG:
+            names = dict(lexeme.attr).get('names', [])
         finalLexpos = self.lexer.lexpos + lexeme.dataLength
         if DEBUG:
             print('%s     Vector-lexpos: %d, length %d, finished at: %d' %
@@ -597,8 +911,17 @@ class RParser(object):
                    lexeme.dataLength, finalLexpos))
         data = []
         while self.lexer.lexpos < finalLexpos:
+            itemOut = None
+            if out and len(data) < len(names):
+                itemOut = out.get(names[len(data)])
             # convert single item arrays into atoms (via stripArray)
-            data.append(self._postprocessData(self._parseExpr().data))
+            data.append(self._postprocessData(
+                self._parseExpr(out=itemOut).data))
+        if out:
+            missing = set(out).difference(names)
+            if missing:
+                raise KeyError('No items named %s in result' %
+                               ', '.join(sorted(missing)))
 
         if lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG:
             # The vector is actually a tagged list, i.e. a list which allows
@@ -608,7 +931,7 @@ class RParser(object):
             for tag, value in lexeme.attr:
                 if tag == 'names':
                     # the vector has named items
-                    data = TaggedList(zip(value, data))
+                    data = TaggedList.new(data, value)
                 else:
                     if DEBUG:
                         print('Warning: applying LIST_TAG "%s" on xt_vector '
@@ -652,10 +975,64 @@ class RParser(object):
 ##############################################################################
 
 
-def rparse(src, atomicArray=False):
-    rparser = RParser(src, atomicArray)
+def registerConverter(pyType, func):
+    """
+    Convert results of 'pyType' (or a subclass of it) with 'func(result)',
+    e.g. registerConverter(TaggedList, dict). Converters are applied to the
+    result and to all items of lists.
+    """
+    RParser.converterMap[pyType] = func
+    RParser.converterCache.clear()
+
+
+class ItemIterator(object):
+    """
+    Iterator over the items of a message returned by RParser.iterParse().
+    If it is closed before all items have been consumed - even before the
+    first one - the remaining data of the message is discarded.
+    """
+    def __init__(self, items, lexer):
+        self._items = items
+        self._lexer = lexer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    next = __next__  # Python 2
+
+    @property
+    def timedOut(self):
+        """True if the socket timed out while reading the items"""
+        return self._lexer.timedOut
+
+    def close(self):
+        self._items.close()
+        if not self._lexer.timedOut and self._lexer.messageSize is not None:
+            try:
+                self._lexer.skipMessage()
+            except EndOfDataError:
+                # the connection has been closed, there is nothing to skip
+                pass
+
+
+def rparse(src, atomicArray=False, spillThreshold=None, spillDir=None,
+           out=None):
+    rparser = RParser(src, atomicArray, spillThreshold, spillDir, out)
     return rparser.parse()
 
+
+def rparseIter(src, atomicArray=False, spillThreshold=None, spillDir=None):
+    rparser = RParser(src, atomicArray, spillThreshold, spillDir)
+    return rparser.iterParse()
+
+
+def rparseRaw(src, atomicArray=False, spillThreshold=None, spillDir=None):
+    rparser = RParser(src, atomicArray, spillThreshold, spillDir)
+    return rparser.parseRaw()
+
 ##############################################################################
 
 
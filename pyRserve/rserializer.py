@@ -2,10 +2,11 @@
 Serializer class to convert Python objects into a binary data stream for
 sending them to Rserve.
 """
-import os
-import io
+import time
 import struct
 import socket
+import threading
+import collections
 
 import numpy
 
@@ -24,6 +25,86 @@ if PY3:
     long = int
 
 
+class ArenaStats(collections.namedtuple(
+        'ArenaStats', 'capacity peakSize messages allocations shrinks')):
+    """
+    Statistics of a BufferArena: its current 'capacity' and the largest
+    amount of data collected in it at once ('peakSize', in bytes), the
+    number of messages assembled, the number of buffers allocated and the
+    number of times it shrank back to its initial size.
+    """
+    __slots__ = ()
+
+
+class BufferArena(object):
+    """
+    Reusable buffer in which the small parts of messages are joined before
+    sending them, so not every message needs to allocate its own buffer.
+    It grows geometrically when needed, and shrinks back to 'initialSize'
+    once it has only been used for smaller messages for 'idleTime' seconds.
+    An arena is confined to the thread which has created it (see
+    RConnector._arena).
+    """
+    def __init__(self, initialSize=2**16, idleTime=60):
+        self.initialSize = initialSize
+        self.idleTime = idleTime
+        self._buffer = bytearray(initialSize)
+        self._cursor = 0
+        self._thread = threading.current_thread()
+        self._lastLargeUse = time.time()
+        self._peakSize = 0
+        self._messages = 0
+        self._allocations = 1
+        self._shrinks = 0
+
+    def begin(self):
+        """Start collecting a new message"""
+        if threading.current_thread() is not self._thread:
+            raise RuntimeError('BufferArena can only be used by the thread '
+                               'which has created it')
+        if len(self._buffer) > self.initialSize and \
+                time.time() - self._lastLargeUse > self.idleTime:
+            self._buffer = bytearray(self.initialSize)
+            self._allocations += 1
+            self._shrinks += 1
+        self._cursor = 0
+        self._messages += 1
+
+    def write(self, data):
+        end = self._cursor + len(data)
+        if end > len(self._buffer):
+            self._grow(end)
+        with memoryview(self._buffer) as view:
+            view[self._cursor:end] = data
+        self._cursor = end
+
+    def _grow(self, minSize):
+        size = len(self._buffer)
+        while size < minSize:
+            size *= 2
+        buf = bytearray(size)
+        buf[:self._cursor] = memoryview(self._buffer)[:self._cursor]
+        self._buffer = buf
+        self._allocations += 1
+
+    def flush(self, write):
+        """Pass the data collected so far to write(), then start over"""
+        if not self._cursor:
+            return
+        if self._cursor > self.initialSize:
+            self._lastLargeUse = time.time()
+        self._peakSize = max(self._peakSize, self._cursor)
+        # release the view immediately, the buffer could not grow otherwise:
+        with memoryview(self._buffer) as view:
+            with view[:self._cursor] as data:
+                write(data)
+        self._cursor = 0
+
+    def stats(self):
+        return ArenaStats(len(self._buffer), self._peakSize, self._messages,
+                          self._allocations, self._shrinks)
+
+
 class RSerializer(object):
     """
     Class to to serialize Python objects into a binary data stream for sending
@@ -32,74 +113,100 @@ class RSerializer(object):
     Depending on 'commandType' given to __init__ the resulting binary string
     can be used to send a command, to assign a variable in Rserve, or to
     reply to a request received from Rserve.
+    If 'vectorize' is True, lists and tuples whose items are all bools,
+    numbers or strings (or None, for NA) are sent as a single typed R vector
+    instead of a generic R list (see _vectorizeList()).
+    If a BufferArena is given as 'arena' it is used to join the small parts
+    of the message before sending it to 'fp'.
     """
     serializeMap = {}
     fmap = FunctionMapper(serializeMap)
+    # serialization functions found for Python types (including subclasses
+    # of the types in serializeMap), filled on demand:
+    dispatchCache = {}
+
+    def __init__(self, commandType, fp=None, vectorize=False, arena=None):
+        self.vectorize = vectorize
+        self._arena = arena
+        # fp can be a socket or a file(-like) object to send/write the
+        # message to in finalize(), otherwise it is returned from there:
+        self._fp = fp
+        self._commandType = commandType
+        # The message body is collected as a sequence of parts (bytes or
+        # uint8 arrays). Each byte is written once: headers are filled in
+        # into their reserved slots once the length of their data is known
+        # (see _beginExpr() and _endExpr()):
+        self._parts = []
+        self._size = 0
+
+    def _write(self, data):
+        """Append 'data' (bytes or a 1-d uint8 array) to the message"""
+        self._parts.append(data)
+        self._size += len(data)
+
+    def _writeParts(self, write):
+        """
+        Write the message via 'write()'. Small parts are joined to avoid
+        many tiny writes, large ones (i.e. array data) are written directly.
+        """
+        if self._arena is not None:
+            self._writePartsViaArena(write)
+            return
+        pending = []
+        for part in self._parts:
+            if len(part) < rtypes.SOCKET_BLOCK_SIZE:
+                pending.append(part)
+                continue
+            if pending:
+                write(b''.join(pending))
+                pending = []
+            write(part)
+        if pending:
+            write(b''.join(pending))
+
+    def _writePartsViaArena(self, write):
+        arena = self._arena
+        arena.begin()
+        for part in self._parts:
+            if len(part) < rtypes.SOCKET_BLOCK_SIZE:
+                arena.write(part)
+            else:
+                arena.flush(write)
+                write(part)
+        arena.flush(write)
 
-    def __init__(self, commandType, fp=None):
-        if isinstance(fp, socket.socket):
-            # kwargs = {'mode': 'b'} if PY3 else {}
-            self._fp = fp
-            self._buffer = io.BytesIO()
-        elif not fp:
-            self._buffer = fp or io.BytesIO()
-            self._fp = None
-        else:
-            # expect fp to be a seekable file(-like) object:
-            self._buffer = self._fp = fp
-        self._dataSize = 0
-        self._writeHeader(commandType)
-
-    def _getRetVal(self):
-        if self._fp is self._buffer:
-            # file(-like) object - data has been written, nothing to return
-            return None
-        elif not self._fp:
-            # data has only been written into buffer, so return its value:
-            return self._buffer.getvalue()
-        else:
-            # i.e. socket: write result of _fp into socket-fp
-            self._fp.send(self._buffer.getvalue())
-            return None
-
-    def _writeHeader(self, commandType):
-        """Write main header of message for Rserve"""
-        # Set length to zero initially, will be fixed in _finalizerHeader()
-        # when msg size is determined:
-        msg_length_lower = msg_length_higher = 0
-        data_offset = 0
-        header = struct.pack('<IIII', commandType, msg_length_lower,
-                             data_offset, msg_length_higher)
+    def _messageHeader(self):
+        """
+        Create the main header of the message for Rserve. It contains the
+        size of the overall message. For message size > 2**32 the size is
+        split into two parts, the lower 32 bits are written at position 4,
+        the higher part is written at position 12 (see QAP1 docs)
+        """
         if DEBUG:
-            print('Writing header: %d bytes: %s' % (len(header), repr(header)))
-        self._buffer.write(header)
+            print('writing size of header: %2d' % self._size)
+        msg_length_lower = self._size & 0xffffffff
+        msg_length_higher = self._size >> 32
+        data_offset = 0
+        return struct.pack('<IIII', self._commandType, msg_length_lower,
+                           data_offset, msg_length_higher)
 
     def finalize(self):
-        """Finalize the message package before actually sending/wriring it out.
-        -> Set the length of the entire data package in the general message hdr
-           as number of bytes of the entire message minus the general hdr
         """
-        # Jump to end of buffer to determine its length:
-        self._buffer.seek(0, os.SEEK_END)
-        messageSize = self._buffer.tell() - rtypes.RHEADER_SIZE
-        if DEBUG:
-            print('writing size of header: %2d' % messageSize)
-        # Goto position 4 of the general Rserve package header and write the
-        # size of the overall rserve message there. For message size > 2**32
-        # the size is split into two parts, the lower 32 bits are written at
-        # position 4, the higher part is written at position 12 (see QAP1 docs)
-        bin_messageSize = struct.pack('<Q', messageSize)
-        bin_messageSize_lo = bin_messageSize[:4]
-        bin_messageSize_hi = bin_messageSize[4:]
-
-        self._buffer.seek(4)
-        self._buffer.write(bin_messageSize_lo)
-        self._buffer.write(b'\x00\x00\x00\x00')  # data offset, zero by default
-        self._buffer.write(bin_messageSize_hi)
-        return self._getRetVal()
+        Finalize the message package and send/write it out, or return it
+        if no socket or file(-like) object has been provided.
+        """
+        self._parts.insert(0, self._messageHeader())
+        if self._fp is None:
+            return b''.join(self._parts)
+        elif isinstance(self._fp, socket.socket):
+            self._writeParts(self._fp.sendall)
+        else:
+            self._writeParts(self._fp.write)
+        return None
 
-    def _writeDataHeader(self, rTypeCode, length):
-        """Write a header for either DataTypes (DT_*) or ExpressionTypes (XT_*)
+    @staticmethod
+    def _dataHeader(rTypeCode, length):
+        """Create a header for either DataTypes (DT_*) or ExpressionTypes (XT_*)
 
         According to the documentation of Rserve:
         -----------------------------------------
@@ -113,61 +220,93 @@ class RSerializer(object):
             [1]   rTypeCode
             [2-4] length of data block (lower three bytes)
             [5-8] length of data block (upper four bytes)
+        """
+        if length < rtypes.MAX_SMALL_DATA_LENGTH:
+            return struct.pack('<I', rTypeCode | (length << 8))
+        hdr = struct.pack('<BQ', rTypeCode | rtypes.XT_LARGE, length)
+        # cut-off leftover zeros at the right end of the header string:
+        return hdr[:rtypes.LARGE_DATA_HEADER_SIZE]
+
+    def _writeDataHeader(self, rTypeCode, length):
+        """Write the header of a data block whose length is known already"""
+        hdr = self._dataHeader(rTypeCode, length)
+        if DEBUG:
+            print('Writing header: %d bytes: %s' % (len(hdr), repr(hdr)))
+        self._write(hdr)
 
-        However; pyRserve is not capable of dynamic header sizes, so we will
-                 use the large header setup for all data packages no matter of
-                 their size. Simon Urbanek confirmed that this does not cause
-                 any problems with Rserve.
+    def _beginExpr(self):
         """
-        rTypeCode |= rtypes.XT_LARGE
-        hdr = struct.pack('<BQ', rTypeCode, length)
-        # cut-off leftover zeros at the right end of the header string
-        # before writing it to the buffer:
-        self._buffer.write(hdr[:rtypes.LARGE_DATA_HEADER_SIZE])
-        return rtypes.LARGE_DATA_HEADER_SIZE
+        Reserve a slot for the header of an expression whose length is not
+        known yet, return a mark to be passed to _endExpr()
+        """
+        self._parts.append(None)
+        return len(self._parts) - 1, self._size
+
+    def _endExpr(self, mark, rTypeCode):
+        """
+        Fill in the header of the expression started at 'mark' (by
+        _beginExpr()), its data is everything written since then.
+        """
+        slot, startSize = mark
+        hdr = self._dataHeader(rTypeCode, self._size - startSize)
+        self._parts[slot] = hdr
+        self._size += len(hdr)
 
     def serialize(self, o, dtTypeCode=rtypes.DT_SEXP):
         # Here the data typecode (DT_* ) of the entire message is written,
         # with its length. Then the actual data itself is written out.
         if dtTypeCode == rtypes.DT_STRING:
             paddedString = string2bytesPad4(o)
-            length = len(paddedString)
-            hdrSize = self._writeDataHeader(dtTypeCode, length)
-            self._buffer.write(paddedString)
+            self._writeDataHeader(dtTypeCode, len(paddedString))
+            self._write(paddedString)
         elif dtTypeCode == rtypes.DT_INT:
-            length = 4   # an integer is encoded as 4 bytes
-            hdrSize = self._writeDataHeader(dtTypeCode, length)
-            self._buffer.write(struct.pack('<i', o))
+            # an integer is encoded as 4 bytes
+            self._writeDataHeader(dtTypeCode, 4)
+            self._write(struct.pack('<i', o))
         elif dtTypeCode == rtypes.DT_SEXP:
-            startPos = self._buffer.tell()
-            self._buffer.write(b'\0\0\0\0\0\0\0\0')
-            length = self.serializeExpr(o)
-            self._buffer.seek(startPos)
-            hdrSize = self._writeDataHeader(dtTypeCode, length)
+            mark = self._beginExpr()
+            self.serializeExpr(o)
+            self._endExpr(mark, dtTypeCode)
         else:
             raise NotImplementedError('no support for DT-type %x' % dtTypeCode)
-        # Jump back to end of buffer to be prepared for writing more data
-        self._buffer.seek(0, os.SEEK_END)
-        # Adjust datasize counter
-        self._dataSize += length + hdrSize
+
+    @classmethod
+    def lookupSerializer(cls, pyType):
+        """
+        Return the serialization function for objects of type 'pyType',
+        which may also be a subclass of a type in serializeMap. Results are
+        cached per type.
+        """
+        try:
+            return cls.dispatchCache[pyType]
+        except KeyError:
+            pass
+        for baseType in pyType.__mro__:
+            if baseType in cls.serializeMap:
+                s_func = cls.dispatchCache[pyType] = \
+                    cls.serializeMap[baseType]
+                return s_func
+        raise NotImplementedError('Serialization of "%s" not implemented' %
+                                  pyType)
 
     def serializeExpr(self, o):
         if isinstance(o, numpy.ndarray):
-            rTypeCode = rtypes.numpyMap[o.dtype.type]
+            rTypeCode = rtypes.numpyMap.get(o.dtype.type)
+            try:
+                s_func = self.serializeMap[rTypeCode]
+            except KeyError:
+                raise NotImplementedError('Serialization of "%s" not '
+                                          'implemented' % o.dtype)
         else:
             rTypeCode = type(o)
-        try:
-            s_func = self.serializeMap[rTypeCode]
-        except KeyError:
-            raise NotImplementedError('Serialization of "%s" not implemented' %
-                                      rTypeCode)
-        startPos = self._buffer.tell()
+            s_func = self.lookupSerializer(rTypeCode)
+        startSize = self._size
         if DEBUG:
             print('Serializing expr %r with rTypeCode=%s using function %s' %
                   (o, rTypeCode, s_func))
         s_func(self, o)
         # determine and return the length of actual R expression data:
-        return self._buffer.tell() - startPos
+        return self._size - startSize
 
     @fmap(NoneType, rtypes.XT_NULL)
     def s_null(self, _):
@@ -190,14 +329,27 @@ class RSerializer(object):
         if DEBUG:
             print('Writing string: %2d bytes: %s' %
                   (length, repr(paddedString)))
-        self._buffer.write(paddedString)
+        self._write(paddedString)
+
+    @fmap(rtypes.XT_RAW, *rtypes.RAW_TYPES)
+    def s_xt_raw(self, o):
+        """Serialize bytes (or any contiguous buffer) into a raw vector"""
+        if PY3:
+            o = memoryview(o).cast('B')
+        padding = padLen4(o)
+        self._writeDataHeader(rtypes.XT_RAW, 4 + len(o) + padding)
+        self._write(struct.pack('<i', len(o)))
+        self._write(o)
+        self._write(padding * b'\0')
 
     # ############### Arrays #########################################
 
-    def __s_write_xt_array_tag_data(self, o):
+    def __s_write_xt_array_tag_data(self, o, rTypeCode=None):
         """
         Write tag data of an array, like dimension for a multi-dim array,
-        or other information found. Return appropriate rTypeCode.
+        or other information found. Return appropriate rTypeCode, which is
+        derived from the array's dtype if not given. The array's header
+        must have been reserved with _beginExpr() before.
         """
         xt_tag_list = []
         if o.ndim > 1:
@@ -206,26 +358,22 @@ class RSerializer(object):
             xt_tag_list.append((b'names', numpy.array(o.attr)))
 
         attrFlag = rtypes.XT_HAS_ATTR if xt_tag_list else 0
-        rTypeCode = rtypes.numpyMap[o.dtype.type] | attrFlag
-        # write length of zero for now, will be corrected later:
-        self._writeDataHeader(rTypeCode, 0)
+        if rTypeCode is None:
+            rTypeCode = rtypes.numpyMap[o.dtype.type]
+        rTypeCode |= attrFlag
         if attrFlag:
             self.s_xt_tag_list(xt_tag_list)
         return rTypeCode
 
-    def __s_update_xt_array_header(self, headerPos, rTypeCode):
+    @staticmethod
+    def __s_array_data(o):
         """
-        Update length information of xt array header which has been
-        previously temporarily set to 0 in __s_write_xt_array_tag_data()
-        @arg headerPos: file position where header information should be
-                        written.
-        @arg rTypeCode
+        Return the data of array 'o' as 1-d uint8 array in Fortran order (as
+        expected by R), without copying it if it is stored that way already
         """
-        # subtract length of data header (8 bytes), does not count to payload!
-        length = self._buffer.tell() - headerPos - rtypes.LARGE_DATA_HEADER_SIZE
-        self._buffer.seek(headerPos)
-        self._writeDataHeader(rTypeCode, length)
-        self._buffer.seek(0, os.SEEK_END)
+        # TODO: make this also work on big endian machines (data must be
+        #       written in little-endian!!)
+        return numpy.asarray(o).ravel(order='F').view(numpy.uint8)
 
     @fmap(*rtypes.STRING_TYPES)
     def s_xt_array_single_str(self, o):
@@ -235,14 +383,16 @@ class RSerializer(object):
 
     @fmap(rtypes.XT_ARRAY_STR)
     def s_xt_array_str(self, o):
-        """Serialize array of strings"""
-        startPos = self._buffer.tell()
-        rTypeCode = self.__s_write_xt_array_tag_data(o)
+        """
+        Serialize array of strings, in object arrays None stands for NA
+        """
+        mark = self._beginExpr()
+        rTypeCode = self.__s_write_xt_array_tag_data(o, rtypes.XT_ARRAY_STR)
 
         # reshape into 1d array:
         o1d = o.reshape(o.size, order='F')
         # Byte-encode them:
-        bo = [byteEncode(d) for d in o1d]
+        bo = [b'\xff' if d is None else byteEncode(d) for d in o1d]
         # add empty string to that the following join with \0 adds an
         # additional zero at the end of the last string!
         bo.append(b'')
@@ -250,11 +400,11 @@ class RSerializer(object):
         nullTerminatedStrings = b'\0'.join(bo)
 
         padLength = padLen4(nullTerminatedStrings)
-        self._buffer.write(nullTerminatedStrings)
-        self._buffer.write(b'\1\1\1\1'[:padLength])
+        self._write(nullTerminatedStrings)
+        self._write(b'\1\1\1\1'[:padLength])
 
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+        # Fill in the array header:
+        self._endExpr(mark, rTypeCode)
 
     @fmap(bool, numpy.bool_)
     def s_atom_to_xt_array_boolean(self, o):
@@ -270,35 +420,38 @@ class RSerializer(object):
     @fmap(rtypes.XT_ARRAY_BOOL)
     def s_xt_array_boolean(self, o):
         """
-        - o: numpy array or subclass (e.g. TaggedArray) with boolean values
+        - o: numpy array or subclass (e.g. TaggedArray) with boolean values,
+             or int8 array with BOOL_NA for NA values
         Note: If o is multi-dimensional a tagged array is created. Also if o
               is of type TaggedArray.
         """
-        startPos = self._buffer.tell()
-        rTypeCode = self.__s_write_xt_array_tag_data(o)
+        mark = self._beginExpr()
+        rTypeCode = self.__s_write_xt_array_tag_data(o, rtypes.XT_ARRAY_BOOL)
 
         # A boolean vector starts with its number of boolean values in the
         # vector (as int32):
         structCode = '<'+rtypes.structMap[int]
-        self._buffer.write(struct.pack(structCode, o.size))
+        self._write(struct.pack(structCode, o.size))
         # Then write the boolean values themselves. Note that R expects binary
         # array data in Fortran order, so prepare this accordingly:
-        data = o.tobytes(order='F')
-        self._buffer.write(data)
+        data = self.__s_array_data(o)
+        self._write(data)
         # Finally pad the binary data to be of a multiple of four in length:
-        self._buffer.write(padLen4(data) * b'\xff')
+        self._write(padLen4(data) * b'\xff')
 
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+        # Fill in the array header:
+        self._endExpr(mark, rTypeCode)
 
-    @fmap(int, numpy.int32, long, numpy.int64, numpy.compat.long, float, complex,
-          numpy.float64, numpy.complex64, numpy.complex128)
+    @fmap(int, long, float, complex, numpy.integer, numpy.floating,
+          numpy.complexfloating)
     def s_atom_to_xt_array_numeric(self, o):
         """
         Render single numeric items into their corresponding array counterpart
         in R
         """
-        if isinstance(o, (int, long, numpy.int64, numpy.compat.long)):
+        # reduce subclasses (e.g. IntEnum) and numpy scalars of any precision
+        # to the Python types R's numeric vectors correspond to:
+        if isinstance(o, (int, long, numpy.integer)):
             if rtypes.MIN_INT32 <= o <= rtypes.MAX_INT32:
                 # even though this type of data is 'long' it still fits into a
                 # normal integer. Good!
@@ -306,17 +459,21 @@ class RSerializer(object):
             else:
                 raise ValueError('Cannot serialize long integers larger than '
                                  'MAX_INT32 (**31-1)')
+        elif isinstance(o, (float, numpy.floating)):
+            o = float(o)
+        else:
+            o = complex(o)
 
         rTypeCode = rtypes.atom2ArrMap[type(o)]
         structCode = '<'+rtypes.structMap[type(o)]
         length = struct.calcsize(structCode)
         if type(o) is complex:
             self._writeDataHeader(rTypeCode, length*2)
-            self._buffer.write(struct.pack(structCode, o.real))
-            self._buffer.write(struct.pack(structCode, o.imag))
+            self._write(struct.pack(structCode, o.real))
+            self._write(struct.pack(structCode, o.imag))
         else:
             self._writeDataHeader(rTypeCode, length)
-            self._buffer.write(struct.pack(structCode, o))
+            self._write(struct.pack(structCode, o))
 
     @fmap(rtypes.XT_ARRAY_CPLX, rtypes.XT_ARRAY_DOUBLE, rtypes.XT_ARRAY_INT)
     def s_xt_array_numeric(self, o):
@@ -329,101 +486,203 @@ class RSerializer(object):
             # Note: use int instead of compat.long once Py2 is abandoned.
             if rtypes.MIN_INT32 <= o.min() and o.max() <= rtypes.MAX_INT32:
                 # even though this type of array is 'long' its values still
-                # fit into a normal int32 array. Good!
-                o = o.astype(numpy.int32)
+                # fit into a normal int32 array. Good! (copies don't keep
+                # the tags of a TaggedArray, see there)
+                converted = o.astype(numpy.int32)
+                if isinstance(o, TaggedArray):
+                    converted.attr = o.attr
+                o = converted
             else:
                 raise ValueError('Cannot serialize long integer arrays with '
                                  'values outside MAX_INT32 (2**31-1) range')
 
-        startPos = self._buffer.tell()
+        mark = self._beginExpr()
         rTypeCode = self.__s_write_xt_array_tag_data(o)
 
-        # TODO: make this also work on big endian machines (data must be
-        #       written in little-endian!!)
-
         # Note: R expects binary array data in Fortran order, so prepare this
         # accordingly:
-        self._buffer.write(o.tobytes(order='F'))
+        self._write(self.__s_array_data(o))
 
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+        # Fill in the array header:
+        self._endExpr(mark, rTypeCode)
 
     # ############## Vectors and Tag lists ####################################
 
-    @fmap(list, TaggedList)
+    def _vectorizeList(self, o):
+        """
+        Send list 'o' as a typed R vector if all its items are bools, ints,
+        floats, complex numbers or strings (None items become NA). Numbers
+        of different types are converted into the most general one among
+        them. Return False if 'o' is not homogeneous.
+        """
+        itemTypes = set(map(type, o))
+        hasNA = NoneType in itemTypes
+        itemTypes.discard(NoneType)
+        if not itemTypes:
+            return False
+        isNA = None
+        if hasNA:
+            objArr = numpy.array(o, dtype=object)
+            isNA = numpy.equal(objArr, None)
+        if itemTypes == {bool}:
+            if hasNA:
+                objArr[isNA] = rtypes.BOOL_NA
+                self.s_xt_array_boolean(objArr.astype(numpy.int8))
+            else:
+                self.s_xt_array_boolean(numpy.array(o, dtype=numpy.bool_))
+        elif itemTypes <= {int, long}:
+            if hasNA:
+                objArr[isNA] = 0
+            try:
+                arr = numpy.array(objArr if hasNA else o, dtype=numpy.int64)
+            except OverflowError:
+                return False
+            if arr.min() < rtypes.MIN_INT32 or arr.max() > rtypes.MAX_INT32:
+                # leave it to serialization of single items to complain
+                return False
+            arr = arr.astype(numpy.int32)
+            if hasNA:
+                arr[isNA] = rtypes.NA_INTEGER
+            self.s_xt_array_numeric(arr)
+        elif itemTypes <= {int, long, float, complex}:
+            dtype = numpy.complex128 if complex in itemTypes else \
+                numpy.float64
+            # None items become NaN here, R's NA is a particular NaN:
+            arr = numpy.array(o, dtype=dtype)
+            if hasNA:
+                arr.view(numpy.int64).reshape(len(o), -1)[isNA] = \
+                    rtypes.NA_REAL_BITS
+            self.s_xt_array_numeric(arr)
+        elif itemTypes <= set(rtypes.STRING_TYPES):
+            self.s_xt_array_str(objArr if hasNA else numpy.array(o))
+        else:
+            return False
+        return True
+
+    @fmap(list, tuple, dict, TaggedList)
     def s_xt_vector(self, o):
-        """Render all objects of given python list into generic r vector"""
-        startPos = self._buffer.tell()
-        # remember start position for calculating length in bytes of entire
-        # list content
-        attrFlag = rtypes.XT_HAS_ATTR if o.__class__ == TaggedList else 0
-        self._writeDataHeader(rtypes.XT_VECTOR | attrFlag, 0)
+        """
+        Render all objects of given python list (or tuple) into generic r
+        vector. Items of TaggedLists and dicts are named by their keys.
+        """
+        if self.vectorize and isinstance(o, (list, tuple)) and \
+                self._vectorizeList(o):
+            return
+        mark = self._beginExpr()
+        if isinstance(o, TaggedList):
+            names, values = o.keys, o.values
+        elif isinstance(o, dict):
+            names, values = [str(k) for k in o], o.values()
+        else:
+            names, values = None, o
+        attrFlag = rtypes.XT_HAS_ATTR if names is not None else 0
         if attrFlag:
-            self.s_xt_tag_list([(b'names', numpy.array(o.keys))])
-        for v in o:
+            self.s_xt_tag_list([(b'names', numpy.array(names))])
+        for v in values:
             self.serializeExpr(v)
-        length = self._buffer.tell() - startPos
-        self._buffer.seek(startPos)
-        # now write header again with correct length information
-        # subtract length of list data header:
-        self._writeDataHeader(rtypes.XT_VECTOR | attrFlag,
-                              length - rtypes.LARGE_DATA_HEADER_SIZE)
-        self._buffer.seek(0, os.SEEK_END)
+        # now the header can be written with correct length information:
+        self._endExpr(mark, rtypes.XT_VECTOR | attrFlag)
 
     def s_xt_tag_list(self, o):
-        startPos = self._buffer.tell()
-        self._writeDataHeader(rtypes.XT_LIST_TAG, 0)
+        mark = self._beginExpr()
         for tag, data in o:
             self.serializeExpr(data)
             self.s_string_or_symbol(tag, rTypeCode=rtypes.XT_SYMNAME)
-        length = self._buffer.tell() - startPos
-        self._buffer.seek(startPos)
-        # now write header again with correct length information
-        # subtract length of list data header:
-        self._writeDataHeader(rtypes.XT_LIST_TAG,
-                              length - rtypes.LARGE_DATA_HEADER_SIZE)
-        self._buffer.seek(0, os.SEEK_END)
+        self._endExpr(mark, rtypes.XT_LIST_TAG)
 
     # ##########################################################
     # ### class methods for calling specific Rserv functions ###
 
     @classmethod
-    def rEval(cls, aString, fp=None, void=False):
+    def rEval(cls, aString, fp=None, void=False, arena=None):
         """
         Create binary code for evaluating a string expression remotely in
         Rserve
         """
         cmd = rtypes.CMD_voidEval if void else rtypes.CMD_eval
-        s = cls(cmd, fp=fp)
+        s = cls(cmd, fp=fp, arena=arena)
         s.serialize(aString, dtTypeCode=rtypes.DT_STRING)
         return s.finalize()
 
     @classmethod
-    def rAssign(cls, varname, o, fp=None):
+    def rAssign(cls, varname, o, fp=None, vectorize=False, arena=None):
         """
         Create binary code for assigning an expression to a variable remotely
         in Rserve
         """
-        s = cls(rtypes.CMD_setSEXP, fp=fp)
+        s = cls(rtypes.CMD_setSEXP, fp=fp, vectorize=vectorize, arena=arena)
         s.serialize(varname, dtTypeCode=rtypes.DT_STRING)
         s.serialize(o, dtTypeCode=rtypes.DT_SEXP)
         return s.finalize()
 
+    @classmethod
+    def rSetBufferSize(cls, size, fp=None, arena=None):
+        """
+        Create binary code for requesting a send buffer of 'size' bytes
+        from Rserve
+        """
+        s = cls(rtypes.CMD_setBufferSize, fp=fp, arena=arena)
+        s.serialize(size, dtTypeCode=rtypes.DT_INT)
+        return s.finalize()
+
+    @classmethod
+    def rSerEval(cls, data, fp=None, arena=None):
+        """
+        Create binary code for evaluating an R object given in R's
+        serialization format ('data'), e.g. a function call
+        """
+        s = cls(rtypes.CMD_serEval, fp=fp, arena=arena)
+        # the serialized data is sent without data header:
+        s._write(data)
+        return s.finalize()
+
+    @classmethod
+    def rSerAssign(cls, data, fp=None, arena=None):
+        """
+        Create binary code for an assignment, 'data' is list(name, value)
+        in R's serialization format
+        """
+        s = cls(rtypes.CMD_serAssign, fp=fp, arena=arena)
+        s._write(data)
+        return s.finalize()
+
     @classmethod
     def rShutdown(cls, fp=None):
         s = cls(rtypes.CMD_shutdown, fp=fp)
         return s.finalize()
 
     @classmethod
-    def rSerializeResponse(cls, Rexp, fp=None):
+    def serializedSize(cls, o, vectorize=False):
+        """Return the number of bytes 'o' takes as R expression in a message"""
+        s = cls(rtypes.RESP_OK, vectorize=vectorize)
+        return s.serializeExpr(o)
+
+    @classmethod
+    def rSerializeResponse(cls, Rexp, fp=None, vectorize=False, arena=None):
         # mainly used for unittesting
-        s = cls(rtypes.RESP_OK, fp=fp)
+        s = cls(rtypes.RESP_OK, fp=fp, vectorize=vectorize, arena=arena)
         s.serialize(Rexp, dtTypeCode=rtypes.DT_SEXP)
         return s.finalize()
 
 
+def registerSerializer(pyType, func):
+    """
+    Serialize objects of 'pyType' (and its subclasses) by sending
+    'func(obj)' to R instead, e.g. registerSerializer(decimal.Decimal, float).
+    Registered types take precedence over the built-in ones they inherit
+    from.
+    """
+    def s_func(self, o):
+        self.serializeExpr(func(o))
+    RSerializer.serializeMap[pyType] = s_func
+    RSerializer.dispatchCache.clear()
+
+
 # Some shortcuts:
 rEval = RSerializer.rEval
 rAssign = RSerializer.rAssign
 rSerializeResponse = RSerializer.rSerializeResponse
 rShutdown = RSerializer.rShutdown
+rSetBufferSize = RSerializer.rSetBufferSize
+rSerEval = RSerializer.rSerEval
+rSerAssign = RSerializer.rSerAssign
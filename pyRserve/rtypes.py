@@ -17,6 +17,8 @@ RHEADER_SIZE = 16
 # Header sizes (in SEXPR) without and with XT_LARGE or DT_LARGE flag [bytes]
 SMALL_DATA_HEADER_SIZE = 4
 LARGE_DATA_HEADER_SIZE = 8
+# Data blocks from this length on need a large header:
+MAX_SMALL_DATA_LENGTH = 0xfffff0
 
 
 CMD_RESP = 0x10000            # all responses have this flag set
@@ -144,6 +146,11 @@ CMD_setBufferSize   = 0x081   # [int sendBufSize]
                               #     transported from Rserve to the client.
                               #     (incoming buffer is resized automatically)
 
+# Rserve's initial size of its send buffer, and the smallest size it accepts
+# for CMD_setBufferSize [bytes]:
+DEFAULT_SEND_BUFFER_SIZE = 2 * 1024 * 1024
+MIN_SEND_BUFFER_SIZE     = 32 * 1024
+
 CMD_setEncoding     = 0x082   # string (one of "native","latin1","utf8")
 
 # special commands - the payload of packages with this mask does not contain
@@ -260,6 +267,11 @@ BOOL_TRUE = 1
 BOOL_FALSE = 0
 BOOL_NA = 2
 
+# R's NA values of integer and double vectors (the latter being a NaN with a
+# particular bit pattern):
+NA_INTEGER = -2**31
+NA_REAL_BITS = 0x7FF00000000007A2
+
 VALID_R_TYPES = [
     DT_SEXP, XT_BOOL, XT_INT, XT_DOUBLE, XT_STR, XT_SYMNAME, XT_VECTOR,
     XT_LIST_TAG, XT_LANG_TAG, XT_LIST_NOTAG, XT_LANG_NOTAG, XT_CLOS,
@@ -271,6 +283,9 @@ STRING_TYPES = [str, numpy.string_, numpy.str_]
 if not PY3:
     STRING_TYPES.append(unicode)  # noqa: F821      'unicode' unknown in Python3
 
+# Python types serialized as raw vectors (in Python 2 'bytes' is a string):
+RAW_TYPES = [bytes, bytearray, memoryview] if PY3 else [bytearray]
+
 ###############################################################################
 # Mapping btw. numpy and R data types, in both directions
 
@@ -335,3 +350,43 @@ atom2ArrMap = {
     numpy.unicode_:    XT_ARRAY_STR,
     bool:              XT_ARRAY_BOOL,
 }
+
+
+# map results of R's typeof() function to numpy dtypes used for preallocating
+# arrays when transferring R objects in chunks:
+typeofMap = {
+    'logical':   numpy.bool_,
+    'integer':   numpy.int32,
+    'double':    numpy.double,
+    'complex':   numpy.complex128,
+    'character': object,
+}
+
+# map numpy dtype kinds to R vector modes, used for preallocating vectors in
+# R when uploading arrays in chunks:
+kind2ModeMap = {
+    'b': 'logical',
+    'i': 'integer',
+    'u': 'integer',
+    'f': 'double',
+    'c': 'complex',
+    'U': 'character',
+    'S': 'character',
+}
+
+# numpy types chunks are converted into before uploading them into vectors
+# of the given R mode, if they cannot be serialized as they are:
+mode2DtypeMap = {
+    'logical': numpy.bool_,
+    'integer': numpy.int32,
+    'double':  numpy.double,
+    'complex': numpy.complex128,
+}
+
+# map numpy scalar types to R's readBin()/writeBin() modes, used for
+# transferring arrays through files when Rserve runs on the same host:
+readBinMap = {
+    numpy.double: 'double',
+    numpy.int32: 'integer',
+    numpy.complex128: 'complex',
+}
@@ -0,0 +1,163 @@
+"""
+Hand results obtained from R over to other processes without copying their
+arrays: toShared() moves all numpy arrays of a result into one block of shared
+memory and returns a small, picklable SharedResult handle. Other processes
+(e.g. workers of a concurrent.futures.ProcessPoolExecutor) call attach() on
+the handle to obtain the result with arrays directly mapped from the shared
+memory block.
+
+Example:
+    handle = toShared(conn.r('list(a=rnorm(1e7), b=1:10)'))
+    executor.submit(work, handle)    # work() calls handle.attach()
+    ...
+    handle.unlink()                  # when all workers are done
+
+Requires Python 3.8 or newer.
+"""
+import os
+###
+import numpy
+
+from .taggedContainers import TaggedList, AttrArray
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+# arrays are placed at offsets being multiples of this number of bytes:
+ALIGNMENT = 64
+
+# shared memory blocks attached to, by process id and name. They are kept open
+# until SharedResult.close() is called, independently of the lifetime of
+# handles (which may be unpickled several times). Blocks inherited by forked
+# processes are not reused, arrays of the parent might still refer to them:
+_attached = {}
+
+
+class _SharedArray(object):
+    """Placeholder for an array in the shared memory block"""
+    def __init__(self, arr):
+        self.offset = None
+        self.shape = arr.shape
+        self.dtype = arr.dtype
+        self.order = 'F' if arr.flags.f_contiguous and \
+            not arr.flags.c_contiguous else 'C'
+        # subclasses like numpy.memmap are not retained, AttrArrays are:
+        self.cls = arr.__class__ if isinstance(arr, AttrArray) \
+            else numpy.ndarray
+        self.attributes = arr._pickledAttributes() \
+            if isinstance(arr, AttrArray) else {}
+
+    def view(self, buf):
+        # numpy.frombuffer() holds a buffer export, so the memory block cannot
+        # be unmapped while the array exists:
+        raw = numpy.frombuffer(buf, dtype=numpy.uint8, offset=self.offset,
+                               count=self.dtype.itemsize *
+                               int(numpy.prod(self.shape)))
+        arr = raw.view(self.dtype).reshape(self.shape, order=self.order)
+        if self.cls is not numpy.ndarray:
+            arr = arr.view(self.cls)
+            arr.__dict__.update(self.attributes)
+        return arr
+
+
+class SharedResult(object):
+    """
+    Picklable handle to a result whose arrays are stored in a shared memory
+    block (see toShared()). Only the structure of the result and its
+    non-array items are pickled along with the handle.
+    """
+    def __init__(self, name, skeleton):
+        self.name = name
+        self.skeleton = skeleton
+
+    def _sharedMemory(self):
+        key = (os.getpid(), self.name)
+        if key not in _attached:
+            try:
+                # Python >= 3.13: the creating process is responsible for
+                # removing the memory block, not the ones attaching to it
+                shm = shared_memory.SharedMemory(name=self.name, track=False)
+            except TypeError:
+                shm = shared_memory.SharedMemory(name=self.name)
+            _attached[key] = shm
+        return _attached[key]
+
+    def attach(self):
+        """
+        Return the result, its arrays share their memory with the result
+        of all other processes attached to the same memory block.
+        """
+        return _replace(self.skeleton, self._sharedMemory().buf)
+
+    def close(self):
+        """
+        Detach this process from the shared memory block. Raises BufferError
+        if arrays obtained via attach() are still in use.
+        """
+        key = (os.getpid(), self.name)
+        shm = _attached.get(key)
+        if shm is not None:
+            shm.close()
+            del _attached[key]
+
+    def unlink(self):
+        """Release the shared memory block, should be called once by the
+        process which has created it after all others have finished"""
+        shm = self._sharedMemory()
+        self.close()
+        shm.unlink()
+
+
+def _extract(o, placeholders):
+    """Copy the structure of 'o' replacing its arrays by placeholders"""
+    if isinstance(o, numpy.ndarray) and not o.dtype.hasobject:
+        placeholder = _SharedArray(o)
+        placeholders.append((placeholder, o))
+        return placeholder
+    elif isinstance(o, TaggedList):
+        return TaggedList.new([_extract(v, placeholders) for v in o.values],
+                              o.keys)
+    elif isinstance(o, (list, tuple)):
+        return o.__class__(_extract(v, placeholders) for v in o)
+    elif isinstance(o, dict):
+        return o.__class__((k, _extract(v, placeholders))
+                           for k, v in o.items())
+    return o
+
+
+def _replace(o, buf):
+    """Replace placeholders in 'o' by arrays mapped from 'buf'"""
+    if isinstance(o, _SharedArray):
+        return o.view(buf)
+    elif isinstance(o, TaggedList):
+        return TaggedList.new([_replace(v, buf) for v in o.values], o.keys)
+    elif isinstance(o, (list, tuple)):
+        return o.__class__(_replace(v, buf) for v in o)
+    elif isinstance(o, dict):
+        return o.__class__((k, _replace(v, buf)) for k, v in o.items())
+    return o
+
+
+def toShared(result):
+    """
+    Copy all numpy arrays (except object arrays) contained in 'result' -
+    which can be an array or a (nested) list, tuple, dict or TaggedList -
+    into a new shared memory block. Returns a SharedResult handle.
+    """
+    if shared_memory is None:
+        raise NotImplementedError('Shared memory requires Python 3.8')
+    placeholders = []
+    skeleton = _extract(result, placeholders)
+    size = 0
+    for placeholder, arr in placeholders:
+        placeholder.offset = size
+        size += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+    # a memory block cannot be empty:
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    _attached[(os.getpid(), shm.name)] = shm
+    for placeholder, arr in placeholders:
+        placeholder.view(shm.buf)[...] = arr
+    return SharedResult(shm.name, skeleton)
@@ -10,6 +10,12 @@ Available classes:
 """
 import numpy
 
+try:
+    from pickle import PickleBuffer
+except ImportError:
+    # Python < 3.8, no out-of-band pickling
+    PickleBuffer = None
+
 
 class TaggedList(object):
     # This code is mainly based on UserList.UserList and modified for tags
@@ -35,7 +41,13 @@ class TaggedList(object):
 
     l.append(y=3)
     l[-1]    # returns 3
+
+    Lookups by key use a dictionary mapping each key to the position of its
+    first item. It is built on the first lookup and dropped whenever items
+    are added or removed.
     """
+    __slots__ = ('values', 'keys', '_index')
+
     def __init__(self, initlist=()):
         """
         Items in initlist can either be
@@ -45,6 +57,7 @@ class TaggedList(object):
         """
         self.values = []
         self.keys = []
+        self._index = None
         for idx, item in enumerate(initlist):
             try:
                 key, value = item
@@ -56,6 +69,41 @@ class TaggedList(object):
             self.values.append(value)
             self.keys.append(key)
 
+    @classmethod
+    def new(cls, values, keys):
+        """
+        Factory method to create TaggedList objects from separate sequences
+        of values and keys, which is much faster than passing (key, value)
+        tuples to __init__(). Empty strings as keys are converted into None.
+        Usage:
+            TaggedList.new([1, 2, 3], ['v1', 'v2', None])
+        """
+        if len(keys) != len(values):
+            raise ValueError('Number of keys must match number of values')
+        taggedList = cls()
+        taggedList.values = list(values)
+        taggedList.keys = [None if key == '' else key for key in keys]
+        return taggedList
+
+    def _keyIndex(self, key):
+        """Return the position of the first item with the given key"""
+        for _ in range(2):
+            if self._index is None:
+                # iterate backwards so that the first position of duplicate
+                # keys ends up in the dictionary:
+                numKeys = len(self.keys)
+                self._index = dict(zip(reversed(self.keys),
+                                       range(numKeys - 1, -1, -1)))
+            idx = self._index.get(key)
+            if idx is None:
+                raise ValueError('No key "%s" available in list' % key)
+            # self.keys may have been modified directly, so make sure the
+            # dictionary is still valid, otherwise rebuild it once:
+            if idx < len(self.keys) and self.keys[idx] == key:
+                return idx
+            self._index = None
+        raise ValueError('No key "%s" available in list' % key)
+
     def astuples(self):
         """
         Convert a TaggedList into a representation suitable to be provided
@@ -81,10 +129,14 @@ class TaggedList(object):
     #        return cmp(self.values, self.__cast(other))
     __hash__ = None  # Mutable sequence, so not hashable
 
+    def __reduce__(self):
+        # pickle keys and values as two lists, the index is rebuilt lazily
+        return self.__class__.new, (self.values, self.keys)
+
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
-        return self.__dict__ == other.__dict__
+        return self.keys == other.keys and self.values == other.values
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -96,20 +148,21 @@ class TaggedList(object):
         return len(self.values)
 
     def __getitem__(self, i):
-        if type(i) == str:
-            i = self.keys.index(i)
+        if isinstance(i, str):
+            i = self._keyIndex(i)
         return self.values[i]
 
     def __setitem__(self, i, item):
-        if type(i) == str:
-            i = self.keys.index[i]
+        if isinstance(i, str):
+            i = self._keyIndex(i)
         self.values[i] = item
 
     def __delitem__(self, i):
-        if type(i) == str:
-            i = self.keys.index[i]
-            del self.keys[i]
+        if isinstance(i, str):
+            i = self._keyIndex(i)
+        del self.keys[i]
         del self.values[i]
+        self._index = None
 
     def __getslice__(self, i, j):
         i = max(i, 0)
@@ -187,6 +240,9 @@ class TaggedList(object):
                              "of key/value is allowed")
         self.values.append(value)
         self.keys.append(key)
+        if self._index is not None:
+            # appending does not move other items, just add a new key:
+            self._index.setdefault(key, len(self.keys) - 1)
 
     def insert(self, i, *value, **key_and_value):
         """
@@ -207,6 +263,7 @@ class TaggedList(object):
                              "of key/value is allowed")
         self.values.insert(i, value)
         self.keys.insert(i, key)
+        self._index = None
 
     def pop(self, i=-1):
         """
@@ -214,6 +271,8 @@ class TaggedList(object):
         If an item at a specific position should be removed, pass an additional
         index arguemnt.
         """
+        self.keys.pop(i)
+        self._index = None
         return self.values.pop(i)
 
     def remove(self, item):
@@ -229,6 +288,7 @@ class TaggedList(object):
     def reverse(self):
         self.values.reverse()
         self.keys.reverse()
+        self._index = None
 
     def sort(self, *args, **kwds):
         raise NotImplementedError()
@@ -255,6 +315,34 @@ class AttrArray(numpy.ndarray):
             return r[:-1] + ', attr=' + repr(self.attr) + ')'
         return r
 
+    def _pickledAttributes(self):
+        # caches (like TaggedArray._index) are not pickled
+        return dict((key, value) for key, value in self.__dict__.items()
+                    if key != '_index')
+
+    def __reduce__(self):
+        # numpy only pickles the array itself, add 'attr' & co to its state:
+        reconstruct, args, state = super(AttrArray, self).__reduce__()
+        return reconstruct, args, (state, self._pickledAttributes())
+
+    def __reduce_ex__(self, protocol):
+        if protocol < 5 or PickleBuffer is None or self.dtype.hasobject or \
+                not (self.flags.c_contiguous or self.flags.f_contiguous):
+            return self.__reduce__()
+        # With pickle protocol 5 the data buffer is passed on without being
+        # copied (numpy only does this for plain ndarrays):
+        order = 'C' if self.flags.c_contiguous else 'F'
+        return _rebuildAttrArray, (self.__class__,
+                                   PickleBuffer(self.view(numpy.ndarray)),
+                                   self.dtype, self.shape, order,
+                                   self._pickledAttributes())
+
+    def __setstate__(self, state):
+        if len(state) == 2 and isinstance(state[1], dict):
+            state, attributes = state
+            self.__dict__.update(attributes)
+        super(AttrArray, self).__setstate__(state)
+
     @classmethod
     def new(cls, data, attr):
         """
@@ -275,6 +363,14 @@ class AttrArray(numpy.ndarray):
         return attrArr
 
 
+def _rebuildAttrArray(cls, buf, dtype, shape, order, attributes):
+    """Unpickle an AttrArray (or subclass) pickled with protocol 5"""
+    arr = numpy.frombuffer(buf, dtype=dtype).reshape(shape, order=order)
+    arr = arr.view(cls)
+    arr.__dict__.update(attributes)
+    return arr
+
+
 def asAttrArray(data, attr):
     return AttrArray.new(data, attr)
 
@@ -300,6 +396,12 @@ class TaggedArray(AttrArray):
     l['v1']  # returns 1
     l['v2']  # returns 2  (not 4 !)
     l[3]     # returns 4
+    l[['v4', 'v1']]         # returns TaggedArray([4, 1]) with keys v4, v1
+    l[l > 2], l[1:3], ...   # select items, keeping their keys
+
+    Tags are stored as numpy array in attribute 'attr'. Lookups by name use
+    a dictionary mapping each tag to the position of its first item, built
+    on the first lookup.
 
     It is recommended not to do lots of manipulations that modify the
     structure of the arrary. This could lead to mismatched btw. tags and
@@ -307,27 +409,86 @@ class TaggedArray(AttrArray):
     of mathematics like multiplying the array should be possible without
     problems.
     """
-    attr = []
+    attr = numpy.array([], dtype=object)
+    _index = None
+
+    # New arrays derived from a TaggedArray (views, copies, results of
+    # numpy.sort() etc.) don't have tags, as their items may be reordered.
+    # Only results of element-wise ufuncs keep the tags of their source, for
+    # items selected via __getitem__() the tags are selected there.
+
+    def __array_wrap__(self, out_arr, context=None, *args):
+        out = super(TaggedArray, self).__array_wrap__(out_arr, context, *args)
+        # context is only given for ufuncs called element-wise (i.e. not
+        # for reduce(), accumulate() etc.):
+        if context is not None and isinstance(out, TaggedArray) and \
+                out is not self and out.shape == self.shape:
+            out.attr = self.attr
+            out._index = self._index
+        return out
+
+    def sort(self, axis=-1, kind=None, order=None):
+        """Sort the array in-place, 1-d arrays keep the tags of their
+        items, tags of other arrays are dropped"""
+        plain = self.view(numpy.ndarray)
+        if self.ndim == 1 and len(self.attr) == len(self):
+            idx = plain.argsort(axis=axis, kind=kind, order=order)
+            plain[...] = plain[idx]
+            self.attr = self.attr[idx]
+        else:
+            plain.sort(axis=axis, kind=kind, order=order)
+            self.__dict__.pop('attr', None)
+        self._index = None
 
     def __repr__(self):
         r = super(AttrArray, self).__repr__()
         if hasattr(self, 'attr'):
-            return r[:-1] + ', key=' + repr(self.attr) + ')'
+            return r[:-1] + ', key=' + repr(list(self.attr)) + ')'
         return r
 
-    def __getitem__(self, idx_or_name):
-        try:
-            return numpy.ndarray.__getitem__(self, idx_or_name)
-        except Exception:
-            pass
+    def _nameIndex(self, name):
+        """Return the position of the first item with the given name"""
+        if self._index is None:
+            names = self.attr.tolist()
+            # iterate backwards so that the first position of duplicate
+            # names ends up in the dictionary:
+            self._index = dict(zip(reversed(names),
+                                   range(len(names) - 1, -1, -1)))
         try:
+            return self._index[name]
+        except (KeyError, TypeError):
+            raise KeyError('No key "%s" available for array' % name)
+
+    @staticmethod
+    def _isNameList(idx):
+        if isinstance(idx, numpy.ndarray):
+            return idx.dtype.kind in 'US'
+        return isinstance(idx, list) and len(idx) > 0 and \
+            all(isinstance(item, str) for item in idx)
+
+    def __getitem__(self, idx_or_name):
+        if isinstance(idx_or_name, str):
             return numpy.ndarray.__getitem__(self,
-                                             self.attr.index(idx_or_name))
-        except ValueError:
-            raise KeyError('No key "%s" available for array' % idx_or_name)
+                                             self._nameIndex(idx_or_name))
+        if self._isNameList(idx_or_name):
+            idx_or_name = numpy.array([self._nameIndex(name)
+                                       for name in idx_or_name], dtype=int)
+        data = numpy.ndarray.__getitem__(self, idx_or_name)
+        if isinstance(data, TaggedArray) and data is not self:
+            if self.ndim == 1 and data.ndim == 1 and \
+                    len(self.attr) == len(self):
+                # select the tags of the selected items:
+                data.attr = self.attr[idx_or_name]
+                data._index = None
+            elif data.shape != self.shape:
+                return data.view(numpy.ndarray)
+        return data
 
     def keys(self):
-        return self.attr[:]
+        """Return the tags of the array (as read-only numpy array)"""
+        keys = self.attr.view()
+        keys.flags.writeable = False
+        return keys
 
     @classmethod
     def new(cls, data, tags):
@@ -352,7 +513,8 @@ class TaggedArray(AttrArray):
             arr = data
 
         taggedArr = arr.view(cls)
-        taggedArr.attr = tags
+        taggedArr.attr = numpy.asarray(tags)
+        taggedArr._index = None
         return taggedArr
 
 
@@ -0,0 +1,137 @@
+"""
+unittests for coalescing concurrent evaluations with a MicroBatcher
+"""
+import threading
+###
+import pytest
+###
+from pyRserve.microBatcher import MicroBatcher, BatchStats, _rString
+from pyRserve.rexceptions import REvalError, PyRserveClosed
+
+
+class FakeConnection(object):
+    """Answers every request of a batch with its position in the batch,
+    requests containing 'stop(' fail"""
+    def __init__(self):
+        self.expressions = []
+        self.cacheClears = 0
+
+    def eval(self, expr):
+        self.expressions.append(expr)
+        requests = expr.split('tryCatch(')[1:]
+        return ['boom' if 'stop(' in req else [i]
+                for i, req in enumerate(requests)]
+
+    def clearSymbolCache(self):
+        self.cacheClears += 1
+
+
+def test_r_string():
+    assert _rString('a') == '"a"'
+    assert _rString('paste("a", \'\\n\')') == '"paste(\\"a\\", \'\\\\n\')"'
+
+
+def test_batch_stats():
+    assert BatchStats(0, 0, 0).meanBatchSize == 0
+    assert BatchStats(4, 10, 5).meanBatchSize == 2.5
+
+
+def test_requests_are_coalesced():
+    conn = FakeConnection()
+    start = threading.Event()
+    results = {}
+
+    def work(i):
+        start.wait()
+        results[i] = batcher.eval('%d + 1' % i)
+
+    with MicroBatcher(conn, window=0.5, maxItems=8) as batcher:
+        threads = [threading.Thread(target=work, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+    # all requests fit into one batch, each gets its own result:
+    assert len(conn.expressions) == 1
+    assert sorted(results.values()) == list(range(8))
+    assert batcher.stats() == BatchStats(1, 8, 8)
+    # requests may redefine names, cached symbols are forgotten:
+    assert conn.cacheClears == 1
+
+
+def test_errors_fail_their_request_only():
+    conn = FakeConnection()
+    with MicroBatcher(conn, window=0.1) as batcher:
+        futures = [batcher.submit('1'), batcher.submit('stop("x")'),
+                   batcher.submit('3')]
+        assert futures[0].result() == 0
+        with pytest.raises(REvalError):
+            futures[1].result()
+        assert futures[2].result() == 2
+
+
+def test_max_items():
+    conn = FakeConnection()
+    batcher = MicroBatcher(conn, window=10, maxItems=2)
+    futures = [batcher.submit(str(i)) for i in range(5)]
+    # full batches are evaluated without waiting for the window:
+    assert futures[1].result(timeout=5) == 1
+    batcher.close()
+    assert [f.result() for f in futures] == [0, 1, 0, 1, 0]
+    assert batcher.stats().largestBatch == 2
+    assert batcher.stats().requests == 5
+    with pytest.raises(PyRserveClosed):
+        batcher.submit('1')
+
+
+def test_unexpected_results_fail_whole_batch():
+    class ScalarConnection(FakeConnection):
+        def eval(self, expr):
+            return 1.5
+
+    with MicroBatcher(ScalarConnection(), window=0.05) as batcher:
+        futures = [batcher.submit('1'), batcher.submit('2')]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        # the batcher keeps working:
+        pytest.raises(ValueError, batcher.eval, '3')
+
+
+def test_plain_connection_fails_requests():
+    class PlainConnection(object):
+        def eval(self, expr):
+            return [[1]]
+
+    with MicroBatcher(PlainConnection()) as batcher:
+        with pytest.raises(AttributeError):
+            batcher.submit('1').result(timeout=5)
+
+
+def test_worker_errors_fail_pending_requests():
+    class BrokenBatcher(MicroBatcher):
+        def _evalBatch(self, batch):
+            raise RuntimeError('worker failed')
+
+    batcher = BrokenBatcher(FakeConnection(), window=0.05)
+    future = batcher.submit('1')
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    batcher._worker.join(5)
+    # nobody would evaluate new requests:
+    with pytest.raises(PyRserveClosed):
+        batcher.submit('2')
+    batcher.close()
+
+
+def test_connection_errors_fail_whole_batch():
+    class BrokenConnection(object):
+        def eval(self, expr):
+            raise PyRserveClosed('Connection to Rserve already closed')
+
+    with MicroBatcher(BrokenConnection()) as batcher:
+        future = batcher.submit('1')
+        with pytest.raises(PyRserveClosed):
+            future.result()
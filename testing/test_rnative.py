@@ -0,0 +1,146 @@
+"""
+unittests for R's native serialization format (module rnative)
+"""
+import struct
+###
+import numpy
+import pytest
+###
+from pyRserve import rnative, readRds, writeRds
+from pyRserve.rnative import RObject, REnvironment, RSymbol
+from pyRserve.taggedContainers import TaggedList, TaggedArray, AttrArray
+###
+from .testtools import compareArrays
+
+
+def roundtrip(o, version=3):
+    return rnative.unserialize(rnative.serialize(o, version))
+
+
+def xdr(*ints):
+    return struct.pack('>%di' % len(ints), *ints)
+
+
+def charsxp(string):
+    # CHARSXP flagged as ASCII
+    return xdr(0x40009, len(string)) + string.encode('ascii')
+
+
+HEADER_V3 = b'X\n' + xdr(3, 0x040200, 0x030500, 5) + b'UTF-8'
+
+
+def test_roundtrip_vectors():
+    res = roundtrip(numpy.array([1.5, 2.5]))
+    assert res.dtype == numpy.double
+    assert compareArrays(res, numpy.array([1.5, 2.5]))
+    res = roundtrip(numpy.arange(3, dtype=numpy.int32))
+    assert res.dtype == numpy.int32
+    assert compareArrays(res, numpy.arange(3))
+    assert compareArrays(roundtrip(numpy.array([1 + 2j])),
+                         numpy.array([1 + 2j]))
+    assert compareArrays(roundtrip(True), numpy.array([True]))
+    assert roundtrip(numpy.array([True, None], dtype=object)).tolist() == \
+        [True, None]
+    assert roundtrip(numpy.array(['a', 'xyz'])).tolist() == ['a', 'xyz']
+    assert roundtrip(numpy.array([u'\xe4', None], dtype=object)).tolist() \
+        == [u'\xe4', None]
+    assert roundtrip(b'\x00\x01') == b'\x00\x01'
+    assert roundtrip(None) is None
+    # integers beyond R's integer range become doubles:
+    assert roundtrip(2**40).dtype == numpy.double
+
+
+def test_roundtrip_arrays_with_attributes():
+    mat = numpy.arange(6.).reshape(2, 3)
+    assert compareArrays(roundtrip(mat), mat)
+
+    res = roundtrip(TaggedArray.new(numpy.array([1, 2]), ['a', 'b']))
+    assert isinstance(res, TaggedArray)
+    assert res['b'] == 2
+
+    factor = AttrArray.new(numpy.array([1, 2, 1], dtype=numpy.int32),
+                           {'levels': numpy.array(['x', 'y']),
+                            'class': numpy.array(['factor'])})
+    res = roundtrip(factor)
+    assert isinstance(res, AttrArray)
+    assert res.attr['levels'].tolist() == ['x', 'y']
+    assert res.attr['class'].tolist() == ['factor']
+
+
+def test_roundtrip_lists():
+    res = roundtrip([1.5, 'a', [None]], version=2)
+    assert res[0] == 1.5
+    assert res[1] == 'a'
+    assert res[2] == [None]
+
+    res = roundtrip(TaggedList([('a', 1), 2]))
+    assert isinstance(res, TaggedList)
+    assert res.keys == ['a', None]
+    assert res['a'] == 1
+
+    df = RObject('list', TaggedList([('x', numpy.array([1., 2.]))]),
+                 {'class': numpy.array(['data.frame']),
+                  'row.names': numpy.array([-2147483648, -2],
+                                           dtype=numpy.int32)})
+    res = roundtrip(df)
+    assert res.rType == 'list'
+    assert res.attr['class'].tolist() == ['data.frame']
+    assert compareArrays(res.value['x'], numpy.array([1., 2.]))
+
+
+def test_roundtrip_language_and_functions():
+    call = RObject('language', [RSymbol('sum'), RSymbol('x'), True],
+                   tags=[None, None, 'na.rm'])
+    res = roundtrip(call)
+    assert res.rType == 'language'
+    assert res.value[:2] == ['sum', 'x']
+    assert isinstance(res.value[0], RSymbol)
+    assert res.tags == [None, None, 'na.rm']
+
+    env = REnvironment({'a': numpy.array([1.])})
+    # environments may refer to themselves:
+    env.bindings['self'] = env
+    formals = RObject('pairlist', [rnative.MISSING_ARG], tags=['x'])
+    func = RObject('closure', (formals, call, env))
+    res = roundtrip(func)
+    resFormals, resBody, resEnv = res.value
+    assert resFormals.tags == ['x']
+    assert resFormals.value == [rnative.MISSING_ARG]
+    assert resBody.tags == [None, None, 'na.rm']
+    assert resEnv.bindings['self'] is resEnv
+    assert resEnv.enclos is rnative.GLOBAL_ENV
+
+
+def test_unserialize_compact_sequence():
+    """R >= 3.5 serializes e.g. 1:3 as compact ALTREP sequence"""
+    data = HEADER_V3 + xdr(rnative.ALTREP_SXP) + \
+        xdr(2, 1) + charsxp('compact_intseq') + \
+        xdr(2, 1) + charsxp('base') + \
+        xdr(2, 13, 1, 13, 254) + \
+        xdr(14, 3) + struct.pack('>3d', 3, 1, 1) + xdr(254)
+    res = rnative.unserialize(data)
+    assert res.dtype == numpy.int32
+    assert compareArrays(res, numpy.array([1, 2, 3]))
+
+
+def test_unserialize_references():
+    """Repeated symbols are written as references"""
+    data = rnative.serialize(RObject('language', [RSymbol('f'),
+                                                  RSymbol('f')]))
+    assert data.count(b'\x00\x00\x00\x01f') == 1
+    assert roundtrip(RObject('pairlist', [RSymbol('f'), RSymbol('f')])) \
+        .value == ['f', 'f']
+
+
+def test_unserialize_invalid_data():
+    pytest.raises(ValueError, rnative.unserialize, b'RDX2')
+    pytest.raises(ValueError, rnative.unserialize,
+                  rnative.serialize(numpy.arange(3.))[:-4])
+
+
+@pytest.mark.parametrize('compress', [True, False, 'bzip2'])
+def test_rds_files(tmpdir, compress):
+    path = str(tmpdir.join('x.rds'))
+    writeRds(TaggedList([('a', numpy.arange(3.))]), path, compress=compress)
+    res = readRds(path)
+    assert compareArrays(res['a'], numpy.arange(3.))
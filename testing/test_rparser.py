@@ -2,15 +2,27 @@
 """
 Unittesting module for rparser
 """
+import io
+import os
+import socket
 import datetime
+import enum
+import struct
+import tempfile
+import threading
+import time
+import zlib
 ###
 import numpy
 import pytest
 ###
 from pyRserve import rtypes, rserializer, rparser
-from pyRserve.rconn import RVarProxy, OOBCallback
+from pyRserve.rconn import RConnector, RVarProxy, RFuncProxy, OOBCallback, \
+    ServerInfo, connect, connectMany
+from pyRserve.microBatcher import MicroBatcher
 from pyRserve.misc import PY3
-from pyRserve.rexceptions import REvalError
+from pyRserve.rexceptions import REvalError, RResponseError, RWarning, \
+    RConnectionRefused, RTimeoutError, RProtocolError, PyRserveClosed
 from pyRserve.taggedContainers import TaggedList, TaggedArray
 ###
 from .testtools import compareArrays
@@ -398,7 +410,7 @@ def test_tagged_array(conn):
     res = conn.r('c(a=1.,b=2.,c=3.)')
     exp_res = TaggedArray.new(numpy.array([1., 2., 3.]), ['a', 'b', 'c'])
     assert compareArrays(res, exp_res)
-    assert res.keys() == exp_res.keys()  # compare the tags of both arrays
+    assert list(res.keys()) == list(exp_res.keys())  # compare the tags
 
 
 def test_very_large_result_array(conn):
@@ -407,6 +419,682 @@ def test_very_large_result_array(conn):
     assert res.size == 9999999
 
 
+def test_fetch_chunked_vector(conn):
+    """Vectors fetched in chunks equal those fetched in one go"""
+    conn.r('chunkvec <- as.numeric(1:1000)')
+    progress = []
+    res = conn.fetchChunked('chunkvec', chunkElements=300,
+                            progress=lambda done, total:
+                            progress.append((done, total)))
+    assert compareArrays(res, conn.r.chunkvec)
+    assert progress == [(300, 1000), (600, 1000), (900, 1000), (1000, 1000)]
+
+    conn.r('chunkbools <- c(TRUE, NA, FALSE, TRUE)')
+    assert compareArrays(conn.fetchChunked('chunkbools', chunkElements=3),
+                         numpy.array([True, None, False, True]))
+
+    # 1-d arrays have a single dimension:
+    conn.r('chunkarr <- array(1:10)')
+    res = conn.fetchChunked('chunkarr', chunkElements=4)
+    assert res.shape == (10, )
+    assert compareArrays(res, numpy.arange(1, 11))
+
+
+def _offlineConnector(response):
+    """RConnector whose eval() returns 'response' as parsed from Rserve"""
+    rconn = RConnector.__new__(RConnector)
+    msg = rserializer.rSerializeResponse(response)
+    rconn.eval = lambda aString, **kw: rparser.rparse(
+        msg, atomicArray=kw.get('atomicArray', False))
+    return rconn
+
+
+def test_chunk_info_of_1d_array():
+    rconn = _offlineConnector(['integer', 10., numpy.array([10.]), False])
+    rType, length, dims, isDataFrame = rconn._chunkInfo('x')
+    assert tuple(int(d) for d in dims) == (10, )
+
+
+def test_fetch_chunked_matrix_and_data_frame(conn):
+    """Matrices are fetched by blocks of columns, data.frames by column"""
+    conn.r('chunkmat <- matrix(1:60, nrow=6)')
+    res = conn.fetchChunked('chunkmat', chunkElements=20)
+    assert res.shape == (6, 10)
+    assert compareArrays(res, conn.r.chunkmat)
+
+    conn.r('chunkdf <- data.frame(a=1:10, b=letters[1:10])')
+    res = conn.fetchChunked('chunkdf', chunkElements=4)
+    assert res.keys == ['a', 'b']
+    assert compareArrays(res['a'], numpy.arange(1, 11))
+    assert list(res['b']) == list('abcdefghij')
+
+
+def test_get_rexp_above_chunk_threshold(conn):
+    conn.r('chunkvec <- as.numeric(1:1000)')
+    conn.chunkThreshold = 100
+    try:
+        assert compareArrays(conn.getRexp('chunkvec'),
+                             numpy.arange(1, 1001, dtype=float))
+    finally:
+        conn.chunkThreshold = None
+
+
+def test_upload_chunked(conn):
+    """Arrays uploaded in chunks arrive complete and in the right shape"""
+    arr = numpy.arange(1000, dtype=float)
+    progress = []
+    assert conn.uploadChunked('chunkup', arr, chunkBytes=3000,
+                              progress=lambda done, total:
+                              progress.append(done)) == 1000
+    assert progress == [375, 750, 1000]
+    assert compareArrays(conn.r.chunkup, arr)
+
+    mat = numpy.arange(60, dtype=numpy.int32).reshape((6, 10))
+    conn.uploadChunked('chunkup', mat, chunkBytes=50)
+    res = conn.r.chunkup
+    assert res.shape == (6, 10)
+    assert compareArrays(res, mat)
+    assert conn.r('chunkup[2, 3]') == mat[1, 2]
+
+
+def test_upload_chunked_iterator_and_resume(conn):
+    chunks = [numpy.array([1.5, 2.5]), numpy.array([3.5])]
+    conn.uploadChunked('chunkup', iter(chunks), length=3)
+    assert compareArrays(conn.r.chunkup, numpy.array([1.5, 2.5, 3.5]))
+    pytest.raises(ValueError, conn.uploadChunked, 'chunkup', iter(chunks))
+
+    # resume an upload of which the first 500 items have been transferred:
+    arr = numpy.arange(1000, dtype=float)
+    conn.r('chunkup <- c(0:499, rep(-1, 500))')
+    conn.uploadChunked('chunkup', arr, chunkBytes=800, offset=500)
+    assert compareArrays(conn.r.chunkup, arr)
+
+
+def test_upload_chunked_converts_dtypes():
+    """Chunks are converted into types the serializer supports"""
+    rconn = RConnector.__new__(RConnector)
+    rconn._RConnector__closed = False
+    rconn._pendingItems = None
+    rconn._symbols = {}
+    evals, chunks = [], []
+    rconn.voidEval = evals.append
+    rconn.setRexp = lambda name, o: chunks.append(
+        (o, rserializer.rAssign(name, o)))
+
+    rconn.uploadChunked('x', numpy.arange(6, dtype=numpy.float32),
+                        chunkBytes=12)
+    assert evals[0] == 'x <- vector("double", 6)'
+    assert [c.dtype for c, _ in chunks] == [numpy.double] * 2
+    del evals[:], chunks[:]
+    rconn.uploadChunked('x', numpy.array([1, 2**32 - 1], dtype=numpy.uint32))
+    assert evals[0] == 'x <- vector("double", 2)'
+    assert chunks[0][0].tolist() == [1., 2**32 - 1.]
+    del evals[:], chunks[:]
+    rconn.uploadChunked('x', numpy.arange(3, dtype=numpy.int8))
+    assert evals[0] == 'x <- vector("integer", 3)'
+    assert chunks[0][0].dtype == numpy.int32
+
+    # unsupported types are rejected before anything is uploaded:
+    del evals[:]
+    pytest.raises(TypeError, rconn.uploadChunked, 'x',
+                  numpy.array([None, 1], dtype=object))
+    assert evals == []
+
+    # iterators must yield exactly 'length' items:
+    del evals[:]
+    pytest.raises(ValueError, rconn.uploadChunked, 'x',
+                  iter([numpy.arange(3.), numpy.arange(3.)]), length=4)
+    assert len(evals) == 2
+    pytest.raises(ValueError, rconn.uploadChunked, 'x',
+                  iter([numpy.arange(3.)]), length=4)
+
+
+def test_eval_iter(conn):
+    """Items of lists are provided one by one via an iterator"""
+    res = conn.evalIter('list(a=1, b="x", 3, c=c(1, 2))')
+    items = list(res)
+    assert [tag for tag, _ in items] == ['a', 'b', None, 'c']
+    assert items[0][1] == 1.0
+    assert items[1][1] == 'x'
+    assert compareArrays(items[3][1], numpy.array([1.0, 2.0]))
+
+    # results which are no lists are provided as single item:
+    assert list(conn.evalIter('5')) == [(None, 5.0)]
+
+
+def test_eval_iter_stopped_early(conn):
+    """Unconsumed items must not pollute the next response"""
+    res = conn.evalIter('lapply(1:1000, function(i) rep(i, 100))')
+    tag, value = next(res)
+    assert compareArrays(value, numpy.ones(100))
+    assert conn.r('1') == 1
+
+
+def test_parse_iter_closed_early():
+    """Closing the iterator consumes exactly the rest of its message"""
+    msg1 = rserializer.rSerializeResponse([1.5, 'abc', numpy.arange(3)])
+    msg2 = rserializer.rSerializeResponse(5)
+    src = io.BytesIO(msg1 + msg2)
+    items = rparser.rparseIter(src)
+    assert next(items) == (None, 1.5)
+    items.close()
+    assert rparser.rparse(src) == 5
+
+
+def test_parse_iter_closed_before_first_item():
+    """Closing an iterator which has not been started skips its message"""
+    msg1 = rserializer.rSerializeResponse([1.5, 'abc', numpy.arange(3)])
+    msg2 = rserializer.rSerializeResponse(5)
+    sender, receiver = socket.socketpair()
+    try:
+        sender.sendall(msg1 + msg2 + msg2 + msg1)
+        rparser.rparseIter(receiver).close()
+        assert rparser.rparse(receiver) == 5
+        # also for results which are not lists:
+        items = rparser.rparseIter(receiver)
+        items.close()
+        assert list(items) == []
+        assert rparser.rparse(receiver)[1] == 'abc'
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_eval_iter_timeout_closes_connection():
+    """A connection is not reused after iterating a result timed out"""
+    sender, receiver = socket.socketpair()
+    receiver.settimeout(0.1)
+    rconn = RConnector.__new__(RConnector)
+    rconn.sock = receiver
+    rconn._RConnector__closed = False
+    rconn._pendingItems = None
+    rconn._arenas = threading.local()
+    rconn.atomicArray = False
+    rconn.spillThreshold = rconn.spillDir = None
+    try:
+        msg = rserializer.rSerializeResponse([1.5, 'abc', numpy.arange(3)])
+        # the response stalls after its first item:
+        sender.sendall(msg[:40])
+        items = rconn.evalIter('x')
+        assert next(items) == (None, 1.5)
+        pytest.raises(RTimeoutError, next, items)
+        sender.sendall(msg[40:] + rserializer.rSerializeResponse(5))
+        pytest.raises(PyRserveClosed, rconn.eval, '1')
+        assert rconn.isClosed
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_parse_spilled_message():
+    """Large messages from sockets are memory-mapped from a temporary file"""
+    arr = numpy.arange(100000, dtype=float)
+    sender, receiver = socket.socketpair()
+    msg = rserializer.rSerializeResponse([arr, 'abc', 5.5]) + \
+        rserializer.rSerializeResponse(numpy.array([1.5]))
+    thread = threading.Thread(target=sender.sendall, args=(msg, ))
+    thread.start()
+    try:
+        res = rparser.rparse(receiver, spillThreshold=1000)
+        assert isinstance(res[0], numpy.memmap)
+        assert compareArrays(res[0], arr)
+        assert res[1:] == ['abc', 5.5]
+        # arrays are writable copy-on-write views:
+        res[0][0] = -1.0
+        # single element arrays are still converted into atoms:
+        assert rparser.rparse(receiver, spillThreshold=0) == 1.5
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+
+
+def test_resync_after_decode_error():
+    """After a failing message exactly its remaining data is discarded"""
+    sender, receiver = socket.socketpair()
+    msg = rserializer.rSerializeResponse(numpy.arange(100000.)) + \
+        rserializer.rSerializeResponse(['abc', 5.5])
+    thread = threading.Thread(target=sender.sendall, args=(msg, ))
+    thread.start()
+    try:
+        # the output array does not match the result:
+        pytest.raises(ValueError, rparser.rparse, receiver,
+                      out=numpy.empty(10))
+        # the next message is read correctly, even if it had not fully
+        # arrived yet when the first one was cleared:
+        assert rparser.rparse(receiver) == ['abc', 5.5]
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+
+
+def test_illegal_response_code():
+    """Messages with an invalid header are not skipped, their size is
+    not trustworthy"""
+    sender, receiver = socket.socketpair()
+    receiver.settimeout(2)
+    try:
+        sender.sendall(struct.pack('<IIII', 0x10003, 0x7fffffff, 0, 0) +
+                       b'\x00' * 12)
+        start = time.time()
+        pytest.raises(RProtocolError, rparser.rparse, receiver)
+        assert time.time() - start < 1
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_eval_spilled_response(conn):
+    conn.spillThreshold = 2**20
+    try:
+        res = conn.r('as.numeric(1:1000000)')
+        assert isinstance(res, numpy.memmap)
+        assert res[-1] == 1000000.0
+    finally:
+        conn.spillThreshold = None
+
+
+def test_parse_into_output_array():
+    """Numeric arrays can be decoded into the memory of a given array"""
+    msg = rserializer.rSerializeResponse(numpy.arange(5.0))
+    out = numpy.zeros(5)
+    res = rparser.rparse(msg, atomicArray=True, out=out)
+    assert numpy.shares_memory(res, out)
+    assert compareArrays(out, numpy.arange(5.0))
+
+    pytest.raises(ValueError, rparser.rparse, msg, out=numpy.zeros(4))
+    pytest.raises(ValueError, rparser.rparse, msg,
+                  out=numpy.zeros(5, dtype=numpy.int32))
+    msg = rserializer.rSerializeResponse(numpy.array(['a', 'b']))
+    pytest.raises(TypeError, rparser.rparse, msg, out=out)
+
+
+def test_parse_raw_vector():
+    """Padding of raw vectors is not part of the result"""
+    msg = rserializer.rSerializeResponse([b'abcde', bytearray(b'')])
+    assert rparser.rparse(msg, atomicArray=False) == [b'abcde', b'']
+
+
+def test_serialize_compact_headers():
+    """Headers are 4 bytes long unless the data exceeds 24 bits of length"""
+    msg = rserializer.rSerializeResponse(
+        TaggedList([('a', numpy.arange(6.).reshape(2, 3)),
+                    ('b', TaggedArray.new(numpy.array([1, 2]), ['x', 'y']))]))
+    dtHeader, xtHeader = struct.unpack('<II', msg[16:24])
+    assert dtHeader == rtypes.DT_SEXP | (len(msg) - 20) << 8
+    assert xtHeader == rtypes.XT_VECTOR | rtypes.XT_HAS_ATTR | \
+        (len(msg) - 24) << 8
+    res = rparser.rparse(msg)
+    assert compareArrays(res['a'], numpy.arange(6.).reshape(2, 3))
+    assert res['b']['y'] == 2
+
+    big = numpy.arange(2**21 + 4.).reshape(-1, 2)
+    msg = rserializer.rSerializeResponse([big, 'x'])
+    assert msg[16] == rtypes.DT_SEXP | rtypes.DT_LARGE
+    assert msg[24] == rtypes.XT_VECTOR | rtypes.XT_LARGE
+    res = rparser.rparse(msg)
+    assert compareArrays(res[0], big)
+    assert res[1] == 'x'
+
+
+def test_serialize_into_socket():
+    """Messages are sent in parts, without copying large arrays"""
+    arr = numpy.arange(100000.)
+    sender, receiver = socket.socketpair()
+    try:
+        thread = threading.Thread(target=rserializer.rSerializeResponse,
+                                  args=(['abc', arr], sender))
+        thread.start()
+        res = rparser.rparse(receiver)
+        thread.join()
+    finally:
+        sender.close()
+        receiver.close()
+    assert res[0] == 'abc'
+    assert compareArrays(res[1], arr)
+
+
+def test_buffer_arena():
+    arena = rserializer.BufferArena(initialSize=64)
+    chunks = []
+    msg = ['abc', numpy.arange(10.), numpy.arange(1000.)]
+    rserializer.rSerializeResponse(msg, fp=io.BytesIO(), arena=arena)
+    for _ in range(3):
+        fp = io.BytesIO()
+        rserializer.rSerializeResponse(msg, fp=fp, arena=arena)
+        chunks.append(fp.getvalue())
+    assert chunks[0] == rserializer.rSerializeResponse(msg)
+    stats = arena.stats()
+    assert stats.messages == 4
+    # large arrays are not copied into the arena, the buffer is reused:
+    assert stats.peakSize < 1000
+    assert stats.allocations == 2
+    assert stats.capacity == 128
+    # after being idle it shrinks to its initial size:
+    arena.idleTime = 0
+    rserializer.rSerializeResponse(1, fp=io.BytesIO(), arena=arena)
+    assert arena.stats().capacity == 64
+    assert arena.stats().shrinks == 1
+
+    # the arena is confined to its thread:
+    errors = []
+    thread = threading.Thread(target=lambda: errors.append(pytest.raises(
+        RuntimeError, rserializer.rSerializeResponse, 1, io.BytesIO(),
+        arena=arena)))
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_serialize_subclasses_and_native_types():
+    """Subclasses of supported types are serialized like their base type"""
+    class Color(enum.IntEnum):
+        RED = 1
+
+    class MyList(list):
+        pass
+
+    msg = rserializer.rSerializeResponse(
+        MyList([Color.RED, numpy.int16(2), numpy.float32(1.5), (1.5, 'a'),
+                memoryview(numpy.arange(2, dtype=numpy.uint8))]))
+    assert rparser.rparse(msg) == [1, 2, 1.5, [1.5, 'a'], b'\x00\x01']
+    # dicts are sent as named lists:
+    assert rserializer.rSerializeResponse({'a': 1, 'b': 'x'}) == \
+        rserializer.rSerializeResponse(TaggedList([('a', 1), ('b', 'x')]))
+
+
+def test_serialize_vectorized_lists():
+    def roundtrip(o):
+        msg = rserializer.rSerializeResponse(o, vectorize=True)
+        return rparser.rparse(msg, atomicArray=True)
+
+    res = roundtrip([1, 2.5, None])
+    assert res.dtype == numpy.float64
+    assert res[:2].tolist() == [1., 2.5]
+    # NA is a NaN with R's particular payload:
+    assert res.view(numpy.int64)[2] == rtypes.NA_REAL_BITS
+    res = roundtrip((1, None, 3))
+    assert res.tolist() == [1, rtypes.NA_INTEGER, 3]
+    assert res.dtype == numpy.int32
+    assert roundtrip(['a', None]).tolist() == ['a', None]
+    assert roundtrip([True, False]).tolist() == [True, False]
+    assert roundtrip([1j, 2]).tolist() == [1j, 2]
+    # typed vectors save the headers of single item vectors:
+    assert len(rserializer.rSerializeResponse([1.5] * 100, vectorize=True)) \
+        < len(rserializer.rSerializeResponse([1.5] * 100)) * 0.7
+    # only homogeneous lists are vectorized:
+    res = roundtrip([1.5, 'a', [1, 2]])
+    assert [item.tolist() for item in res] == [[1.5], ['a'], [1, 2]]
+
+
+def test_register_serializer_and_converter():
+    pytest.raises(NotImplementedError, rserializer.rSerializeResponse,
+                  datetime.date(2020, 1, 2))
+    rserializer.registerSerializer(datetime.date, str)
+    rparser.registerConverter(str, datetime.date.fromisoformat)
+    try:
+        msg = rserializer.rSerializeResponse([datetime.date(2020, 1, 2)])
+        assert rparser.rparse(msg) == [datetime.date(2020, 1, 2)]
+    finally:
+        del rserializer.RSerializer.serializeMap[datetime.date]
+        rserializer.RSerializer.dispatchCache.clear()
+        del rparser.RParser.converterMap[str]
+        rparser.RParser.converterCache.clear()
+
+
+def test_eval_into(conn):
+    out = numpy.zeros(6, dtype=numpy.int32)
+    res = conn.evalInto('1:6', out=out)
+    assert numpy.shares_memory(res, out)
+    assert compareArrays(out, numpy.arange(1, 7))
+
+    mat = numpy.zeros((2, 3), order='F')
+    conn.evalInto('matrix(as.numeric(1:6), nrow=2)', out=mat)
+    assert compareArrays(mat, numpy.array([[1., 3., 5.], [2., 4., 6.]]))
+
+    outs = {'a': numpy.zeros(3), 'c': numpy.zeros(2, dtype=numpy.int32)}
+    res = conn.evalInto('list(a=c(1.5, 2.5, 3.5), b="x", c=1:2)', out=outs)
+    assert res['b'] == 'x'
+    assert compareArrays(outs['a'], numpy.array([1.5, 2.5, 3.5]))
+    assert compareArrays(outs['c'], numpy.array([1, 2]))
+
+    pytest.raises(ValueError, conn.evalInto, '1:5', out=out)
+    # the connection is still usable after a mismatch:
+    assert conn.r('1') == 1
+
+
+def test_side_channel(conn):
+    conn.sideChannelThreshold = 0
+    directory = conn.sideChannelDir or tempfile.gettempdir()
+    before = set(os.listdir(directory))
+    try:
+        arr = numpy.arange(6.).reshape(2, 3)
+        conn.r.sc_arr = arr
+        assert conn.eval('sc_arr[2, 3]') == 5.
+        assert compareArrays(conn.r.sc_arr, arr)
+        conn.r.sc_int = numpy.arange(5, dtype=numpy.int32)
+        assert compareArrays(conn.r.sc_int, numpy.arange(5))
+        # other attributes than dim() require the regular transfer:
+        conn.voidEval('sc_named <- c(a=1.5, b=2.5)')
+        assert isinstance(conn.r.sc_named, TaggedArray)
+        conn.voidEval('sc_1d <- array(c(1.5, 2.5))')
+        assert compareArrays(conn.r.sc_1d, numpy.array([1.5, 2.5]))
+    finally:
+        conn.sideChannelThreshold = None
+    # no transfer files are left behind:
+    assert set(os.listdir(directory)) <= before
+
+
+def test_eval_compressed_1d_array():
+    arr = numpy.arange(10, dtype=numpy.int32)
+    rconn = _offlineConnector(['pyRserve.compressed', 'integer',
+                               numpy.array([10.]), zlib.compress(arr)])
+    rconn.linkThroughput = None
+    res = rconn._evalCompressed('array(0:9)', False, 'gzip', 0)
+    assert compareArrays(res, arr)
+    assert rconn.compressionInfo.rawBytes == arr.nbytes
+
+
+def test_get_rexp_via_file_in_one_evaluation():
+    arr = numpy.arange(10, dtype=numpy.int32)
+    evals = []
+
+    def fakeEval(aString, **kw):
+        evals.append(aString)
+        path = [part for part in aString.split('"')
+                if 'pyRserve_' in part][0]
+        if 'small' in aString:
+            return 5
+        arr.tofile(path)
+        return rparser.rparse(rserializer.rSerializeResponse(
+            ['pyRserve.sideChannel', 'integer', 10., numpy.array([10.])]))
+
+    rconn = RConnector.__new__(RConnector)
+    rconn.eval = fakeEval
+    rconn.sideChannelThreshold = 0
+    rconn.sideChannelDir = None
+    found, data = rconn._getRexpViaFile('big', returnValue=True)
+    assert found and data.shape == (10, )
+    assert compareArrays(data, arr)
+    # unsuitable objects are returned by the same evaluation:
+    assert rconn._getRexpViaFile('small', returnValue=True) == (True, 5)
+    assert len(evals) == 2
+
+
+def test_compressed_transfers(conn):
+    res = conn.eval('matrix(as.numeric(1:6), nrow=2)', compress='gzip')
+    assert compareArrays(res, numpy.array([[1., 3., 5.], [2., 4., 6.]]))
+    assert conn.compressionInfo.direction == 'download'
+    assert conn.compressionInfo.rawBytes == 48
+    # 1-d arrays have a single dimension:
+    res = conn.eval('array(as.numeric(1:6))', compress='gzip')
+    assert compareArrays(res, numpy.arange(1., 7.))
+    # other objects are transferred uncompressed:
+    assert conn.eval('"abc"', compress='gzip') == 'abc'
+    # assignments are made in the global environment:
+    conn.eval('cmp_a <- 1:3; cmp_a * 2L', compress='bzip2')
+    assert compareArrays(conn.r.cmp_a, numpy.arange(1, 4))
+
+    arr = numpy.arange(12, dtype=numpy.int32).reshape(3, 4)
+    conn.setRexp('cmp_arr', arr, compress='gzip')
+    assert conn.compressionInfo.direction == 'upload'
+    assert conn.eval('cmp_arr[3, 4]') == 11
+    assert compareArrays(conn.getRexp('cmp_arr', compress='gzip'), arr)
+
+    pytest.raises(ValueError, conn.eval, '1', compress='zip')
+
+
+def test_raw_vectors(conn):
+    assert conn.r('as.raw(c(1, 2, 255))') == b'\x01\x02\xff'
+    conn.r.raw_vec = b'abcde'
+    assert conn.r('length(raw_vec)') == 5
+    assert conn.r.raw_vec == b'abcde'
+
+
+def test_vectorize_lists(conn):
+    conn.vectorizeLists = True
+    try:
+        conn.r.x = [1.5, None, 3]
+        assert conn.eval('is.double(x) && is.na(x[2])')
+        conn.r.y = ['a', None]
+        assert conn.eval('is.character(y) && is.na(y[2])')
+    finally:
+        conn.vectorizeLists = False
+
+
+def test_get_and_assign_many(conn):
+    conn.assignMany({'am_a': numpy.arange(3.), 'am_b': 'text', 'am c': 5})
+    assert conn.eval('am_b') == 'text'
+    res = conn.getMany(['am_a', 'am_b', 'am c'])
+    assert compareArrays(res['am_a'], numpy.arange(3.))
+    assert res['am_b'] == 'text'
+    assert res['am c'] == 5
+    assert conn.getMany([]) == {}
+    pytest.raises(REvalError, conn.getMany, ['am_a', 'am_undefined'])
+    # the connection is still usable afterwards:
+    assert conn.eval('am_b') == 'text'
+
+
+def test_func_batch(conn):
+    res = conn.r.sum.batch([(1, 2), (numpy.arange(4), ), ('a', )])
+    assert res[:2] == [3, 6]
+    # failing calls don't abort the batch:
+    assert isinstance(res[2], REvalError)
+    assert 'invalid' in str(res[2])
+    # the argument sets are not left behind in R:
+    assert not conn.eval('exists("%s")' % conn.BATCH_VAR)
+
+    conn.voidEval('scale2 <- function(x, by=2) x * by')
+    argsList = [(float(i), ) for i in range(100)]
+    kwargsList = [{'by': 3}] * 100
+    res = conn.r.scale2.batch(argsList, kwargsList, chunkBytes=256)
+    assert res == [3. * i for i in range(100)]
+    assert conn.r.scale2.batch([]) == []
+
+
+def test_func_batch_enlarges_buffer(conn):
+    """Results too large for Rserve's send buffer are evaluated again,
+    the removed argument sets are sent along once more"""
+    conn.setBufferSize(rtypes.MIN_SEND_BUFFER_SIZE)
+    res = conn.r.seq_len.batch([(100000, ), (3, )])
+    assert res[0].size == 100000
+    assert res[1].tolist() == [1, 2, 3]
+    assert conn.bufferSize > rtypes.MIN_SEND_BUFFER_SIZE
+
+
+def test_assign_and_eval_retry_assigns_again():
+    rconn = RConnector.__new__(RConnector)
+    rconn.sock = io.BytesIO()
+    rconn._arenas = threading.local()
+    rconn.vectorizeLists = False
+    rconn.atomicArray = False
+    responses = [None, RResponseError('too big', rtypes.ERR_object_too_big),
+                 None, [5]]
+
+    def receiveResult(atomicArray, **kw):
+        res = responses.pop(0)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    rconn._receiveResult = receiveResult
+    rconn._enlargeBufferSize = lambda objectSize: True
+    assert rconn._assignAndEval('x', [1, 2], 'x') == [5]
+    assert responses == []
+    assign = rserializer.rAssign('x', [1, 2])
+    assert rconn.sock.getvalue().count(assign) == 2
+
+
+def test_assign_and_eval_error_message():
+    """The error message is only requested after both responses have been
+    received"""
+    sender, receiver = socket.socketpair()
+    receiver.settimeout(2)
+    rconn = RConnector.__new__(RConnector)
+    rconn.sock = receiver
+    rconn._arenas = threading.local()
+    rconn.vectorizeLists = False
+    rconn.atomicArray = False
+    rconn.spillThreshold = rconn.spillDir = None
+    # geterrmessage() is answered from the socket as well:
+    rconn.eval = lambda aString, **kw: rparser.rparse(receiver)
+    try:
+        evalError = struct.pack('<IIII', rtypes.RESP_ERR | 127 << 24, 0, 0, 0)
+        sender.sendall(evalError + evalError +
+                       rserializer.rSerializeResponse('assignment failed\n'))
+        with pytest.raises(REvalError) as excinfo:
+            rconn._assignAndEval('x', [1, 2], 'x')
+        assert str(excinfo.value) == 'assignment failed'
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_micro_batcher(conn):
+    with MicroBatcher(conn, window=0.05) as batcher:
+        futures = [batcher.submit('sum(1:%d)' % i) for i in range(1, 5)]
+        failing = batcher.submit('stop("mb failed")')
+        broken = batcher.submit('1 +')
+        assert [f.result() for f in futures] == [1, 3, 6, 10]
+        with pytest.raises(REvalError) as excinfo:
+            failing.result()
+        assert 'mb failed' in str(excinfo.value)
+        pytest.raises(REvalError, broken.result)
+        assert batcher.eval('x <- "mb"; paste(x, "\\"")') == 'mb "'
+    assert batcher.stats().requests == 7
+    assert batcher.stats().batches < 7
+
+
+def test_serialized_size():
+    o = ['abc', numpy.arange(10.)]
+    assert rserializer.RSerializer.serializedSize(o) == \
+        len(rserializer.rSerializeResponse(o)) - 20
+
+
+def test_connection_stats(conn):
+    messages = conn.stats['bufferArena'].messages
+    conn.r('1')
+    assert conn.stats['bufferArena'].messages == messages + 1
+
+
+def test_ser_eval(conn):
+    res = conn.serEval('factor(c("a", "b", "a"))')
+    assert compareArrays(res, numpy.array([1, 2, 1]))
+    assert res.attr['levels'].tolist() == ['a', 'b']
+    assert res.attr['class'].tolist() == ['factor']
+
+    res = conn.serEval('data.frame(x=1:2, y=c("a", "b"))')
+    assert res.rType == 'list'
+    assert res.value.keys == ['x', 'y']
+
+    conn.serAssign('ser_var', TaggedList([('a', numpy.arange(3.))]))
+    assert conn.r('ser_var$a[3]') == 2.
+    conn.serAssign('ser_f', conn.serEval('function(x) x + 1'))
+    assert conn.r('ser_f(1)') == 2.
+    pytest.raises(REvalError, conn.serEval, 'stop("failed")')
+
+
 def test_eval_void(conn):
     """
     Check that conn.voidEval() does not return any result in contrast to
@@ -500,14 +1188,202 @@ def test_sapply_with_func_proxy_argument(conn):
     assert res == 5
 
 
+def test_symbol_cache(conn):
+    evals = []
+    origEval = conn.eval
+
+    def countingEval(aString, *args, **kw):
+        evals.append(aString)
+        return origEval(aString, *args, **kw)
+
+    conn.eval = countingEval
+    conn.cacheSymbols = True
+    try:
+        conn.r.sc_var = 3
+        assert conn.r.sc_var == 3
+        assert conn.r.sc_var == 3
+        # only the first access checks whether 'sc_var' is a function:
+        assert evals.count('is.function(sc_var)') == 1
+
+        # setRexp() and voidEval() update the cache:
+        conn.voidEval('sc_var <- function(x) x + 1')
+        assert conn.r.sc_var(1) == 2
+        conn.r.sc_var = 5
+        assert conn.ref.sc_var.value() == 5
+
+        # preloading looks up all symbols of an environment at once:
+        assert conn.preloadSymbols('package:stats') > 100
+        del evals[:]
+        assert isinstance(conn.r.median, RFuncProxy)
+        assert isinstance(conn.ref.median, RFuncProxy)
+        assert evals == []
+
+        # batches run arbitrary code and forget all cached symbols:
+        conn.r.sc_var = 3
+        conn.voidEval('sc_redefine <- function() '
+                      'assign("sc_var", function() 1, envir=globalenv())')
+        conn.r.sc_redefine.batch([()])
+        assert conn.r.sc_var() == 1
+
+        conn.clearSymbolCache()
+        pytest.raises(NameError, getattr, conn.r, 'sc_undefined')
+    finally:
+        del conn.eval
+        conn.cacheSymbols = False
+
+
+def test_capture_conditions(conn):
+    conn.captureErrors = True
+    try:
+        with pytest.raises(REvalError) as excinfo:
+            conn.eval('ce_f <- function(x) stop("bad x"); ce_f(1)')
+        assert str(excinfo.value) == 'bad x'
+        assert excinfo.value.call == 'ce_f(1)'
+        assert 'simpleError' in excinfo.value.conditionClass
+        # assignments still go to the global environment:
+        conn.voidEval('ce_a <- 5')
+        assert conn.eval('ce_a') == 5
+        assert conn.eval('NULL') is None
+
+        conn.captureWarnings = True
+        with pytest.warns(RWarning, match='ce warned'):
+            assert conn.eval('warning("ce warned"); ce_b <- 1:3; 7') == 7
+        assert list(conn.eval('ce_b')) == [1, 2, 3]
+        with pytest.raises(REvalError, match='after warning'):
+            with pytest.warns(RWarning):
+                conn.eval('warning("w"); stop("after warning")')
+    finally:
+        conn.captureErrors = conn.captureWarnings = False
+
+
+def test_capture_conditions_unwrapping():
+    rconn = RConnector.__new__(RConnector)
+    rconn.captureWarnings = False
+    assert rconn._captureConditions('1', False) == \
+        'tryCatch({1\n}, error=function(e) list("pyRserve.condition", ' \
+        'class(e), conditionMessage(e), paste(deparse(conditionCall(e)), ' \
+        'collapse="\\n")))'
+    assert rconn._raiseConditions([1, 2]) == [1, 2]
+    with pytest.raises(REvalError) as excinfo:
+        rconn._raiseConditions([
+            'pyRserve.condition', numpy.array(['simpleError', 'error']),
+            'msg', 'f()'])
+    assert excinfo.value.conditionClass == ['simpleError', 'error']
+    with pytest.warns(RWarning, match='w1'):
+        assert rconn._raiseConditions(
+            [numpy.array(['pyRserve.warnings']), 3, 'w1']) == 3
+
+
+ID_STRING = b'Rsrv0103QAP1\r\n\r\n--------------\r\n'
+
+
+def test_server_info():
+    info = ServerInfo.fromIdString(ID_STRING)
+    assert info == (103, 'QAP1', ())
+    assert info.authMethods == () and not info.tls
+    info = ServerInfo.fromIdString(
+        b'Rsrv0103QAP1ARptARucTLS --------')
+    assert info.authMethods == ('pt', 'uc') and info.tls
+    pytest.raises(ValueError, ServerInfo.fromIdString,
+                  b'HTTP/1.1 400 Bad Request\r\n')
+
+
+def test_connect_handshake():
+    """Connecting reads the ID string exactly, without waiting any longer"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    accepted = []
+
+    def serve(count, idString):
+        for _ in range(count):
+            sock, _ = server.accept()
+            # the ID string may arrive in pieces:
+            sock.sendall(idString[:10])
+            sock.sendall(idString[10:])
+            accepted.append(sock)
+
+    port = server.getsockname()[1]
+    try:
+        thread = threading.Thread(target=serve, args=(4, ID_STRING))
+        thread.start()
+        start = time.time()
+        conn = connect('127.0.0.1', port)
+        assert time.time() - start < 0.2
+        assert conn.serverInfo.version == 103
+        conns = connectMany(3, '127.0.0.1', port)
+        assert len(conns) == 3
+        assert all(c.serverInfo.protocol == 'QAP1' for c in conns)
+        thread.join()
+        for c in [conn] + conns:
+            c.close()
+
+        thread = threading.Thread(target=serve,
+                                  args=(1, b'SSH-2.0-OpenSSH' + b' ' * 17))
+        thread.start()
+        pytest.raises(RConnectionRefused, connect, '127.0.0.1',
+                      port)
+        thread.join()
+    finally:
+        for sock in accepted:
+            sock.close()
+        server.close()
+
+
+def test_timeout():
+    """A connection which timed out is closed, not drained"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(2)
+    accepted = []
+
+    def serve(responses):
+        for response in responses:
+            sock, _ = server.accept()
+            sock.sendall(ID_STRING + response)
+            accepted.append(sock)
+
+    port = server.getsockname()[1]
+    try:
+        # the second response stalls after 10 bytes:
+        thread = threading.Thread(target=serve, args=([b'', b'\x01' * 10], ))
+        thread.start()
+        conn = connect('127.0.0.1', port, timeout=5)
+        assert conn.timeout == 5
+        with pytest.raises(RTimeoutError) as excinfo:
+            conn.eval('Sys.sleep(10)', timeout=0.1)
+        assert excinfo.value.bytesReceived == 0
+        assert conn.isClosed
+
+        conn = connect('127.0.0.1', port)
+        conn.timeout = 0.1
+        with pytest.raises(RTimeoutError) as excinfo:
+            conn.eval('1')
+        assert excinfo.value.bytesReceived == 10
+        assert conn.isClosed
+        thread.join()
+
+        # a connection out of sync with Rserve is closed as well:
+        thread = threading.Thread(target=serve, args=(
+            [struct.pack('<IIII', 0x10003, 100, 0, 0)], ))
+        thread.start()
+        conn = connect('127.0.0.1', port)
+        pytest.raises(RProtocolError, conn.eval, '1')
+        assert conn.isClosed
+        thread.join()
+    finally:
+        for sock in accepted:
+            sock.close()
+        server.close()
+
+
 # ### Some more tests
 
 def test_rAssign_method(conn):
     """test "rAssign" class method of RSerializer"""
-    hexd = b'\x20\x00\x00\x00\x20\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00' \
-           b'\x00\x44\x04\x00\x00\x00\x00\x00\x00\x76\x00\x00\x00\x4a\x0c' \
-           b'\x00\x00\x00\x00\x00\x00\x60\x04\x00\x00\x00\x00\x00\x00\x01' \
-           b'\x00\x00\x00'
+    hexd = b'\x20\x00\x00\x00\x14\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00' \
+           b'\x00\x04\x04\x00\x00\x76\x00\x00\x00\x0a\x08\x00\x00\x20\x04' \
+           b'\x00\x00\x01\x00\x00\x00'
     assert rserializer.rAssign('v', 1) == hexd
 
     # now assign a value via the connector:
@@ -517,20 +1393,51 @@ def test_rAssign_method(conn):
 
 def test_rEval_method():
     """test "rEval" method"""
-    hexd = b'\x03\x00\x00\x00\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'\
-           b'\x44\x04\x00\x00\x00\x00\x00\x00\x61\x3d\x31\x00'
+    hexd = b'\x03\x00\x00\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'\
+           b'\x04\x04\x00\x00\x61\x3d\x31\x00'
     assert rserializer.rEval('a=1') == hexd
 
 
 def test_serialize_DT_INT():
-    hexd = b'\x03\x00\x00\x00\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'\
-           b'\x41\x04\x00\x00\x00\x00\x00\x007\x00\x00\x00'
+    hexd = b'\x03\x00\x00\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'\
+           b'\x01\x04\x00\x007\x00\x00\x00'
     s = rserializer.RSerializer(rtypes.CMD_eval)
     s.serialize(55, dtTypeCode=rtypes.DT_INT)
     res = s.finalize()
     assert hexd == res
 
 
+def test_rSetBufferSize_method():
+    """test "rSetBufferSize" method"""
+    hexd = b'\x81\x00\x00\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'\
+           b'\x01\x04\x00\x00\x00\x00\x10\x00'
+    assert rserializer.rSetBufferSize(2**20) == hexd
+
+
+def test_parse_object_too_big_response():
+    """
+    An ERR_object_too_big response carries the size of the object, it must
+    be consumed entirely and be provided with the exception.
+    """
+    cmd = rtypes.RESP_ERR | (rtypes.ERR_object_too_big << 24)
+    response = struct.pack('<IIII', cmd, 4, 0, 0) + struct.pack('<I', 3000000)
+    with pytest.raises(RResponseError) as excinfo:
+        rparser.rparse(response)
+    assert excinfo.value.errCode == rtypes.ERR_object_too_big
+    assert excinfo.value.param == 3000000
+
+
+def test_set_buffer_size(conn):
+    """The send buffer size can be set and is honored by Rserve"""
+    assert conn.setBufferSize(8 * 2**20) == conn.bufferSize == 8 * 2**20
+    # Rserve does not accept buffers smaller than 32kB:
+    assert conn.setBufferSize(1024) == rtypes.MIN_SEND_BUFFER_SIZE
+    # results larger than the buffer are transferred after enlarging it:
+    res = conn.r('c(1:100000)')
+    assert res.size == 100000
+    assert conn.bufferSize > rtypes.MIN_SEND_BUFFER_SIZE
+
+
 def test_serialize_unsupported_object_raises_exception(conn):
     # datetime objects are not yet supported, so an exception can be expected
     pytest.raises(NotImplementedError, conn.r.ident, datetime.date.today())
@@ -572,6 +1479,44 @@ def test_rvarproxy(conn):
     assert conn.ref.a.value() == [1, 2, 3]
 
 
+def test_rvarproxy_slicing(conn):
+    """Slicing a var proxy only transfers the selected items"""
+    arr = numpy.arange(100, dtype=float)
+    conn.r.proxyvec = arr
+    x = conn.ref.proxyvec
+    assert len(x) == 100
+    assert x.shape == (100, )
+    assert x.dtype == numpy.double
+    assert x[5] == 5.0
+    assert x[-1] == 99.0
+    assert compareArrays(x[10:20], arr[10:20])
+    assert compareArrays(x[::7], arr[::7])
+    assert compareArrays(x[90:80:-3], arr[90:80:-3])
+    assert x[5:5].size == 0
+    mask = arr % 3 == 0
+    assert compareArrays(x[mask], arr[mask])
+    assert compareArrays(x[[1, 5, -1]], arr[[1, 5, -1]])
+    pytest.raises(IndexError, x.__getitem__, 100)
+    # the temporary index variable has been removed again:
+    assert not conn.r('exists("index_0_")')
+
+    blocks = list(x.iterChunks(30))
+    assert [len(b) for b in blocks] == [30, 30, 30, 10]
+    assert compareArrays(numpy.concatenate(blocks), arr)
+
+
+def test_rvarproxy_matrix_slicing(conn):
+    mat = numpy.arange(24, dtype=numpy.int32).reshape((4, 6))
+    conn.r.proxymat = mat
+    m = conn.ref.proxymat
+    assert m.shape == (4, 6)
+    assert len(m) == 4
+    assert m[2, 3] == mat[2, 3]
+    assert compareArrays(m[1], mat[1])
+    assert compareArrays(m[:, 2], mat[:, 2])
+    assert compareArrays(m[1:3, ::2], mat[1:3, ::2])
+
+
 def test_oob_send(conn):
     """Tests OOB without registering a callback"""
     assert conn.r('self.oobSend("foo")') is True
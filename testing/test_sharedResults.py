@@ -0,0 +1,75 @@
+"""
+unittests for passing results to other processes via shared memory
+"""
+import pickle
+import concurrent.futures
+###
+import numpy
+import pytest
+###
+from pyRserve import sharedResults
+from pyRserve.taggedContainers import TaggedList, TaggedArray, AttrArray
+
+pytestmark = pytest.mark.skipif(sharedResults.shared_memory is None,
+                                reason='shared memory requires Python 3.8')
+
+
+def _sumOfA(handle):
+    result = handle.attach()
+    total = float(result['a'].sum())
+    # results are shared, not copied:
+    result['a'][0] = -1.
+    del result
+    handle.close()
+    return total
+
+
+def test_to_shared():
+    result = TaggedList([
+        ('a', numpy.arange(10.)),
+        ('b', TaggedArray.new(numpy.array([1, 2], dtype=numpy.int32),
+                              ['x', 'y'])),
+        ('c', 'text'),
+        ('d', [AttrArray.new(numpy.arange(6.).reshape(2, 3, order='F'),
+                             {'class': 'matrix'})]),
+    ])
+    handle = sharedResults.toShared(result)
+    try:
+        # the handle itself is small, the arrays are not pickled with it:
+        assert len(pickle.dumps(handle)) < 2000
+        res = pickle.loads(pickle.dumps(handle)).attach()
+        assert res['b']['y'] == 2
+        assert res['c'] == 'text'
+        assert res['d'][0].attr == {'class': 'matrix'}
+        assert res['d'][0].flags.f_contiguous
+        assert res['d'][0][1, 2] == 5.
+
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            assert executor.submit(_sumOfA, handle).result() == 45.
+        assert handle.attach()['a'][0] == -1.
+        del res
+    finally:
+        handle.unlink()
+
+
+def test_pickle_attr_arrays():
+    arr = TaggedArray.new(numpy.arange(3.), ['a', 'b', 'c'])
+    for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+        res = pickle.loads(pickle.dumps(arr, protocol=protocol))
+        assert isinstance(res, TaggedArray)
+        assert res['c'] == 2.
+    arr = AttrArray.new(numpy.arange(3), {'levels': ['x']})
+    assert pickle.loads(pickle.dumps(arr)).attr == {'levels': ['x']}
+    tl = TaggedList([('a', 1), 2])
+    assert pickle.loads(pickle.dumps(tl)) == tl
+
+
+def test_pickle_without_copy():
+    if pickle.HIGHEST_PROTOCOL < 5:
+        pytest.skip('out-of-band pickling needs protocol 5')
+    arr = TaggedArray.new(numpy.arange(3.), ['a', 'b', 'c'])
+    buffers = []
+    data = pickle.dumps(arr, protocol=5, buffer_callback=buffers.append)
+    res = pickle.loads(data, buffers=buffers)
+    assert numpy.shares_memory(res, arr)
+    assert res['b'] == 1.
@@ -1,7 +1,10 @@
 """
 unittests for classes from taggedContainers
 """
-from pyRserve.taggedContainers import TaggedList
+import numpy
+import pytest
+
+from pyRserve.taggedContainers import TaggedList, TaggedArray
 
 
 def test_TaggedList_init_emtpy():
@@ -62,3 +65,88 @@ def test_TaggedList_insert_with_key():
     assert len(t) == 3
     assert t.values == [1, 11, 22]
     assert t[0] == t['x'] == 1
+
+
+def test_TaggedList_new():
+    t = TaggedList.new([11, 22, 33], ['v1', '', 'v1'])
+    assert t.astuples() == [('v1', 11), (None, 22), ('v1', 33)]
+    # only the first item of duplicate keys is found:
+    assert t['v1'] == 11
+    with pytest.raises(ValueError):
+        TaggedList.new([11], ['v1', 'v2'])
+
+
+def test_TaggedList_set_and_delete_by_key():
+    t = TaggedList([('v1', 11), ('v2', 22), ('v3', 33)])
+    t['v2'] = 20
+    assert t.values == [11, 20, 33]
+    del t['v1']
+    assert t.astuples() == [('v2', 20), ('v3', 33)]
+    assert t['v3'] == 33
+    del t[0]
+    assert t.astuples() == [('v3', 33)]
+    with pytest.raises(ValueError):
+        t['v1']
+
+
+def test_TaggedList_lookup_after_mutation():
+    t = TaggedList([('v1', 11), ('v2', 22)])
+    assert t['v2'] == 22
+    t.insert(0, v2=2)
+    assert t['v2'] == 2
+    assert t.pop(0) == 2
+    assert t.keys == ['v1', 'v2']
+    assert t['v2'] == 22
+    t.append(v3=33)
+    assert t['v3'] == 33
+    t.reverse()
+    assert t[0] == t['v3'] == 33
+
+
+def test_TaggedArray_select_by_names():
+    arr = TaggedArray.new(numpy.arange(5), ['a', 'b', 'c', 'b', 'e'])
+    assert arr['c'] == 2
+    # only the first item of duplicate keys is found:
+    assert arr['b'] == 1
+    res = arr[['e', 'a']]
+    assert isinstance(res, TaggedArray)
+    assert res.tolist() == [4, 0]
+    assert res.keys().tolist() == ['e', 'a']
+    assert res['a'] == 0
+    with pytest.raises(KeyError):
+        arr['x']
+    with pytest.raises(KeyError):
+        arr[['a', 'x']]
+
+
+def test_TaggedArray_selection_keeps_names():
+    arr = TaggedArray.new(numpy.arange(5), ['a', 'b', 'c', 'd', 'e'])
+    assert arr[1:3].keys().tolist() == ['b', 'c']
+    assert arr[arr > 2].keys().tolist() == ['d', 'e']
+    assert arr[[4, 0]].keys().tolist() == ['e', 'a']
+    assert arr[3] == 3
+    # element-wise operations keep the names:
+    assert (arr * 2)['e'] == 8
+    assert numpy.sqrt(arr)['e'] == 2.
+    # names are not copied by keys() and cannot be modified through it:
+    assert numpy.shares_memory(arr.keys(), arr.attr)
+    with pytest.raises(ValueError):
+        arr.keys()[0] = 'x'
+
+
+def test_TaggedArray_reordering_drops_names():
+    arr = TaggedArray.new(numpy.array([3, 1, 2]), ['c', 'a', 'b'])
+    for res in [numpy.sort(arr), numpy.roll(arr, 1), arr.cumsum(),
+                numpy.add.accumulate(arr), arr.copy()]:
+        with pytest.raises(KeyError):
+            res['c']
+    assert arr.sum() == 6
+    # in-place sorting reorders the names along with the items:
+    arr.sort()
+    assert arr.tolist() == [1, 2, 3]
+    assert arr.keys().tolist() == ['a', 'b', 'c']
+    assert arr['c'] == 3
+    mat = TaggedArray.new(numpy.array([[2, 1], [4, 3]]), ['x', 'y'])
+    mat.sort()
+    with pytest.raises(KeyError):
+        mat['x']